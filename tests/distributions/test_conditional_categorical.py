@@ -902,3 +902,102 @@ def test_fit_raises(X, w, probs):
 
 	_test_raises(ConditionalCategorical(), "fit", X, w=w, min_value=MIN_VALUE, 
 		max_value=MAX_VALUE)
+
+
+def _smoothed_fit(d, X, w, pseudocount):
+	d.summarize(X, sample_weight=w)
+	for j in range(d.d):
+		d._xw_sum[j].add_(pseudocount)
+		d._w_sum[j].add_(pseudocount * d.n_categories[j][-1])
+
+	d.from_summaries()
+	return d
+
+
+def test_fit_sparse(X, w, probs):
+	X_test = torch.tensor([[[0, 0, 0], [0, 0, 1]], [[1, 2, 1], [1, 1, 0]], 
+		[[0, 2, 0], [1, 1, 1]]])
+
+	for pseudocount in 0, 1.5:
+		d1 = _smoothed_fit(ConditionalCategorical(), X, w, pseudocount)
+
+		d2 = ConditionalCategorical(pseudocount=pseudocount, sparse=True)
+		d2.fit(X, sample_weight=w)
+
+		assert [len(keys) for keys in d2.keys] == [3, 4, 2]
+		assert_array_almost_equal(d1.log_probability(X_test), 
+			d2.log_probability(X_test))
+
+
+def test_fit_pseudocount_dense(X, w):
+	d1 = ConditionalCategorical().fit(X, sample_weight=w)
+	d2 = ConditionalCategorical(pseudocount=1.5).fit(X, sample_weight=w)
+
+	for p1, p2 in zip(d1.probs, d2.probs):
+		assert_array_almost_equal(p1, p2)
+
+
+def test_fit_sparse_inertia(X, w, probs):
+	X_test = torch.tensor([[[0, 0, 0], [0, 0, 1]], [[1, 2, 1], [1, 1, 0]], 
+		[[0, 2, 0], [1, 1, 1]]])
+
+	d1 = _smoothed_fit(ConditionalCategorical(probs, inertia=0.3), X, w, 1)
+	d2 = ConditionalCategorical(probs, pseudocount=1, inertia=0.3, sparse=True)
+	d2.fit(X, sample_weight=w)
+
+	assert_array_almost_equal(d1.log_probability(X_test), 
+		d2.log_probability(X_test))
+
+
+def test_sparse_state_dict(X, w, probs):
+	X_test = torch.tensor([[[0, 0, 0], [0, 0, 1]], [[1, 2, 1], [1, 1, 0]], 
+		[[0, 2, 0], [1, 1, 1]]])
+
+	d1 = ConditionalCategorical(pseudocount=1, sparse=True)
+	d1.fit(X, sample_weight=w)
+
+	state = d1.state_dict()
+	for name in 'keys', 'probs', 'parent_keys', 'parent_probs':
+		assert "{}._buffer_0".format(name) in state
+
+	d2 = ConditionalCategorical(sparse=True).fit(X)
+	assert (d2.probs[0] != d1.probs[0]).any()
+
+	d2.load_state_dict(state)
+
+	for name in 'keys', 'probs', 'parent_keys', 'parent_probs':
+		for b1, b2 in zip(getattr(d1, name), getattr(d2, name)):
+			assert_array_almost_equal(b1, b2)
+
+	assert_array_almost_equal(d1.log_probability(X_test), 
+		d2.log_probability(X_test))
+
+	d2.to(torch.float64)
+	assert d2.probs[0].dtype == torch.float64
+	assert d2.parent_probs[0].dtype == torch.float64
+	assert d2._log_probs[0].dtype == torch.float64
+	assert d2.keys[0].dtype == torch.int64
+
+
+def test_out_of_range(X, w, probs):
+	d = ConditionalCategorical([[[.2, .3, .5], [.1, .1, .8]]])
+	assert_raises(ValueError, d.log_probability, [[[0], [3]]])
+	assert_raises(ValueError, d.log_probability, [[[2], [0]]])
+	assert_raises(ValueError, d.summarize, [[[0], [3]]])
+	assert_raises(ValueError, d.summarize, [[[2], [0]]])
+
+	X_bad = [[[[2, 0, 0], [0, 0, 0]]], [[[0, 0, 0], [2, 0, 0]]], 
+		[[[0, 3, 0], [0, 0, 0]]], [[[0, 0, 0], [0, 0, 2]]], 
+		[[[0, 0, -1], [0, 0, 0]]]]
+
+	for sparse in False, True:
+		d = ConditionalCategorical(probs, sparse=sparse)
+		if sparse:
+			d.fit(X, sample_weight=w)
+
+		for x in X_bad:
+			assert_raises(ValueError, d.log_probability, x)
+			assert_raises(ValueError, d.summarize, x)
+
+		for w_sum in d._w_sum:
+			assert w_sum.sum() == 0
@@ -857,3 +857,111 @@ def test_fit_raises(X, w, probs):
 
 	_test_raises(JointCategorical(), "fit", X, w=w, min_value=MIN_VALUE, 
 		max_value=MAX_VALUE)
+
+
+def _smoothed_fit(d, X, w, pseudocount):
+	d.summarize(X, sample_weight=w)
+	d._xw_sum += pseudocount
+	d._w_sum += pseudocount * d._xw_sum.numel()
+	d.from_summaries()
+	return d
+
+
+def test_fit_sparse(X, w, probs):
+	X_test = torch.tensor([[0, 0, 0], [1, 0, 1], [1, 2, 0], [0, 1, 1]])
+
+	for pseudocount in 0, 1.5:
+		d1 = _smoothed_fit(JointCategorical(), X, w, pseudocount)
+		d2 = JointCategorical(pseudocount=pseudocount, sparse=True).fit(X, 
+			sample_weight=w)
+
+		assert d2.probs.ndim == 1
+		assert len(d2.keys) == 4
+		assert_array_almost_equal(d1.log_probability(X_test), 
+			d2.log_probability(X_test))
+
+		for dim in range(3):
+			assert_array_almost_equal(d1.marginal(dim).probs, 
+				d2.marginal(dim).probs)
+
+
+def test_fit_pseudocount_dense(X, w):
+	d1 = JointCategorical().fit(X, sample_weight=w)
+	d2 = JointCategorical(pseudocount=1.5).fit(X, sample_weight=w)
+	assert_array_almost_equal(d1.probs, d2.probs)
+
+
+def test_fit_sparse_inertia(X, w, probs):
+	X_test = torch.tensor([[0, 0, 0], [1, 0, 1], [1, 2, 0], [0, 1, 1]])
+
+	d1 = _smoothed_fit(JointCategorical(probs, inertia=0.3), X, w, 1)
+	d2 = JointCategorical(probs, pseudocount=1, inertia=0.3, sparse=True)
+	d2.fit(X, sample_weight=w)
+
+	assert_array_almost_equal(d1.log_probability(X_test), 
+		d2.log_probability(X_test))
+
+
+def test_sparse_state_dict(X, w, probs):
+	X_test = torch.tensor([[0, 0, 0], [1, 0, 1], [1, 2, 0], [0, 1, 1]])
+
+	d1 = JointCategorical(pseudocount=1, sparse=True).fit(X, sample_weight=w)
+
+	state = d1.state_dict()
+	for name in 'keys', 'probs', 'default_prob':
+		assert name in state
+
+	d2 = JointCategorical(sparse=True).fit(X)
+	assert (d2.probs != d1.probs).any()
+
+	d2.load_state_dict(state)
+
+	assert_array_almost_equal(d1.keys, d2.keys)
+	assert_array_almost_equal(d1.probs, d2.probs)
+	assert_array_almost_equal(d1.default_prob, d2.default_prob)
+	assert_array_almost_equal(d1.log_probability(X_test), 
+		d2.log_probability(X_test))
+
+	d2.to(torch.float64)
+	assert d2.probs.dtype == torch.float64
+	assert d2._log_probs.dtype == torch.float64
+	assert d2.keys.dtype == torch.int64
+
+
+def test_vectorized_loop(probs):
+	torch.manual_seed(0)
+	X = torch.stack([torch.randint(n, (50,)) for n in (2, 3, 2)], dim=1)
+	w = torch.rand(50, 1)
+
+	d = JointCategorical(probs)
+	logps = torch.zeros(len(X))
+	for i in range(len(X)):
+		logps[i] = d._log_probs[tuple(X[i])]
+
+	assert_array_almost_equal(d.log_probability(X), logps)
+
+	xw_sum = torch.zeros(2, 3, 2)
+	for i in range(len(X)):
+		xw_sum[tuple(X[i])] += w[i, 0]
+
+	for sparse in False, True:
+		d = JointCategorical(probs, sparse=sparse)
+		d.summarize(X, sample_weight=w)
+
+		if sparse:
+			assert_array_almost_equal(d._xw_sum, xw_sum.reshape(-1)[d._xw_keys])
+			assert_array_almost_equal(d._xw_keys, 
+				torch.nonzero(xw_sum.reshape(-1)).reshape(-1))
+		else:
+			assert_array_almost_equal(d._xw_sum, xw_sum)
+
+
+def test_out_of_range(probs):
+	for sparse in False, True:
+		d = JointCategorical(probs, sparse=sparse)
+
+		for x in [[0, 3, 0]], [[2, 0, 0]], [[0, 0, 2]], [[1, 2, 3]]:
+			assert_raises(ValueError, d.log_probability, x)
+			assert_raises(ValueError, d.summarize, x)
+
+		assert d._w_sum.sum() == 0
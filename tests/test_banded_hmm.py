@@ -0,0 +1,187 @@
+# test_banded_hmm.py
+# Contact: Jacob Schreiber <jmschreiber91@gmail.com>
+
+import numpy
+import torch
+import pytest
+
+from torchegranate.hmm import HiddenMarkovModel
+from torchegranate._base import Node
+from torchegranate._banded_hmm import _BandedHMM
+from torchegranate.distributions import Exponential
+
+from nose.tools import assert_raises
+from numpy.testing import assert_array_almost_equal
+
+
+@pytest.fixture
+def X():
+	return [[[1, 2, 0],
+	      [0, 0, 1],
+	      [1, 1, 2],
+	      [2, 2, 2],
+	      [3, 1, 0]],
+	     [[5, 1, 4],
+	      [2, 1, 0],
+	      [1, 0, 2],
+	      [1, 1, 0],
+	      [0, 2, 1]]]
+
+
+@pytest.fixture
+def edges():
+	return [[0.3, 0.4, 0.0, 0.2],
+	        [0.0, 0.5, 0.3, 0.0],
+	        [0.0, 0.2, 0.1, 0.6],
+	        [0.0, 0.0, 0.0, 0.7]]
+
+
+def _models(edges, **kwargs):
+	models = []
+	for kind in 'dense', 'banded':
+		d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2]),
+			Exponential([0.4, 1.2, 0.8]), Exponential([3.0, 0.7, 1.9])]
+
+		model = HiddenMarkovModel(nodes=d, edges=edges, kind=kind,
+			starts=[0.4, 0.3, 0.2, 0.1], ends=[0.1, 0.2, 0.1, 0.3], **kwargs)
+		model.bake()
+		models.append(model)
+
+	return models
+
+
+def test_initialization(edges):
+	_, model = _models(edges)
+
+	assert isinstance(model._model, _BandedHMM)
+	assert model.n_edges == 9
+	assert_array_almost_equal(model._model.offsets, [-1, 0, 1, 3])
+	assert model._model.edges.shape == (4, 4)
+
+	assert_array_almost_equal(model._model.edges[0], numpy.log([0, 0.3,
+		0.4, 0.2]))
+	assert_array_almost_equal(model._model.edges[2], numpy.log([0.2, 0.1,
+		0.6, 0]))
+	assert_array_almost_equal(model._model.edges[3], numpy.log([0, 0.7,
+		0, 0]))
+
+
+def test_inference(X, edges):
+	dense, banded = _models(edges)
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2]),
+		torch.tensor(numpy.array(X[0])[:1])]
+
+	for X_ in X, X_ragged:
+		assert_array_almost_equal(dense.forward(X_), banded.forward(X_), 4)
+		assert_array_almost_equal(dense.backward(X_), banded.backward(X_), 4)
+		assert_array_almost_equal(dense.log_probability(X_),
+			banded.log_probability(X_), 4)
+
+		_, r1, starts1, ends1, logp1 = dense.forward_backward(X_)
+		_, r2, starts2, ends2, logp2 = banded.forward_backward(X_)
+
+		assert_array_almost_equal(r1, r2, 4)
+		assert_array_almost_equal(starts1, starts2, 4)
+		assert_array_almost_equal(ends1, ends2, 4)
+		assert_array_almost_equal(logp1, logp2, 4)
+
+		path1, logp1 = dense.viterbi(X_)
+		path2, logp2 = banded.viterbi(X_)
+
+		for p1, p2 in zip(path1, path2):
+			assert_array_almost_equal(p1, p2)
+
+		assert_array_almost_equal(logp1, logp2, 4)
+
+
+def test_forward_backward_transitions(X, edges):
+	dense, banded = _models(edges)
+	t1 = dense.forward_backward(X)[0]
+	t2 = banded.forward_backward(X)[0]
+
+	offsets = banded._model.offsets
+	for c, o in enumerate(offsets):
+		for i in range(4):
+			if 0 <= i + o < 4:
+				assert_array_almost_equal(t1[:, i, i+o], t2[:, i, c], 4)
+			else:
+				assert_array_almost_equal(t2[:, i, c], [0, 0])
+
+	for kwargs in {'chunk_size': 2}, {'checkpoint': True}, \
+		{'algorithm': 'scaled'}:
+		_, model = _models(edges, **kwargs)
+
+		for z1, z2 in zip(banded.forward_backward(X),
+			model.forward_backward(X)):
+			assert_array_almost_equal(z1, z2, 4)
+
+
+def test_fit(X, edges):
+	dense, banded = _models(edges, max_iter=5)
+	dense.fit(X)
+	banded.fit(X)
+
+	assert_array_almost_equal(dense.starts, banded.starts, 4)
+	assert_array_almost_equal(dense.ends, banded.ends, 4)
+
+	offsets = banded._model.offsets
+	for c, o in enumerate(offsets):
+		for i in range(4):
+			if 0 <= i + o < 4:
+				assert_array_almost_equal(dense.edges[i, i+o],
+					banded.edges[i, c], 4)
+
+
+def test_fit_labeled(X, edges):
+	dense, banded = _models(edges, max_iter=5)
+	y = [[0, 1, 1, 2, 3], [0, 0, 3, 3, 3]]
+
+	dense.summarize(X, y=y)
+	banded.summarize(X, y=y)
+
+	offsets = banded._model.offsets
+	for c, o in enumerate(offsets):
+		for i in range(4):
+			if 0 <= i + o < 4:
+				assert banded._model._xw_sum[i, c] == \
+					dense._model._xw_sum[i, i+o]
+
+	assert_array_almost_equal(banded._model._xw_sum.sum(), 8)
+	assert_raises(ValueError, banded.summarize, X, y=[[0, 2, 2, 2, 2],
+		[0, 0, 0, 0, 0]])
+	assert_raises(ValueError, banded.summarize, X, y=[[0, 0, 0, 0, 0],
+		[3, 2, 2, 2, 2]])
+
+
+def test_add_edge(X, edges):
+	_, banded = _models(edges)
+
+	d = [Node(Exponential([2.1, 0.3, 0.1]), "a"), 
+		Node(Exponential([1.5, 3.1, 2.2]), "b"),
+		Node(Exponential([0.4, 1.2, 0.8]), "c"), 
+		Node(Exponential([3.0, 0.7, 1.9]), "d")]
+
+	model = HiddenMarkovModel(kind='banded')
+	model.add_nodes(d)
+
+	for i, p in enumerate([0.4, 0.3, 0.2, 0.1]):
+		model.add_edge(model.start, d[i], p)
+
+	for i, p in enumerate([0.1, 0.2, 0.1, 0.3]):
+		model.add_edge(d[i], model.end, p)
+
+	for i in range(4):
+		for j in range(4):
+			if edges[i][j] > 0:
+				model.add_edge(d[i], d[j], edges[i][j])
+
+	model.bake()
+
+	assert isinstance(model._model, _BandedHMM)
+	assert model._model.n_edges == 9
+	assert_array_almost_equal(model._model.offsets, banded._model.offsets)
+	assert_array_almost_equal(model._model.edges, banded._model.edges)
+	assert_array_almost_equal(model._model.starts, banded._model.starts)
+	assert_array_almost_equal(model._model.ends, banded._model.ends)
+	assert_array_almost_equal(model.log_probability(X), 
+		banded.log_probability(X), 4)
@@ -1,6 +1,7 @@
 # test_bayes_classifier.py
 # Contact: Jacob Schreiber <jmschreiber91@gmail.com>
 
+import copy
 import numpy
 import torch
 import pytest
@@ -376,6 +377,28 @@ def test_forward_backward(model, X):
 	assert_array_almost_equal(logp, [-22.8266, -22.8068], 3)
 
 
+def test_viterbi(model, X):
+	path, logp = model.viterbi(X)
+	assert path.dtype == torch.int64
+	assert_array_almost_equal(path, 
+		[[1, 1, 1, 1, 0],
+         [1, 0, 1, 0, 1]])
+	assert_array_almost_equal(logp, [-23.1131, -23.0715], 4)
+
+	emissions = model._emission_matrix(torch.tensor(X))
+	path2, logp2 = model.viterbi(emissions=emissions)
+	assert_array_almost_equal(path, path2)
+	assert_array_almost_equal(logp, logp2)
+
+
+def test_viterbi_raises(model, X):
+	f = getattr(model, "viterbi")
+
+	assert_raises(ValueError, f, [X])
+	assert_raises(ValueError, f, X[0])
+	assert_raises(ValueError, f)
+
+
 def test_predict(model, X):
 	y_hat = model.predict(X)
 	assert_array_almost_equal(y_hat, 
@@ -846,6 +869,62 @@ def test_fit_weighted(X, w):
 	assert_array_almost_equal(d2._xw_sum, [0., 0., 0.])
 
 
+def test_fit_batches(X, w):
+	X = torch.tensor(numpy.array(X) + 1, dtype=torch.float32)
+	w = torch.tensor(w, dtype=torch.float32)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='dense', max_iter=3)
+	model.bake()
+	model.fit(X, sample_weight=w)
+
+	dataset = torch.utils.data.TensorDataset(X, w)
+	loader = torch.utils.data.DataLoader(dataset, batch_size=1)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model2 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='dense', max_iter=3)
+	model2.bake()
+	model2.fit(loader)
+
+	assert_array_almost_equal(model2.starts, model.starts, 4)
+	assert_array_almost_equal(model2.ends, model.ends, 4)
+	assert_array_almost_equal(model2.edges, model.edges, 4)
+	assert_array_almost_equal(model2.nodes[0].distribution.scales, 
+		model.nodes[0].distribution.scales, 4)
+
+	assert_raises(ValueError, model2.fit, loader, [[0, 1]])
+
+
+def test_partial_fit(X, w):
+	X = torch.tensor(numpy.array(X) + 1)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='dense', max_iter=1)
+	model.bake()
+	model.fit(X, sample_weight=w)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model2 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='dense')
+	model2.bake()
+	model2.partial_fit(X, sample_weight=w)
+
+	assert model2._n_online_steps == 1
+	assert_array_almost_equal(model2.starts, model.starts, 4)
+	assert_array_almost_equal(model2.ends, model.ends, 4)
+	assert_array_almost_equal(model2.edges, model.edges, 4)
+	assert_array_almost_equal(model2.nodes[0].distribution.scales, 
+		model.nodes[0].distribution.scales, 4)
+
+	model2.partial_fit(X[:1])
+	assert model2._n_online_steps == 2
+	assert_array_almost_equal(torch.exp(model2.edges).sum(dim=1) + 
+		torch.exp(model2.ends), [1., 1.], 4)
+
+
 def test_fit_raises(model, X, w):
 	assert_raises(ValueError, model.fit, [X])
 	assert_raises(ValueError, model.fit, X[0])
@@ -1290,3 +1369,260 @@ def test_masked_fit(X, X_masked):
 	assert_array_almost_equal(d2.scales, [2.8777, 2.3498, 2.1939], 4)
 	assert_array_almost_equal(d2._w_sum, [0., 0., 0.])
 	assert_array_almost_equal(d2._xw_sum, [0., 0., 0.])
+
+
+def test_labeled_summarize(model, X):
+	y = [[0, 1, 1, 0, 1], [1, 1, 0, 0, 1]]
+	X = torch.tensor(numpy.array(X))
+	t, r, starts, ends, _ = model._model._labeled_summarize(X, y)
+
+	assert_array_almost_equal(t, [[[0, 2], [1, 1]], [[1, 1], [1, 1]]])
+	assert_array_almost_equal(starts, [[1, 0], [0, 1]])
+	assert_array_almost_equal(ends, [[0, 1], [0, 1]])
+	assert_array_almost_equal(torch.exp(r), torch.nn.functional.one_hot(
+		torch.tensor(y)))
+
+
+def test_labeled_summarize_raises(model, X):
+	X = torch.tensor(numpy.array(X))
+
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 2, 0, 1], [1, 1, 0, 0, 1]])
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 1, 0], [1, 1, 0, 0]])
+
+
+def test_ragged(model, X):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1])]
+
+	f = model.forward(X)
+	b = model.backward(X)
+	t, _, starts, ends, logp = model.forward_backward(X)
+	r = model.predict_proba(X)
+	y_hat = model.predict(X)
+	path, path_logp = model.viterbi(X)
+
+	assert f.shape == (3, 5, 2)
+	assert len(r) == 3 and len(y_hat) == 3 and len(path) == 3
+	assert_array_almost_equal(logp, model.log_probability(X))
+
+	for i, x in enumerate(X):
+		x = x.unsqueeze(0)
+		l = x.shape[1]
+
+		assert_array_almost_equal(f[i, :l], model.forward(x)[0])
+		assert_array_almost_equal(f[i, l:], numpy.full((5-l, 2), -numpy.inf))
+		assert_array_almost_equal(b[i, :l], model.backward(x)[0])
+
+		t_, _, starts_, ends_, logp_ = model.forward_backward(x)
+		assert_array_almost_equal(t[i], t_[0])
+		assert_array_almost_equal(starts[i], starts_[0])
+		assert_array_almost_equal(ends[i], ends_[0])
+		assert_array_almost_equal(logp[i], logp_[0])
+
+		assert_array_almost_equal(r[i], model.predict_proba(x)[0])
+		assert_array_almost_equal(y_hat[i], model.predict(x)[0])
+
+		path_, path_logp_ = model.viterbi(x)
+		assert_array_almost_equal(path[i], path_[0])
+		assert_array_almost_equal(path_logp[i], path_logp_[0])
+
+
+def test_ragged_summarize(model, X, w):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1])]
+	y = [torch.tensor([0, 1, 1]), torch.tensor([1, 1, 0, 0, 1]), 
+		torch.tensor([1])]
+	w = [1, 2.3, 0.7]
+
+	for labels in None, y:
+		model1 = copy.deepcopy(model)
+		model2 = copy.deepcopy(model)
+
+		logp = model1.summarize(X, y=labels, sample_weight=w)
+		for i, x in enumerate(X):
+			y_ = None if labels is None else labels[i].unsqueeze(0)
+			logp_ = model2.summarize(x.unsqueeze(0), y=y_, 
+				sample_weight=w[i:i+1])
+			assert_array_almost_equal(logp[i], logp_[0])
+
+		for b1, b2 in zip(model1.buffers(), model2.buffers()):
+			assert_array_almost_equal(b1, b2, 4)
+
+
+def test_bucket_plan(X):
+	X_ragged = [torch.ones(l, 3) for l in (4, 9, 2, 9, 5, 1)]
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+
+	model = HiddenMarkovModel(nodes=d, kind="dense")
+	plan = model.bucket_plan(X_ragged)
+	assert len(plan) == 1
+	assert_array_almost_equal(plan[0], [1, 3, 4, 0, 2, 5])
+
+	model = HiddenMarkovModel(nodes=d, kind="dense", memory_budget=40)
+	plan = model.bucket_plan(X_ragged)
+	assert [p.tolist() for p in plan] == [[1, 3], [4, 0, 2, 5]]
+
+	model = HiddenMarkovModel(nodes=d, kind="dense", memory_budget=10)
+	plan = model.bucket_plan(X)
+	assert [p.tolist() for p in plan] == [[0], [1]]
+
+	assert_raises(ValueError, HiddenMarkovModel, d, memory_budget=0)
+
+
+def test_summarize_memory_budget(model, X):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1]), torch.tensor(X[0])]
+	w = [1, 2.3, 0.7, 1.5]
+
+	model1 = copy.deepcopy(model)
+	model2 = copy.deepcopy(model)
+	model2.memory_budget = 12
+	assert len(model2.bucket_plan(X)) == 3
+
+	logp1 = model1.summarize(X, sample_weight=w)
+	logp2 = model2.summarize(X, sample_weight=w)
+	assert_array_almost_equal(logp1, logp2)
+
+	for b1, b2 in zip(model1.buffers(), model2.buffers()):
+		assert_array_almost_equal(b1, b2, 4)
+
+
+def test_forward_backward_checkpoint(model, X):
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2])]
+	model2 = copy.deepcopy(model)
+	model2._model.checkpoint = True
+
+	for X_ in X, X_ragged:
+		y1 = model.forward_backward(X_)
+		y2 = model2.forward_backward(X_)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 5)
+
+
+def test_fit_checkpoint(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model1 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind="dense", max_iter=5)
+	model2 = copy.deepcopy(model1)
+	model2.checkpoint = True
+
+	model1.bake()
+	model2.bake()
+	assert model2._model.checkpoint == True
+
+	model1.fit(X)
+	model2.fit(X)
+
+	assert_array_almost_equal(model1.starts, model2.starts, 4)
+	assert_array_almost_equal(model1.ends, model2.ends, 4)
+	assert_array_almost_equal(model1.edges, model2.edges, 4)
+
+
+def test_forward_backward_chunk_size(model, X):
+	y1 = model.forward_backward(X)
+
+	for chunk_size in 1, 2, 3, 10:
+		model2 = copy.deepcopy(model)
+		model2._model.chunk_size = chunk_size
+		y2 = model2.forward_backward(X)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 5)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	assert_raises(ValueError, HiddenMarkovModel, d, chunk_size=0)
+	assert_raises(ValueError, HiddenMarkovModel, d, chunk_size=1.5)
+
+
+def test_algorithm_scaled(model, X):
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2])]
+	model2 = copy.deepcopy(model)
+	model2._model.algorithm = 'scaled'
+
+	for X_ in X, X_ragged:
+		assert_array_almost_equal(model.forward(X_), model2.forward(X_), 4)
+		assert_array_almost_equal(model.backward(X_), model2.backward(X_), 4)
+
+		y1 = model.forward_backward(X_)
+		y2 = model2.forward_backward(X_)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 4)
+
+	X_long = torch.randint(4, size=(2, 2000, 3), 
+		generator=torch.Generator().manual_seed(0))
+	assert_array_almost_equal(model.log_probability(X_long), 
+		model2.log_probability(X_long), 1)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	assert_raises(ValueError, HiddenMarkovModel, d, algorithm='linear')
+
+
+def test_fit_scaled(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model1 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind="dense", max_iter=5)
+	model2 = copy.deepcopy(model1)
+	model2.algorithm = 'scaled'
+
+	model1.bake()
+	model2.bake()
+	assert model2._model.algorithm == 'scaled'
+
+	model1.fit(X)
+	model2.fit(X)
+
+	assert_array_almost_equal(model1.starts, model2.starts, 4)
+	assert_array_almost_equal(model1.ends, model2.ends, 4)
+	assert_array_almost_equal(model1.edges, model2.edges, 4)
+
+
+def test_algorithm_scan(model, X):
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2]),
+		torch.tensor(numpy.array(X[0])[:1])]
+	model2 = copy.deepcopy(model)
+	model2._model.algorithm = 'scan'
+
+	for X_ in X, X_ragged:
+		assert_array_almost_equal(model.forward(X_), model2.forward(X_), 4)
+		assert_array_almost_equal(model.backward(X_), model2.backward(X_), 4)
+
+		y1 = model.forward_backward(X_)
+		y2 = model2.forward_backward(X_)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 4)
+
+		path1, logp1 = model.viterbi(X_)
+		path2, logp2 = model2.viterbi(X_)
+
+		for p1, p2 in zip(path1, path2):
+			assert_array_almost_equal(p1, p2)
+
+		assert_array_almost_equal(logp1, logp2, 4)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	assert_raises(ValueError, HiddenMarkovModel, d, kind='sparse', 
+		algorithm='scan')
+
+
+def test_fit_scan(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model1 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind="dense", max_iter=5)
+	model2 = copy.deepcopy(model1)
+	model2.algorithm = 'scan'
+
+	model1.bake()
+	model2.bake()
+	assert model2._model.algorithm == 'scan'
+
+	model1.fit(X)
+	model2.fit(X)
+
+	assert_array_almost_equal(model1.starts, model2.starts, 4)
+	assert_array_almost_equal(model1.ends, model2.ends, 4)
+	assert_array_almost_equal(model1.edges, model2.edges, 4)
@@ -2,12 +2,16 @@
 # Contact: Jacob Schreiber <jmschreiber91@gmail.com>
 
 import os
+import copy
 import numpy
 import torch
 import pytest
 
 from torchegranate.gmm import GeneralMixtureModel
 from torchegranate.distributions import Exponential
+from torchegranate.distributions import Normal
+from torchegranate.distributions import Poisson
+from torchegranate.distributions import Bernoulli
 
 from .distributions._utils import _test_initialization_raises_one_parameter
 from .distributions._utils import _test_initialization
@@ -158,6 +162,41 @@ def test_emission_matrix_raises(model, X):
 	_test_raises(model, "_emission_matrix", X, min_value=MIN_VALUE)
 
 
+def _test_emission_matrix_stacked(model, X):
+	e = model._emission_matrix(X)
+	e_loop = torch.stack([d.log_probability(X) for d in model.distributions])
+	assert_array_almost_equal(e, e_loop.T + model._log_priors, 4)
+
+
+def test_emission_matrix_stacked(X):
+	torch.manual_seed(0)
+
+	d = [Normal(torch.rand(3), torch.rand(3) + 0.5, covariance_type='diag') 
+		for i in range(5)]
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), X)
+
+	d = []
+	for i in range(5):
+		cov = torch.rand(3, 3)
+		d.append(Normal(torch.rand(3), cov.T @ cov + torch.eye(3)))
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), X)
+
+	d = [Poisson(torch.rand(3) + 0.5) for i in range(5)]
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), X)
+
+	d = [Bernoulli(torch.rand(3) * 0.8 + 0.1) for i in range(5)]
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), 
+		numpy.array(X) % 2)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Poisson([1.5, 3.1, 2.2])]
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), X)
+
+	X_shifted = 1000 + torch.rand(11, 3) * 0.02 - 0.01
+	d = [Normal(1000 + torch.rand(3) * 0.01, [1e-4, 1e-4, 1e-4], 
+		covariance_type='diag') for i in range(3)]
+	_test_emission_matrix_stacked(GeneralMixtureModel(d), X_shifted)
+
+
 def test_log_probability(model, X):
 	logp = model.log_probability(X)
 	assert_array_almost_equal(logp, [-4.0935, -3.9571, -5.4276, -6.4169, 
@@ -295,6 +334,46 @@ def test_summarize_weighted_2d(model, X):
 	assert_array_almost_equal(model._w_sum, [3.432638, 9.567362])
 
 
+def _test_summarize_stacked(distributions, X, w):
+	model = GeneralMixtureModel(distributions)
+	model.summarize(X, sample_weight=w)
+
+	y = model.predict_proba(X)
+	sample_weight = torch.tensor(w, dtype=torch.float32).expand(-1, 3)
+	for i, d in enumerate(model.distributions):
+		d2 = copy.deepcopy(d)
+		d2._reset_cache()
+		d2.summarize(X, sample_weight=y[:, i:i+1] * sample_weight)
+
+		assert_array_almost_equal(d._w_sum, d2._w_sum, 4)
+		assert_array_almost_equal(d._xw_sum, d2._xw_sum, 4)
+		if hasattr(d, "_xxw_sum"):
+			assert_array_almost_equal(d._xxw_sum, d2._xxw_sum, 4)
+
+	assert_array_almost_equal(model._w_sum, (y * sample_weight[:, :1]).sum(
+		dim=0), 4)
+
+
+def test_summarize_stacked(X, w):
+	torch.manual_seed(0)
+
+	d = [Normal(torch.rand(3), torch.rand(3) + 0.5, covariance_type='diag') 
+		for i in range(4)]
+	_test_summarize_stacked(d, X, w)
+
+	d = []
+	for i in range(4):
+		cov = torch.rand(3, 3)
+		d.append(Normal(torch.rand(3), cov.T @ cov + torch.eye(3)))
+	_test_summarize_stacked(d, X, w)
+
+	d = [Poisson(torch.rand(3) + 0.5) for i in range(4)]
+	_test_summarize_stacked(d, X, w)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	_test_summarize_stacked(d, X, w)
+
+
 def test_summarize_raises(model, X, w):
 	assert_raises(ValueError, model.summarize, [X])
 	assert_raises(ValueError, model.summarize, X[0])
@@ -472,6 +551,36 @@ def test_fit(X):
 		numpy.log([0.378347, 0.621653]))
 
 
+def test_fit_float64(X, w):
+	X = torch.tensor(numpy.array(X), dtype=torch.float64)
+	scales = [[2.1, 0.3, 1.1], [1.5, 3.1, 2.2]]
+
+	d1 = [Exponential(torch.tensor(s, dtype=torch.float64)) for s in scales]
+	d2 = [Exponential(s) for s in scales]
+
+	model1 = GeneralMixtureModel(d1, max_iter=5).fit(X, sample_weight=w)
+	model2 = GeneralMixtureModel(d2, max_iter=5).fit(X, sample_weight=w)
+
+	assert_array_almost_equal(model1.priors, model2.priors, 4)
+	for d1_, d2_ in zip(model1.distributions, model2.distributions):
+		assert_array_almost_equal(d1_.scales, d2_.scales, 4)
+
+
+	means = [[1.0, 1.0, 0.5], [2.0, 0.5, 2.0]]
+
+	d1 = [Normal(torch.tensor(m, dtype=torch.float64), torch.ones(3, 
+		dtype=torch.float64), covariance_type='diag') for m in means]
+	d2 = [Normal(m, [1., 1., 1.], covariance_type='diag') for m in means]
+
+	model1 = GeneralMixtureModel(d1, max_iter=5).fit(X, sample_weight=w)
+	model2 = GeneralMixtureModel(d2, max_iter=5).fit(X, sample_weight=w)
+
+	assert_array_almost_equal(model1.priors, model2.priors, 4)
+	for d1_, d2_ in zip(model1.distributions, model2.distributions):
+		assert_array_almost_equal(d1_.means, d2_.means, 4)
+		assert_array_almost_equal(d1_.covs, d2_.covs, 4)
+
+
 def test_fit_weighted(X, w):
 	d = [Exponential([2.1, 0.3, 1.1]), Exponential([1.5, 3.1, 2.2])]
 	model = GeneralMixtureModel(d, max_iter=1)
@@ -502,6 +611,92 @@ def test_fit_chain(X):
 	assert_array_almost_equal(model._log_priors, numpy.log([0.44044, 0.55956]))
 
 
+def test_fit_batches(X, w):
+	X = torch.tensor(X, dtype=torch.float32)
+	w = torch.tensor(w, dtype=torch.float32)
+
+	d = [Exponential([2.1, 0.3, 1.1]), Exponential([1.5, 3.1, 2.2])]
+	model = GeneralMixtureModel(d, max_iter=5).fit(X, sample_weight=w)
+
+	dataset = torch.utils.data.TensorDataset(X, w)
+	loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+
+	d = [Exponential([2.1, 0.3, 1.1]), Exponential([1.5, 3.1, 2.2])]
+	model2 = GeneralMixtureModel(d, max_iter=5).fit(loader)
+
+	assert_array_almost_equal(model2.priors, model.priors)
+	assert_array_almost_equal(model2.distributions[0].scales, 
+		model.distributions[0].scales)
+	assert_array_almost_equal(model2.distributions[1].scales, 
+		model.distributions[1].scales)
+
+	assert_raises(ValueError, model2.fit, loader, w)
+	assert_raises(ValueError, model2.fit, (x for x in X.split(4)))
+
+
+def test_fit_restarts(w):
+	X = torch.randn(300, 3, generator=torch.Generator().manual_seed(0))
+	X = torch.abs(X + torch.tensor([0., 3., 6.]).repeat(100).reshape(-1, 1))
+	w = torch.rand(300, generator=torch.Generator().manual_seed(1))
+
+	for make in (lambda: [Normal(covariance_type='diag') for i in range(3)], 
+		lambda: [Exponential(), Normal(), Exponential()]):
+
+		random_state = numpy.random.RandomState(0)
+		logps, models = [], []
+		for i in range(4):
+			model = GeneralMixtureModel(make(), max_iter=10, 
+				random_state=random_state).fit(X, sample_weight=w)
+
+			logps.append(model.log_probability(X).sum())
+			models.append(model)
+
+		best = models[numpy.argmax(logps)]
+		model = GeneralMixtureModel(make(), max_iter=10, random_state=0, 
+			n_init=4).fit(X, sample_weight=w)
+
+		assert_array_almost_equal(model.priors, best.priors, 4)
+		assert_array_almost_equal(model.log_probability(X), 
+			best.log_probability(X), 3)
+		assert_array_almost_equal(model._w_sum, [0., 0., 0.])
+
+	model = GeneralMixtureModel([Exponential(), Exponential()], n_init=2)
+	loader = torch.utils.data.DataLoader(torch.utils.data.TensorDataset(X), 
+		batch_size=4)
+	assert_raises(ValueError, model.fit, loader)
+	assert_raises(ValueError, GeneralMixtureModel, [Exponential(), 
+		Exponential()], n_init=0)
+
+
+def test_partial_fit(X, w):
+	d = [Exponential([2.1, 0.3, 1.1]), Exponential([1.5, 3.1, 2.2])]
+	model = GeneralMixtureModel(d, max_iter=1).fit(X, sample_weight=w)
+
+	d = [Exponential([2.1, 0.3, 1.1]), Exponential([1.5, 3.1, 2.2])]
+	model2 = GeneralMixtureModel(d).partial_fit(X, sample_weight=w)
+
+	assert model2._n_online_steps == 1
+	assert_array_almost_equal(model2.priors, model.priors)
+	assert_array_almost_equal(model2._w_sum, [0., 0.])
+	assert_array_almost_equal(model2.distributions[0].scales, 
+		model.distributions[0].scales)
+	assert_array_almost_equal(model2.distributions[1].scales, 
+		model.distributions[1].scales)
+
+	w_sum = model2._online_statistics["_w_sum"]
+	model2.partial_fit(X[:5])
+	y = model.predict_proba(X[:5]).sum(dim=0) / 5
+
+	assert model2._n_online_steps == 2
+	assert_array_almost_equal(model2._online_statistics["_w_sum"], 
+		w_sum * (1 - 2 ** -0.6) + y * 2 ** -0.6)
+	assert_array_almost_equal(model2.priors.sum(), 1.)
+
+	assert_raises(ValueError, GeneralMixtureModel, d, step_offset=0.5)
+	assert_raises(ValueError, GeneralMixtureModel, d, step_decay=0.2)
+	assert_raises(ValueError, GeneralMixtureModel, d, step_decay=1.2)
+
+
 def test_fit_raises(model, X, w):
 	assert_raises(ValueError, model.fit, [X])
 	assert_raises(ValueError, model.fit, X[0])
@@ -7,6 +7,7 @@ import torch
 import pytest
 
 from torchegranate.kmeans import KMeans
+from torchegranate._utils import _initialize_centroids
 
 from .distributions._utils import _test_initialization_raises_one_parameter
 from .distributions._utils import _test_initialization
@@ -347,6 +348,40 @@ def test_fit_chain(X):
          [0.5     , 0.666667, 1.      ]])
 
 
+def test_fit_batches(X, w):
+	X = torch.tensor(X, dtype=torch.float32)
+	w = torch.tensor(w, dtype=torch.float32)
+
+	model = KMeans(k=2, init='first-k').fit(X, sample_weight=w)
+
+	dataset = torch.utils.data.TensorDataset(X, w)
+	loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+	model2 = KMeans(centroids=torch.clone(X[:2])).fit(loader)
+
+	assert_array_almost_equal(model2.centroids, model.centroids)
+	assert_array_almost_equal(model2._w_sum, [[0., 0., 0.], [0., 0., 0.]])
+
+
+def test_partial_fit(X, w):
+	model = KMeans(k=2, init='first-k', max_iter=1).fit(X, sample_weight=w)
+	model2 = KMeans(k=2, init='first-k').partial_fit(X, sample_weight=w)
+
+	assert model2._n_online_steps == 1
+	assert_array_almost_equal(model2.centroids, model.centroids)
+	assert_array_almost_equal(model2._w_sum, [[0., 0., 0.], [0., 0., 0.]])
+
+	model2.partial_fit(X[:4])
+	model2.partial_fit(X[4:])
+
+	assert model2._n_online_steps == 3
+	assert_array_almost_equal(model2.centroids, 
+		[[2.271192, 1.321815, 0.858696],
+         [0.395673, 0.534182, 1.222093]])
+
+	assert_raises(ValueError, KMeans, 2, step_offset=0.5)
+	assert_raises(ValueError, KMeans, 2, step_decay=1.2)
+
+
 def test_fit_raises(model, X, w):
 	assert_raises(ValueError, model.fit, [X])
 	assert_raises(ValueError, model.fit, X[0])
@@ -469,4 +504,228 @@ def test_masked_fit(model, X, X_masked):
 	assert_array_almost_equal(model._xw_sum, [[0., 0., 0.], [0., 0., 0.]])
 	assert_array_almost_equal(model.centroids, 
 		[[0.4, 1.2, 0.6],
-         [3.5, 1.5, 3. ]])
\ No newline at end of file
+         [3.5, 1.5, 3. ]])
+
+def test_memory_budget(model, X, X_masked, w):
+	y_hat = model.predict(X)
+	logp = model.summarize(X, sample_weight=w)
+
+	for memory_budget in 1, 2, 7, 100:
+		model2 = KMeans(centroids=[[1, 0, 1], [2, 1, -1]], 
+			memory_budget=memory_budget)
+
+		assert len(model2._blocks(torch.tensor(X))) == \
+			-(-11 // max(1, memory_budget // 2))
+		assert_array_almost_equal(model2.predict(X), y_hat)
+		assert_array_almost_equal(model2.summarize(X, sample_weight=w), logp, 
+			4)
+		assert_array_almost_equal(model2._w_sum, model._w_sum)
+		assert_array_almost_equal(model2._xw_sum, model._xw_sum)
+
+	model1 = KMeans(centroids=[[1, 0, 1], [2, 1, 0]])
+	model2 = KMeans(centroids=[[1, 0, 1], [2, 1, 0]], memory_budget=6)
+
+	model1.summarize(X_masked, sample_weight=w)
+	model2.summarize(X_masked, sample_weight=w)
+	assert_array_almost_equal(model1._w_sum, model2._w_sum)
+	assert_array_almost_equal(model1._xw_sum, model2._xw_sum)
+
+	model1 = KMeans(centroids=[[1, 0, 1], [2, 1, 0]])
+	model2 = KMeans(centroids=[[1, 0, 1], [2, 1, 0]], memory_budget=6)
+
+	model1.fit(X_masked)
+	model2.fit(X_masked)
+	assert_array_almost_equal(model1.centroids, model2.centroids)
+
+	assert_raises(ValueError, KMeans, 2, memory_budget=0)
+
+
+def test_fit_bounded(X, X_masked, w):
+	torch.manual_seed(0)
+	X_large = torch.cat([torch.randn(20, 4) + 3 * torch.randn(1, 4) 
+		for _ in range(48)])
+
+	for X_, w_, centroids in (X, w, [[1, 0, 1], [2, 1, -1]]), (X_large, None,
+		X_large[::20].tolist()):
+		model = KMeans(centroids=centroids, max_iter=20, tol=0.0)
+		model.fit(X_, sample_weight=w_)
+
+		for algorithm in 'elkan', 'hamerly':
+			for memory_budget in None, 10:
+				model2 = KMeans(centroids=centroids, max_iter=20, tol=0.0, 
+					algorithm=algorithm, memory_budget=memory_budget)
+				model2.fit(X_, sample_weight=w_)
+
+				assert model2._bounds is None
+				assert_array_almost_equal(model2.centroids, model.centroids, 
+					4)
+
+	for algorithm in 'elkan', 'hamerly':
+		model = KMeans(centroids=torch.clone(X_large[::20]), 
+			algorithm=algorithm)
+		model2 = KMeans(centroids=torch.clone(X_large[::20]))
+
+		for _ in range(3):
+			assert_array_almost_equal(model._summarize_bounded(X_large), 
+				model2.summarize(X_large), 1)
+			assert_array_almost_equal(model._w_sum, model2._w_sum)
+			assert_array_almost_equal(model._xw_sum, model2._xw_sum, 4)
+
+			model.from_summaries()
+			model2.from_summaries()
+
+	model = KMeans(centroids=[[1, 0, 1], [2, 1, 0]], algorithm='elkan')
+	assert_raises(ValueError, model.fit, X_masked)
+
+	X_ = torch.utils.data.DataLoader(torch.tensor(X, dtype=torch.float32), 
+		batch_size=4)
+	assert_raises(ValueError, model.fit, X_)
+	assert_raises(ValueError, KMeans, 2, algorithm='lloyds')
+
+
+def test_initialize_kmeans_plusplus(X, X_masked):
+	X_ = torch.tensor(numpy.array(X), dtype=torch.float32)
+
+	for init in 'kmeans++', 'kmeans||':
+		model = KMeans(4, init=init, random_state=0)
+		model._initialize(X)
+
+		assert model.centroids.shape == (4, 3)
+		assert len(torch.unique(model.centroids, dim=0)) == 4
+		for centroid in model.centroids:
+			assert (X_ == centroid).all(dim=1).any()
+
+		model2 = KMeans(4, init=init, random_state=0, memory_budget=5)
+		model2._initialize(X)
+		assert_array_almost_equal(model.centroids, model2.centroids)
+
+		model = KMeans(11, init=init, random_state=1)
+		model._initialize(X)
+		assert len(torch.unique(model.centroids, dim=0)) == 11
+
+		model = KMeans(3, init=init, random_state=0)
+		model._initialize(X_masked)
+		assert model.centroids.shape == (3, 3)
+		model.fit(X_masked)
+
+	centers = torch.tensor([[0., 0.], [10., 0.], [0., 10.], [10., 10.]])
+	X_ = torch.randn(800, 2, generator=torch.Generator().manual_seed(0)) * 0.1
+	X_ += centers.repeat_interleave(200, dim=0)
+
+	for init in 'kmeans++', 'kmeans||':
+		for seed in range(5):
+			model = KMeans(4, init=init, random_state=seed)
+			model._initialize(X_)
+			blobs = torch.round(model.centroids / 10)
+			assert len(torch.unique(blobs, dim=0)) == 4
+
+
+def test_initialize_kmeans_plusplus_weighted():
+	centers = torch.tensor([[0., 0.], [10., 0.], [1000., 1000.], [-1000., 0.]])
+	X = torch.randn(400, 2, generator=torch.Generator().manual_seed(0)) * 0.1
+	X += centers.repeat_interleave(100, dim=0)
+
+	w = torch.zeros(400)
+	w[:200] = torch.rand(200, generator=torch.Generator().manual_seed(1)) + 0.1
+
+	for init in 'kmeans++', 'kmeans||':
+		for seed in range(5):
+			for sample_weight in w, w.unsqueeze(1), w.unsqueeze(1).expand(-1, 2):
+				model = KMeans(2, init=init, random_state=seed)
+				model._initialize(X, sample_weight=sample_weight)
+
+				blobs = torch.round(model.centroids / 10)
+				assert_array_almost_equal(torch.unique(blobs, dim=0), 
+					[[0, 0], [1, 0]])
+
+			for n_init in 1, 3:
+				model = KMeans(2, init=init, n_init=n_init, max_iter=3, 
+					random_state=seed).fit(X, sample_weight=w)
+
+				blobs = torch.round(model.centroids / 10)
+				assert_array_almost_equal(torch.unique(blobs, dim=0), 
+					[[0, 0], [1, 0]])
+
+
+def test_predict_approximate(X, X_masked):
+	centroids = torch.randn(40, 3, generator=torch.Generator().manual_seed(0))
+	X_ = torch.randn(200, 3, generator=torch.Generator().manual_seed(1))
+
+	model = KMeans(centroids=centroids.tolist())
+	y = model.predict(X_)
+	y_masked = model.predict(X_masked)
+
+	for kwargs in {}, {'memory_budget': 100}:
+		model = KMeans(centroids=centroids.tolist(), nprobe=6, n_cells=6, 
+			random_state=0, **kwargs)
+		assert model._index is None
+
+		assert_array_almost_equal(model.predict(X_), y)
+		assert_array_almost_equal(model.predict(X_masked), y_masked)
+		assert model._index is not None
+
+		y_hat, d = model._nearest_approximate(X_)
+		assert_array_almost_equal(d, model._distances(X_).min(dim=1).values, 4)
+
+	model = KMeans(centroids=centroids.tolist(), nprobe=1, random_state=0)
+	y_hat = model.predict(X_)
+
+	coarse = model._index[0]
+	cells = coarse.predict(centroids)
+	assert len(coarse.centroids) == 6
+	assert_array_almost_equal(cells[y_hat], coarse.predict(X_))
+	assert (y_hat == y).float().mean() > 0.7
+
+	model.summarize(X_)
+	model.from_summaries()
+	assert model._index is None
+
+	model = KMeans(4, nprobe=2, max_iter=3, random_state=0).fit(X)
+	assert model._index is not None
+	assert len(model._index[0].centroids) == 2
+
+	assert_raises(ValueError, KMeans, 4, nprobe=0)
+	assert_raises(ValueError, KMeans, 4, nprobe=2.5)
+	assert_raises(ValueError, KMeans, 4, nprobe=2, n_cells=1)
+
+
+def test_fit_restarts(X_masked):
+	X = torch.randn(300, 3, generator=torch.Generator().manual_seed(0))
+	X += torch.tensor([0., 3., 6.]).repeat(100).reshape(-1, 1)
+	w = torch.rand(300, 3, generator=torch.Generator().manual_seed(1))
+
+	for sample_weight in None, w[:, 0], w:
+		for memory_budget in None, 100:
+			random_state = numpy.random.RandomState(0)
+			distances, centroids = [], []
+			for i in range(4):
+				init = _initialize_centroids(X, 4, algorithm='random', 
+					random_state=random_state)
+
+				model = KMeans(centroids=init.tolist(), max_iter=5).fit(X, 
+					sample_weight=sample_weight)
+				centroids.append(model.centroids)
+				distances.append(KMeans(centroids=model.centroids.tolist()
+					).summarize(X))
+
+			model = KMeans(4, init='random', max_iter=5, random_state=0, 
+				n_init=4, memory_budget=memory_budget).fit(X, 
+				sample_weight=sample_weight)
+
+			assert_array_almost_equal(model.centroids, 
+				centroids[numpy.argmin(distances)], 4)
+			assert_array_almost_equal(model._w_sum, torch.zeros(4, 3))
+
+	model = KMeans(3, init='random', max_iter=5, random_state=0, n_init=3)
+	model.fit(X_masked)
+	assert model.centroids.shape == (3, 3)
+
+	model = KMeans(centroids=[[0., 0., 0.], [1., 1., 1.]], max_iter=1, 
+		n_init=3).fit(X)
+	assert_array_almost_equal(model.centroids, KMeans(centroids=[[0., 0., 
+		0.], [1., 1., 1.]], max_iter=1).fit(X).centroids)
+
+	loader = torch.utils.data.DataLoader(torch.utils.data.TensorDataset(X), 
+		batch_size=4)
+	assert_raises(ValueError, KMeans(3, n_init=2).fit, loader)
+	assert_raises(ValueError, KMeans, 3, n_init=0)
@@ -1,11 +1,14 @@
 # test_bayes_classifier.py
 # Contact: Jacob Schreiber <jmschreiber91@gmail.com>
 
+import copy
 import numpy
 import torch
 import pytest
 
 from torchegranate.hmm import HiddenMarkovModel
+from torchegranate.hmm import _estimate_backend_costs
+from torchegranate._base import Node
 from torchegranate._sparse_hmm import _SparseHMM
 from torchegranate.distributions import Exponential
 
@@ -359,6 +362,28 @@ def test_forward_backward(model, X):
 	assert_array_almost_equal(logp, [-22.8266, -22.8068], 3)
 
 
+def test_viterbi(model, X):
+	path, logp = model.viterbi(X)
+	assert path.dtype == torch.int64
+	assert_array_almost_equal(path, 
+		[[1, 1, 1, 1, 0],
+         [1, 0, 1, 0, 1]])
+	assert_array_almost_equal(logp, [-23.1131, -23.0715], 4)
+
+	emissions = model._emission_matrix(torch.tensor(X))
+	path2, logp2 = model.viterbi(emissions=emissions)
+	assert_array_almost_equal(path, path2)
+	assert_array_almost_equal(logp, logp2)
+
+
+def test_viterbi_raises(model, X):
+	f = getattr(model, "viterbi")
+
+	assert_raises(ValueError, f, [X])
+	assert_raises(ValueError, f, X[0])
+	assert_raises(ValueError, f)
+
+
 def test_predict(model, X):
 	y_hat = model.predict(X)
 	assert_array_almost_equal(y_hat, 
@@ -1231,3 +1256,438 @@ def test_masked_fit(X, X_masked):
 	assert_array_almost_equal(d2.scales, [2.8777, 2.3498, 2.1939], 4)
 	assert_array_almost_equal(d2._w_sum, [0., 0., 0.])
 	assert_array_almost_equal(d2._xw_sum, [0., 0., 0.])
+
+
+def test_labeled_summarize(model, X):
+	y = [[0, 1, 1, 0, 1], [1, 1, 0, 0, 1]]
+	X = torch.tensor(numpy.array(X))
+	t, r, starts, ends, _ = model._model._labeled_summarize(X, y)
+
+	assert_array_almost_equal(t, [[0, 2, 1, 1], [1, 1, 1, 1]])
+	assert_array_almost_equal(starts, [[1, 0], [0, 1]])
+	assert_array_almost_equal(ends, [[0, 1], [0, 1]])
+	assert_array_almost_equal(torch.exp(r), torch.nn.functional.one_hot(
+		torch.tensor(y)))
+
+
+def test_labeled_summarize_raises(model, X):
+	X = torch.tensor(numpy.array(X))
+
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 2, 0, 1], [1, 1, 0, 0, 1]])
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 1, 0], [1, 1, 0, 0]])
+
+
+def test_labeled_summarize_missing_edge(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model = HiddenMarkovModel(nodes=d, edges=[[0.0, 0.9], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='sparse')
+	model.bake()
+
+	X = torch.tensor(numpy.array(X))
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 1, 0, 0], [1, 1, 0, 1, 1]])
+
+	t, _, _, _, _ = model._model._labeled_summarize(X, 
+		[[0, 1, 1, 0, 1], [1, 1, 0, 1, 1]])
+	assert_array_almost_equal(t, [[2, 1, 1], [1, 1, 2]])
+
+
+def test_labeled_summarize_edge_order(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	nodes = [Node(d[0], "0"), Node(d[1], "1")]
+
+	model = HiddenMarkovModel(kind='sparse')
+	model.add_nodes(nodes)
+	model.add_edge(nodes[1], nodes[1], 0.6)
+	model.add_edge(nodes[1], nodes[0], 0.3)
+	model.add_edge(nodes[0], nodes[1], 0.9)
+	model.add_edge(model.start, nodes[0], 0.2)
+	model.add_edge(model.start, nodes[1], 0.8)
+	model.add_edge(nodes[0], model.end, 0.1)
+	model.add_edge(nodes[1], model.end, 0.1)
+	model.bake()
+
+	assert model._model._edge_keys.shape == (3,)
+	assert model._model._edge_key_idxs.shape == (3,)
+	assert_array_almost_equal(model._model._edge_keys, [1, 2, 3])
+
+	X = torch.tensor(numpy.array(X))
+	assert_raises(ValueError, model._model._labeled_summarize, X, 
+		[[0, 1, 1, 0, 0], [1, 1, 0, 1, 1]])
+
+	t, _, _, _, _ = model._model._labeled_summarize(X, 
+		[[0, 1, 1, 0, 1], [1, 1, 0, 1, 1]])
+	assert_array_almost_equal(t, [[1, 1, 2], [2, 1, 1]])
+
+
+def test_ragged(model, X):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1])]
+
+	f = model.forward(X)
+	b = model.backward(X)
+	t, _, starts, ends, logp = model.forward_backward(X)
+	r = model.predict_proba(X)
+	y_hat = model.predict(X)
+	path, path_logp = model.viterbi(X)
+
+	assert f.shape == (3, 5, 2)
+	assert len(r) == 3 and len(y_hat) == 3 and len(path) == 3
+	assert_array_almost_equal(logp, model.log_probability(X))
+
+	for i, x in enumerate(X):
+		x = x.unsqueeze(0)
+		l = x.shape[1]
+
+		assert_array_almost_equal(f[i, :l], model.forward(x)[0])
+		assert_array_almost_equal(f[i, l:], numpy.full((5-l, 2), -numpy.inf))
+		assert_array_almost_equal(b[i, :l], model.backward(x)[0])
+
+		t_, _, starts_, ends_, logp_ = model.forward_backward(x)
+		assert_array_almost_equal(t[i], t_[0])
+		assert_array_almost_equal(starts[i], starts_[0])
+		assert_array_almost_equal(ends[i], ends_[0])
+		assert_array_almost_equal(logp[i], logp_[0])
+
+		assert_array_almost_equal(r[i], model.predict_proba(x)[0])
+		assert_array_almost_equal(y_hat[i], model.predict(x)[0])
+
+		path_, path_logp_ = model.viterbi(x)
+		assert_array_almost_equal(path[i], path_[0])
+		assert_array_almost_equal(path_logp[i], path_logp_[0])
+
+
+def test_ragged_summarize(model, X, w):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1])]
+	y = [torch.tensor([0, 1, 1]), torch.tensor([1, 1, 0, 0, 1]), 
+		torch.tensor([1])]
+	w = [1, 2.3, 0.7]
+
+	for labels in None, y:
+		model1 = copy.deepcopy(model)
+		model2 = copy.deepcopy(model)
+
+		logp = model1.summarize(X, y=labels, sample_weight=w)
+		for i, x in enumerate(X):
+			y_ = None if labels is None else labels[i].unsqueeze(0)
+			logp_ = model2.summarize(x.unsqueeze(0), y=y_, 
+				sample_weight=w[i:i+1])
+			assert_array_almost_equal(logp[i], logp_[0])
+
+		for b1, b2 in zip(model1.buffers(), model2.buffers()):
+			assert_array_almost_equal(b1, b2, 4)
+
+
+def test_bucket_plan(X):
+	X_ragged = [torch.ones(l, 3) for l in (4, 9, 2, 9, 5, 1)]
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+
+	model = HiddenMarkovModel(nodes=d, kind="sparse")
+	plan = model.bucket_plan(X_ragged)
+	assert len(plan) == 1
+	assert_array_almost_equal(plan[0], [1, 3, 4, 0, 2, 5])
+
+	model = HiddenMarkovModel(nodes=d, kind="sparse", memory_budget=40)
+	plan = model.bucket_plan(X_ragged)
+	assert [p.tolist() for p in plan] == [[1, 3], [4, 0, 2, 5]]
+
+	model = HiddenMarkovModel(nodes=d, kind="sparse", memory_budget=10)
+	plan = model.bucket_plan(X)
+	assert [p.tolist() for p in plan] == [[0], [1]]
+
+	assert_raises(ValueError, HiddenMarkovModel, d, memory_budget=0)
+
+
+def test_summarize_memory_budget(model, X):
+	X = [torch.tensor(numpy.array(X[0])[:3]), torch.tensor(X[1]), 
+		torch.tensor(numpy.array(X[0])[:1]), torch.tensor(X[0])]
+	w = [1, 2.3, 0.7, 1.5]
+
+	model1 = copy.deepcopy(model)
+	model2 = copy.deepcopy(model)
+	model2.memory_budget = 12
+	assert len(model2.bucket_plan(X)) == 3
+
+	logp1 = model1.summarize(X, sample_weight=w)
+	logp2 = model2.summarize(X, sample_weight=w)
+	assert_array_almost_equal(logp1, logp2)
+
+	for b1, b2 in zip(model1.buffers(), model2.buffers()):
+		assert_array_almost_equal(b1, b2, 4)
+
+
+def test_forward_backward_checkpoint(model, X):
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2])]
+	model2 = copy.deepcopy(model)
+	model2._model.checkpoint = True
+
+	for X_ in X, X_ragged:
+		y1 = model.forward_backward(X_)
+		y2 = model2.forward_backward(X_)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 5)
+
+
+def test_fit_checkpoint(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model1 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind="sparse", max_iter=5)
+	model2 = copy.deepcopy(model1)
+	model2.checkpoint = True
+
+	model1.bake()
+	model2.bake()
+	assert model2._model.checkpoint == True
+
+	model1.fit(X)
+	model2.fit(X)
+
+	assert_array_almost_equal(model1.starts, model2.starts, 4)
+	assert_array_almost_equal(model1.ends, model2.ends, 4)
+	assert_array_almost_equal(model1.edges, model2.edges, 4)
+
+
+def test_forward_backward_chunk_size(model, X):
+	y1 = model.forward_backward(X)
+
+	for chunk_size in 1, 2, 3, 10:
+		model2 = copy.deepcopy(model)
+		model2._model.chunk_size = chunk_size
+		y2 = model2.forward_backward(X)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 5)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	assert_raises(ValueError, HiddenMarkovModel, d, chunk_size=0)
+	assert_raises(ValueError, HiddenMarkovModel, d, chunk_size=1.5)
+
+
+def test_algorithm_scaled(model, X):
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2])]
+	model2 = copy.deepcopy(model)
+	model2._model.algorithm = 'scaled'
+
+	for X_ in X, X_ragged:
+		assert_array_almost_equal(model.forward(X_), model2.forward(X_), 4)
+		assert_array_almost_equal(model.backward(X_), model2.backward(X_), 4)
+
+		y1 = model.forward_backward(X_)
+		y2 = model2.forward_backward(X_)
+
+		for z1, z2 in zip(y1, y2):
+			assert_array_almost_equal(z1, z2, 4)
+
+	X_long = torch.randint(4, size=(2, 2000, 3), 
+		generator=torch.Generator().manual_seed(0))
+	assert_array_almost_equal(model.log_probability(X_long), 
+		model2.log_probability(X_long), 1)
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	assert_raises(ValueError, HiddenMarkovModel, d, algorithm='linear')
+
+
+def test_fit_scaled(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model1 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind="sparse", max_iter=5)
+	model2 = copy.deepcopy(model1)
+	model2.algorithm = 'scaled'
+
+	model1.bake()
+	model2.bake()
+	assert model2._model.algorithm == 'scaled'
+
+	model1.fit(X)
+	model2.fit(X)
+
+	assert_array_almost_equal(model1.starts, model2.starts, 4)
+	assert_array_almost_equal(model1.ends, model2.ends, 4)
+	assert_array_almost_equal(model1.edges, model2.edges, 4)
+
+
+def _silent_models(viterbi=False):
+	models = []
+	for silent in True, False:
+		d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2]),
+			Exponential([0.4, 1.2, 0.8]), Exponential([3.0, 0.7, 1.9])]
+		a, b, c, e = [Node(d_, name) for d_, name in zip(d, "abce")]
+		s1, s2 = Node(None, "s1"), Node(None, "s2")
+
+		model = HiddenMarkovModel()
+		model.add_nodes([s2, a, s1, b, c, e] if silent else [a, b, c, e])
+
+		for edge in [(a, a, 0.5), (b, b, 0.7), (b, c, 0.2), (c, c, 0.5), 
+			(c, e, 0.1), (c, a, 0.3), (e, e, 0.9), (model.start, a, 0.5), 
+			(b, model.end, 0.1), (c, model.end, 0.1), (e, model.end, 0.1)]:
+			model.add_edge(*edge)
+
+		# The paths through the silent nodes are collapsed into single
+		# edges by summing over them or, for Viterbi, taking the best one.
+		if silent:
+			for edge in [(a, s1, 0.3), (a, b, 0.2), (s1, s2, 0.5), 
+				(s1, c, 0.5), (s2, c, 0.6), (s2, b, 0.4), 
+				(model.start, s1, 0.5)]:
+				model.add_edge(*edge)
+		elif viterbi:
+			for edge in [(a, c, 0.15), (a, b, 0.2), (model.start, c, 0.25), 
+				(model.start, b, 0.1)]:
+				model.add_edge(*edge)
+		else:
+			for edge in [(a, c, 0.24), (a, b, 0.26), (model.start, c, 0.4), 
+				(model.start, b, 0.1)]:
+				model.add_edge(*edge)
+
+		model.bake()
+		models.append(model)
+
+	return models
+
+
+def test_silent_nodes(X):
+	model1, model2 = _silent_models()
+	X_ragged = [torch.tensor(X[1]), torch.tensor(numpy.array(X[0])[:2]),
+		torch.tensor(numpy.array(X[0])[:1])]
+
+	assert model1.n_nodes == 4
+	assert model1._model.n_silent == 2
+	assert model1._model.n_levels == 2
+	assert model1.d == 3
+
+	for X_ in X, X_ragged:
+		f1, f2 = model1.forward(X_), model2.forward(X_)
+		b1, b2 = model1.backward(X_), model2.backward(X_)
+
+		assert f1.shape[-1] == 6
+		assert_array_almost_equal(f1[..., :4], f2, 4)
+		assert_array_almost_equal(b1[..., :4], b2, 4)
+		assert_array_almost_equal(model1.log_probability(X_), 
+			model2.log_probability(X_), 4)
+
+		for r1, r2 in zip(model1.predict_proba(X_), model2.predict_proba(X_)):
+			assert_array_almost_equal(r1, r2, 4)
+
+	model1, model2 = _silent_models(viterbi=True)
+	path1, logp1 = model1.viterbi(X)
+	path2, logp2 = model2.viterbi(X)
+
+	assert_array_almost_equal(path1, path2)
+	assert_array_almost_equal(logp1, logp2, 4)
+
+
+def test_silent_nodes_summarize(X):
+	model1, model2 = _silent_models()
+	model1.summarize(X)
+	model2.summarize(X)
+
+	for node1, node2 in zip(model1._model.nodes, model2._model.nodes):
+		assert_array_almost_equal(node1.distribution._w_sum, 
+			node2.distribution._w_sum, 4)
+		assert_array_almost_equal(node1.distribution._xw_sum, 
+			node2.distribution._xw_sum, 4)
+
+	# Every path that enters the first silent node also leaves it.
+	starts = model1._model._edge_idx_starts
+	ends = model1._model._edge_idx_ends
+	xw_sum = model1._model._xw_sum
+
+	assert_array_almost_equal(xw_sum[ends == 5].sum() + 
+		model1._model._xw_starts_sum[5], xw_sum[starts == 5].sum(), 4)
+	assert_array_almost_equal(model1._model._xw_starts_sum.sum(), 2, 4)
+	assert_array_almost_equal(model1._model._xw_ends_sum.sum(), 2, 4)
+
+	model1.from_summaries()
+	assert_array_almost_equal(torch.exp(model1.starts).sum(), 1, 4)
+
+
+def test_silent_nodes_raises(X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	a, b = Node(d[0], "a"), Node(d[1], "b")
+	s1, s2 = Node(None, "s1"), Node(None, "s2")
+
+	for kwargs in {'kind': 'dense'}, {'checkpoint': True}, \
+		{'algorithm': 'scaled'}:
+		model = HiddenMarkovModel(**kwargs)
+		model.add_nodes([a, s1, b])
+		for edge in [(a, s1, 0.5), (s1, b, 1.0), (a, a, 0.5), (b, b, 0.9),
+			(model.start, a, 1.0), (b, model.end, 0.1)]:
+			model.add_edge(*edge)
+
+		assert_raises(ValueError, model.bake)
+
+	model = HiddenMarkovModel()
+	model.add_nodes([a, s1, s2, b])
+	for edge in [(a, s1, 0.5), (s1, s2, 0.5), (s2, s1, 0.5), (s1, b, 0.5),
+		(s2, b, 0.5), (a, a, 0.5), (b, b, 0.9), (model.start, a, 1.0),
+		(b, model.end, 0.1)]:
+		model.add_edge(*edge)
+
+	assert_raises(ValueError, model.bake)
+
+	model1, _ = _silent_models()
+	assert_raises(ValueError, model1.summarize, X, y=[[0, 0, 0, 0, 0], 
+		[0, 0, 0, 0, 0]])
+
+
+def test_kind_auto(model, X):
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model2 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		starts=[0.2, 0.8], ends=[0.1, 0.1], kind='auto')
+
+	assert model2.backend is None
+	model2.bake()
+
+	assert model2.kind == 'auto'
+	assert model2.backend in ('dense', 'sparse', 'banded')
+	assert set(model2.backend_costs.keys()) == {'dense', 'sparse', 'banded'}
+	assert all(cost > 0 for cost in model2.backend_costs.values())
+
+	assert_array_almost_equal(model.forward(X), model2.forward(X), 4)
+	assert_array_almost_equal(model.log_probability(X), 
+		model2.log_probability(X), 4)
+
+	model1, _ = _silent_models()
+	model1.kind = 'auto'
+	model1.bake()
+	assert model1.backend == 'sparse'
+	assert model1.backend_costs == {}
+
+	d = [Exponential([2.1, 0.3, 0.1]), Exponential([1.5, 3.1, 2.2])]
+	model3 = HiddenMarkovModel(nodes=d, edges=[[0.1, 0.8], [0.3, 0.6]], 
+		kind='auto', algorithm='scan')
+	model3.bake()
+	assert model3.backend == 'dense'
+
+	_, model4 = _silent_models()
+	model4.bake()
+	logp = model4.log_probability(X)
+
+	for kind in 'auto', 'dense', 'banded':
+		model4.kind = kind
+		model4.bake()
+
+		assert model4.backend == kind or kind == 'auto'
+		assert_array_almost_equal(model4.log_probability(X), logp, 4)
+
+		if kind == 'auto':
+			assert set(model4.backend_costs.keys()) == {'dense', 'sparse', 
+				'banded'}
+
+	assert_raises(ValueError, HiddenMarkovModel, d, kind='fast')
+
+
+def test_estimate_backend_costs():
+	i = torch.arange(2000)
+	rows, cols = torch.cat([i, i[:-1]]), torch.cat([i, i[:-1]+1])
+
+	costs = _estimate_backend_costs(2000, rows, cols, 8)
+	assert costs['banded'] < costs['sparse'] < costs['dense']
+	assert costs['dense'] > 4 * costs['banded']
+
+	rows, cols = torch.nonzero(torch.ones(10, 10), as_tuple=True)
+	costs = _estimate_backend_costs(10, rows, cols, 8)
+	assert costs['dense'] < costs['sparse'] < costs['banded']
@@ -7,6 +7,13 @@ import torch
 from torchegranate._utils import _cast_as_tensor
 from torchegranate._utils import _update_parameter
 from torchegranate._utils import _check_parameter
+from torchegranate._utils import _ravel_multi_index
+from torchegranate._utils import _sparse_lookup
+from torchegranate._utils import _sparse_add
+from torchegranate._utils import _associative_scan
+from torchegranate._utils import _log_matmul
+from torchegranate._utils import _max_matmul
+from torchegranate._utils import _nearest_squared_distances
 
 from nose.tools import assert_almost_equal
 from nose.tools import assert_equal
@@ -552,4 +559,62 @@ def test_check_parameters_shape():
 	assert_raises(ValueError, _check_parameter, x, "x", shape=(1, 2, 1))
 	assert_raises(ValueError, _check_parameter, x, "x", shape=(1, 2, -1))
 	assert_raises(ValueError, _check_parameter, x, "x", shape=(2, -1, -1))
-	
\ No newline at end of file
+	
+
+
+def test_ravel_multi_index():
+	x = torch.tensor([[0, 0, 0], [1, 2, 3], [2, 0, 1], [1, 1, 1]])
+	shape = (3, 4, 5)
+
+	y = numpy.ravel_multi_index(x.numpy().T, shape)
+	assert_array_equal(_ravel_multi_index(x, shape), y)
+
+	x = torch.tensor([[1], [0], [3]])
+	assert_array_equal(_ravel_multi_index(x, (4,)), [1, 0, 3])
+
+
+def test_sparse_lookup_add():
+	keys = torch.zeros(0, dtype=torch.int64)
+	values = torch.zeros(0)
+
+	keys, values = _sparse_add(keys, values, torch.tensor([5, 2, 5, 9]), 
+		torch.tensor([1.0, 2.0, 0.5, 3.0]))
+	keys, values = _sparse_add(keys, values, torch.tensor([2, 7]), 
+		torch.tensor([1.0, 4.0]))
+
+	assert_array_equal(keys, [2, 5, 7, 9])
+	assert_array_almost_equal(values, [3.0, 1.5, 4.0, 3.0])
+
+	y = _sparse_lookup(keys, values, torch.tensor([[0, 2], [9, 10]]), -1)
+	assert_array_almost_equal(y, [[-1.0, 3.0], [3.0, -1.0]])
+
+
+def test_associative_scan():
+	X = torch.randn(2, 13, 3, generator=torch.Generator().manual_seed(0))
+	add = lambda a, b: a + b
+
+	assert_array_almost_equal(_associative_scan(X, add), torch.cumsum(X, 
+		dim=1), 5)
+	assert_array_almost_equal(_associative_scan(X, add, reverse=True), 
+		torch.flip(torch.cumsum(torch.flip(X, (1,)), dim=1), (1,)), 5)
+
+	A = torch.randn(4, 3, 3, generator=torch.Generator().manual_seed(1))
+	B = torch.randn(4, 3, 3, generator=torch.Generator().manual_seed(2))
+	B[:, 1] = float("-inf")
+
+	C = torch.logsumexp(A.unsqueeze(-1) + B.unsqueeze(-3), dim=-2)
+	assert_array_almost_equal(_log_matmul(A, B), C, 5)
+
+	C = torch.amax(A.unsqueeze(-1) + B.unsqueeze(-3), dim=-2)
+	assert_array_almost_equal(_max_matmul(A, B), C)
+
+
+def test_nearest_squared_distances():
+	X = torch.randn(13, 4, generator=torch.Generator().manual_seed(0))
+	C = torch.randn(5, 4, generator=torch.Generator().manual_seed(1))
+
+	d = torch.cdist(X, C) ** 2
+	for memory_budget in None, 1, 12:
+		distances, idxs = _nearest_squared_distances(X, C, memory_budget)
+		assert_array_almost_equal(distances, d.min(dim=1).values, 5)
+		assert_array_equal(idxs, d.argmin(dim=1))
@@ -0,0 +1,796 @@
+import math
+import torch
+
+from ._utils import _cast_as_tensor
+from ._utils import _cast_as_parameter
+from ._utils import _update_parameter
+from ._utils import _check_parameter
+from ._utils import _active_batch_sizes
+from ._utils import _checkpointed_forward_backward
+from ._utils import _scaled_forward
+from ._utils import _scaled_backward
+
+from .distributions._distribution import Distribution
+
+NEGINF = float("-inf")
+inf = float("inf")
+
+
+def _convert_to_banded_edges(nodes, edges, starts, ends, start, end):
+	"""Convert a dense transition matrix or a list of edges into a band.
+
+	The transitions are collected as the index of the node each one leaves,
+	the index of the node it enters and its log probability, and written
+	into a (k, bandwidth) tensor with one column per distinct offset, so
+	that the full (k, k) matrix is never built for a list of edges. Nodes
+	are looked up with a dictionary rather than by searching the list.
+
+
+	Returns
+	-------
+	band: torch.Tensor, shape=(k, bandwidth)
+		The log probability of the transition leaving each node with each
+		offset, or negative infinity where there is none.
+
+	offsets: torch.Tensor, shape=(bandwidth,)
+		The sorted distinct offsets j - i of the transitions.
+
+	starts: torch.nn.Parameter, shape=(k,)
+		The log probability of starting at each node.
+
+	ends: torch.nn.Parameter, shape=(k,)
+		The log probability of ending at each node.
+	"""
+
+	n = len(nodes)
+
+	if isinstance(edges, list) and len(edges) > 0 and isinstance(edges[0], 
+		tuple):
+		idxs = {node: i for i, node in enumerate(nodes)}
+		starts = torch.full((n,), NEGINF)
+		ends = torch.full((n,), NEGINF)
+
+		rows, cols, log_probs = [], [], []
+		for ni, nj, probability in edges:
+			if ni is start:
+				starts[idxs[nj]] = math.log(probability)
+			elif nj is end:
+				ends[idxs[ni]] = math.log(probability)
+			else:
+				rows.append(idxs[ni])
+				cols.append(idxs[nj])
+				log_probs.append(math.log(probability))
+
+		rows = torch.tensor(rows, dtype=torch.int64)
+		cols = torch.tensor(cols, dtype=torch.int64)
+		log_probs = torch.tensor(log_probs, dtype=torch.float32)
+
+	else:
+		edges = _cast_as_tensor(edges, dtype=torch.float32)
+		starts = torch.log(_cast_as_tensor(starts, dtype=torch.float32))
+		ends = torch.log(_cast_as_tensor(ends, dtype=torch.float32))
+
+		rows, cols = torch.nonzero(edges, as_tuple=True)
+		log_probs = torch.log(edges[rows, cols])
+
+	offsets = torch.unique(cols - rows)
+
+	band = torch.full((n, len(offsets)), NEGINF)
+	band[rows, torch.searchsorted(offsets, cols - rows)] = log_probs
+	return band, offsets, _cast_as_parameter(starts), _cast_as_parameter(ends)
+
+
+class _BandedHMM(Distribution):
+	"""A hidden Markov model with a banded transition matrix.
+
+	A hidden Markov model is an extension of a mixture model to sequences by
+	including a transition matrix between the elements of the mixture. Each of
+	the algorithms for a hidden Markov model are essentially just a revision
+	of those algorithms to incorporate this transition matrix.
+
+	This object is a wrapper for a hidden Markov model whose transitions only
+	connect each node i to nodes i + o for a small set of offsets o, such as
+	left-to-right and profile hidden Markov models. The transition matrix is
+	stored as a (k, bandwidth) tensor where column c holds the log probability
+	of moving from each node i to node i + offsets[c], and transitions are
+	calculated by shifting the messages by each offset rather than with a
+	dense matrix multiplication or a sparse scatter.
+
+	If you pass in a dense transition matrix, the offsets are the distinct
+	values of j - i across all non-zero transitions from i to j.
+
+
+	Parameters
+	----------
+	distributions: tuple or list
+		A set of distribution objects. These objects do not need to be
+		initialized, i.e., can be "Normal()".
+
+	edges: numpy.ndarray, torch.Tensor, or None. shape=(k,k), optional
+		A dense transition matrix of probabilities for how each node or
+		distribution passed in connects to each other one. The non-zero
+		values should lie on a small number of diagonals.
+
+	starts: list, numpy.ndarray, torch.Tensor, or None. shape=(k,)
+		The probability of starting at each node. If not provided, assumes
+		these probabilities are uniform.
+
+	ends: list, numpy.ndarray, torch.Tensor, or None. shape=(k,)
+		The probability of ending at each node. If not provided, assumes
+		these probabilities are uniform.
+
+	inertia: float, [0, 1], optional
+		Indicates the proportion of the update to apply to the parameters
+		during training. When the inertia is 0.0, the update is applied in
+		its entirety and the previous parameters are ignored. When the
+		inertia is 1.0, the update is entirely ignored and the previous
+		parameters are kept, equivalently to if the parameters were frozen.
+
+	frozen: bool, optional
+		Whether all the parameters associated with this distribution are frozen.
+		If you want to freeze individual pameters, or individual values in those
+		parameters, you must modify the `frozen` attribute of the tensor or
+		parameter directly. Default is False.
+
+	checkpoint: bool, optional
+		Whether to run the forward-backward algorithm in a checkpointed mode
+		that only stores the forward messages every sqrt(length) observations
+		and recomputes the rest, summing the expected transitions as they are
+		calculated rather than storing them for every observation. This uses
+		much less memory for long sequences at the cost of running the forward
+		pass twice. Default is False.
+
+	chunk_size: int or None, optional
+		The number of observations at a time over which the probabilities of
+		each transition are calculated and summed in the forward-backward
+		algorithm. Smaller values use less memory. If None, all observations
+		are used at once. Default is None.
+
+	algorithm: str, optional
+		The implementation of the forward and backward algorithms to use. Must
+		be one of 'log', which works with log probabilities, or 'scaled', which
+		works with probabilities that are normalized at each observation and
+		only stores the log of the normalizers. Both return the same values up
+		to numerical precision but 'scaled' avoids calculating logs and
+		exponentials at each step. Default is 'log'.
+	"""
+
+	def __init__(self, nodes, edges, start, end, starts=None, ends=None,
+		max_iter=10, tol=0.1, inertia=0.0, frozen=False, checkpoint=False,
+		chunk_size=None, algorithm='log'):
+		super().__init__(inertia=inertia, frozen=frozen)
+		self.name = "_BandedHMM"
+		self.checkpoint = checkpoint
+		self.chunk_size = chunk_size
+		self.algorithm = algorithm
+
+		self.start = start
+		self.end = end
+
+		self.nodes = torch.nn.ModuleList(nodes)
+		band, offsets, self.starts, self.ends = _convert_to_banded_edges(
+			nodes, edges, starts, ends, self.start, self.end)
+
+		self.n_nodes = len(nodes)
+		self.n_edges = int(torch.isfinite(band).sum())
+
+		if torch.isinf(self.starts).sum() == len(self.starts):
+			self.starts = _cast_as_parameter(torch.log(torch.ones(
+				self.n_nodes) / self.n_nodes))
+		if torch.isinf(self.ends).sum() == len(self.ends):
+			self.ends = _cast_as_parameter(torch.log(torch.ones(
+				self.n_nodes) / self.n_nodes))
+
+		k = self.n_nodes
+		_offset_keymap = torch.full((2*k - 1,), -1, dtype=torch.int64)
+		_offset_keymap[offsets + k - 1] = torch.arange(len(offsets))
+
+		self.edges = _cast_as_parameter(band)
+		self.register_buffer("offsets", offsets)
+		self.register_buffer("_offset_keymap", _offset_keymap)
+		self._offsets = offsets.tolist()
+
+		self._reset_cache()
+
+	def _reset_cache(self):
+		"""Reset the internally stored statistics.
+
+		This method is meant to only be called internally. It resets the
+		stored statistics used to update the model parameters as well as
+		recalculates the cached values meant to speed up log probability
+		calculations.
+		"""
+
+		self.register_buffer("_xw_sum", torch.zeros(self.n_nodes,
+			len(self._offsets), dtype=torch.float32, device=self.device))
+
+		self.register_buffer("_xw_starts_sum", torch.zeros(self.n_nodes,
+			dtype=torch.float32, device=self.device))
+
+		self.register_buffer("_xw_ends_sum", torch.zeros(self.n_nodes,
+			dtype=torch.float32, device=self.device))
+
+		self.register_buffer("_edge_probs", torch.exp(self.edges))
+
+	def _shift(self, X, fill):
+		"""Align the values of each transition with the node it enters.
+
+		This method is meant to only be called internally. Given X[..., i, c],
+		a value for the transition leaving node i with offset c, it returns
+		Y[..., j, c], the value for the transition entering node j with offset
+		c, with `fill` where j - offsets[c] is not a node.
+		"""
+
+		k, Y = self.n_nodes, torch.full_like(X, fill)
+
+		for c, o in enumerate(self._offsets):
+			if o >= 0:
+				Y[..., o:, c] = X[..., :k-o, c]
+			else:
+				Y[..., :k+o, c] = X[..., -o:, c]
+
+		return Y
+
+	def _band(self, X, fill):
+		"""Gather the value of the node each transition enters.
+
+		This method is meant to only be called internally. Given X[..., j], a
+		value for each node, it returns Y[..., i, c] = X[..., i + offsets[c]],
+		the value at the node entered by the transition leaving node i with
+		offset c, with `fill` where i + offsets[c] is not a node.
+		"""
+
+		k = self.n_nodes
+		Y = torch.full((*X.shape, len(self._offsets)), fill, dtype=X.dtype,
+			device=X.device)
+
+		for c, o in enumerate(self._offsets):
+			if o >= 0:
+				Y[..., :k-o, c] = X[..., o:]
+			else:
+				Y[..., -o:, c] = X[..., :k+o]
+
+		return Y
+
+	def _forward_step(self, f, emissions, priors):
+		"""Advance the forward messages by one observation.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities for a batch at one observation and the emissions at
+		the next observation, it returns the forward log probabilities at the
+		next observation.
+		"""
+
+		k, t = self.n_nodes, self._edge_probs
+
+		f_max = torch.max(f, dim=-1, keepdims=True).values
+		p = torch.exp(f - f_max)
+
+		z = torch.zeros_like(f)
+		for c, o in enumerate(self._offsets):
+			if o >= 0:
+				z[:, o:] += p[:, :k-o] * t[:k-o, c]
+			else:
+				z[:, :k+o] += p[:, -o:] * t[-o:, c]
+
+		return torch.log(z) + f_max + emissions + priors
+
+	def _backward_step(self, b, emissions, priors):
+		"""Move the backward messages back by one observation.
+
+		This method is meant to only be called internally. Given the backward
+		log probabilities for a batch at one observation and the emissions at
+		that observation, it returns the backward log probabilities at the
+		previous observation.
+		"""
+
+		k, t = self.n_nodes, self._edge_probs
+
+		p = b + emissions + priors
+		p_max = torch.max(p, dim=-1, keepdims=True).values
+		p = torch.exp(p - p_max)
+
+		z = torch.zeros_like(b)
+		for c, o in enumerate(self._offsets):
+			if o >= 0:
+				z[:, :k-o] += p[:, o:] * t[:k-o, c]
+			else:
+				z[:, -o:] += p[:, :k+o] * t[-o:, c]
+
+		return torch.log(z) + p_max
+
+	def _transition_step(self, f, b, emissions, priors):
+		"""Return the log probabilities of each transition at one step.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities at one observation and the backward log
+		probabilities and emissions at the next observation, it returns the
+		unnormalized log probability of taking each transition between them.
+		"""
+
+		return f.unsqueeze(-1) + self.edges + self._band(b + emissions +
+			priors, NEGINF)
+
+	def _transition_probs(self):
+		"""Return the transition probabilities used by the scaled algorithms."""
+
+		return self._edge_probs
+
+	def _scaled_forward_step(self, alpha, p):
+		"""Propagate scaled forward probabilities across the transitions."""
+
+		return self._shift(alpha.unsqueeze(-1) * p, 0).sum(dim=-1)
+
+	def _scaled_backward_step(self, beta, p):
+		"""Propagate scaled backward probabilities back across the transitions."""
+
+		return (self._band(beta, 0) * p).sum(dim=-1)
+
+	@torch.inference_mode()
+	def forward(self, emissions, priors, lengths=None):
+		"""Run the forward algorithm on some data.
+
+		Runs the forward algorithm on a batch of sequences. This is not to be
+		confused with a "forward pass" when talking about neural networks. The
+		forward algorithm is a dynamic programming algorithm that begins at the
+		start state and returns the probability, over all paths through the
+		model, that result in the alignment of symbol i to node j.
+
+		Note that, as an internal method, this does not take as input the
+		actual sequence of observations but, rather, the emission probabilities
+		calculated from the sequence given the model.
+
+
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		f: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			The log probabilities calculated by the forward algorithm.
+		"""
+
+		if self.algorithm == 'scaled':
+			return _scaled_forward(self, emissions + priors, lengths=lengths)
+
+		n, l, _ = emissions.shape
+
+		f = torch.full((l, n, self.n_nodes), -inf, dtype=torch.float32,
+			device=self.device)
+		f[0] = self.starts + emissions[:, 0] + priors[:, 0]
+
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+
+		for i in range(1, l):
+			m = batch_sizes[i]
+			f[i, :m] = self._forward_step(f[i-1, :m], emissions[:m, i],
+				priors[:m, i])
+
+		f = f.permute(1, 0, 2)
+		return f
+
+	@torch.inference_mode()
+	def backward(self, emissions, priors, lengths=None):
+		"""Run the backward algorithm on some data.
+
+		Runs the backward algorithm on a batch of sequences. This is not to be
+		confused with a "backward pass" when talking about neural networks. The
+		backward algorithm is a dynamic programming algorithm that begins at end
+		of the sequence and returns the probability, over all paths through the
+		model, that result in the alignment of symbol i to node j, working
+		backwards.
+
+		Note that, as an internal method, this does not take as input the
+		actual sequence of observations but, rather, the emission probabilities
+		calculated from the sequence given the model.
+
+
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, l, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: torch.Tensor, shape=(-1, l, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		b: torch.Tensor, shape=(-1, length, self.n_nodes)
+			The log probabilities calculated by the backward algorithm.
+		"""
+
+		if self.algorithm == 'scaled':
+			return _scaled_backward(self, emissions + priors, lengths=lengths)
+
+		n, l, _ = emissions.shape
+
+		b = torch.full((l, n, self.n_nodes), -inf, dtype=torch.float32,
+			device=self.device)
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+		b[-1, :batch_sizes[-1]] = self.ends
+
+		for i in range(l-2, -1, -1):
+			m = batch_sizes[i+1]
+			b[i, :m] = self._backward_step(b[i+1, :m], emissions[:m, i+1],
+				priors[:m, i+1])
+			b[i, m:batch_sizes[i]] = self.ends
+
+		b = b.permute(1, 0, 2)
+		return b
+
+	@torch.inference_mode()
+	def viterbi(self, emissions, priors, lengths=None):
+		"""Run the Viterbi algorithm on some data.
+
+		Runs the Viterbi algorithm on a batch of sequences. The Viterbi
+		algorithm is a dynamic programming algorithm that, rather than summing
+		over all paths through the model like the forward algorithm, only keeps
+		the most likely path to each node. Backpointers are stored for each
+		observation and are used at the end to recover the single most likely
+		path through the model, also known as the maximum a posteriori path.
+
+		Note that, as an internal method, this does not take as input the
+		actual sequence of observations but, rather, the emission probabilities
+		calculated from the sequence given the model.
+
+
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		path: torch.Tensor, shape=(-1, -1), dtype=torch.int64
+			The node that each observation is aligned to in the most likely
+			path through the model.
+
+		logp: torch.Tensor, shape=(-1,)
+			The log probability of the most likely path for each example.
+		"""
+
+		n, l, _ = emissions.shape
+		dtype = torch.int16 if self.n_nodes < 2 ** 15 else torch.int32
+
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+		nodes = torch.arange(self.n_nodes, device=self.device)
+
+		ptr = nodes.type(dtype).expand(l, n, -1).clone()
+		v = self.starts + emissions[:, 0] + priors[:, 0]
+
+		for i in range(1, l):
+			m = batch_sizes[i]
+
+			p = self._shift(v[:m].unsqueeze(-1) + self.edges, NEGINF)
+			v_, idxs = torch.max(p, dim=-1)
+
+			v[:m] = v_ + emissions[:m, i] + priors[:m, i]
+			ptr[i, :m] = (nodes - self.offsets[idxs]).clamp_(0,
+				self.n_nodes-1).type(dtype)
+
+		logp, state = torch.max(v + self.ends, dim=1)
+
+		path = torch.empty(l, n, dtype=torch.int64, device=self.device)
+		path[-1] = state
+
+		for i in range(l-1, 0, -1):
+			state = ptr[i].gather(1, state.unsqueeze(-1))[:, 0].type(torch.int64)
+			path[i-1] = state
+
+		return path.T, logp
+
+	@torch.inference_mode()
+	def forward_backward(self, emissions, priors, lengths=None):
+		"""Run the forward-backward algorithm on some data.
+
+		Runs the forward-backward algorithm on a batch of sequences. This
+		algorithm combines the best of the forward and the backward algorithm.
+		It combines the probability of starting at the beginning of the sequence
+		and working your way to each observation with the probability of
+		starting at the end of the sequence and working your way backward to it.
+
+		A number of statistics can be calculated using this information. These
+		statistics are powerful inference tools but are also used during the
+		Baum-Welch training process.
+
+
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		transitions: torch.Tensor, shape=(-1, self.n_nodes, len(self.offsets))
+			The expected number of transitions across each edge that occur
+			for each example, in the same banded layout as `edges`.
+
+		responsibility: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			The posterior probabilities of each observation belonging to each
+			state given that one starts at the beginning of the sequence,
+			aligns observations across all paths to get to the current
+			observation, and then proceeds to align all remaining observations
+			until the end of the sequence.
+
+		starts: torch.Tensor, shape=(-1, self.n_nodes)
+			The probabilities of starting at each node given the
+			forward-backward algorithm.
+
+		ends: torch.Tensor, shape=(-1, self.n_nodes)
+			The probabilities of ending at each node given the forward-backward
+			algorithm.
+
+		logp: torch.Tensor, shape=(-1,)
+			The log probabilities of each sequence given the model.
+		"""
+
+		if self.checkpoint:
+			return _checkpointed_forward_backward(self, emissions, priors,
+				lengths=lengths)
+
+		n, l, _ = emissions.shape
+		f = self.forward(emissions, priors=priors, lengths=lengths)
+		b = self.backward(emissions, priors=priors, lengths=lengths)
+
+		if lengths is None:
+			f_last = f[:, -1]
+		else:
+			f_last = f[torch.arange(n), lengths-1]
+
+		logp = torch.logsumexp(f_last + self.ends, dim=1)
+
+		t = torch.full((n, *self.edges.shape), -inf, device=self.device)
+		chunk_size = self.chunk_size or max(l-1, 1)
+
+		for c in range(0, l-1, chunk_size):
+			i, j = c + 1, min(c + chunk_size, l-1) + 1
+
+			t_ = self._transition_step(f[:, i-1:j-1], b[:, i:j],
+				emissions[:, i:j], priors[:, i:j])
+			t = torch.logaddexp(t, torch.logsumexp(t_, dim=1))
+
+		t = torch.exp(t - logp.reshape(n, 1, 1))
+
+		starts = self.starts + emissions[:, 0] + priors[:, 0] + b[:, 0]
+		starts = torch.exp(starts.T - torch.logsumexp(starts, dim=-1)).T
+
+		ends = self.ends + f_last
+		ends = torch.exp(ends.T - torch.logsumexp(ends, dim=-1)).T
+
+		r = f + b
+		r = (r - torch.logsumexp(r, dim=2).reshape(n, -1, 1))
+
+		if lengths is not None:
+			mask = torch.arange(l, device=self.device) < lengths.unsqueeze(1)
+			r[~mask] = -inf
+
+		return t, r, starts, ends, logp
+
+	def _labeled_summarize(self, X, y, lengths=None):
+		"""Extract sufficient statistics given a set of labels.
+
+		This method calculates the sufficient statistics from data where the
+		observations have labels. This amounts to essentially counting the
+		number of times that each transition occurs and creating a banded
+		update matrix.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A set of examples to summarize.
+
+		y: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, length, self.d)
+			A set of labels with the same shape as the observations that
+			indicate which node each observation came from. Passing this in
+			means that the model uses labeled learning instead of Baum-Welch.
+			Default is None.
+		"""
+
+		y = _check_parameter(_cast_as_tensor(y), "y", ndim=2, min_value=0,
+			max_value=self.n_nodes-1, dtypes=(torch.int32, torch.int64),
+			shape=(X.shape[0], X.shape[1]))
+
+		n, l, d = X.shape
+		k, c = self.edges.shape
+		y = y.type(torch.int64).to(self.device)
+
+		starts = torch.zeros(n, self.n_nodes, device=self.device)
+		starts[torch.arange(n), y[:, 0]] = 1
+
+		if lengths is None:
+			lengths = torch.full((n,), l, device=self.device)
+
+		ends = torch.zeros_like(starts)
+		ends[torch.arange(n), y[torch.arange(n), lengths-1]] = 1
+
+		w = torch.arange(1, l, device=self.device) < lengths.unsqueeze(1)
+
+		offsets = self._offset_keymap[y[:, 1:] - y[:, :-1] + k - 1]
+		missing = (offsets == -1) | torch.isinf(self.edges[y[:, :-1],
+			offsets.clamp(min=0)])
+
+		if torch.any(missing[w]):
+			raise ValueError("Parameter y contains a transition that is not " +
+				"an edge in the model.")
+
+		idxs = y[:, :-1] * c + offsets.clamp(min=0)
+		idxs = idxs + torch.arange(n, device=self.device).unsqueeze(1) * k * c
+
+		t = torch.bincount(idxs.reshape(-1), weights=w.reshape(-1).type(
+			torch.float32), minlength=n*k*c)
+		t = t.reshape(n, k, c)
+
+		r = torch.full((n, l, self.n_nodes), -inf, device=self.device)
+		r.scatter_(2, y.unsqueeze(-1), 0)
+
+		if self._initialized:
+			logps = self.log_probability(X)
+		else:
+			logps = torch.zeros(n, device=self.device)
+
+		return t, r, starts, ends, logps
+
+	def summarize(self, X, y=None, sample_weight=None, emissions=None,
+		priors=None, lengths=None):
+		"""Extract the sufficient statistics from a batch of data.
+
+		This method calculates the sufficient statistics from optionally
+		weighted data and adds them to the stored cache. The examples must be
+		given in a 2D format. Sample weights can either be provided as one
+		value per example or as a 2D matrix of weights for each feature in
+		each example.
+
+
+		Parameters
+		----------
+		X: torch.Tensor, shape=(-1, -1, self.d)
+			A set of examples to summarize.
+
+		y: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len), optional
+			A set of labels with the same number of examples and length as the
+			observations that indicate which node in the model that each
+			observation should be assigned to. Passing this in means that the
+			model uses labeled training instead of Baum-Welch. Default is None.
+
+		sample_weight: torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: torch.Tensor, shape=(-1, -1, self.d)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+		"""
+
+		if y is None:
+			t, r, starts, ends, logps = self.forward_backward(emissions,
+				priors=priors, lengths=lengths)
+		else:
+			t, r, starts, ends, logps = self._labeled_summarize(X, y=y,
+				lengths=lengths)
+
+		self._xw_starts_sum += torch.sum(starts * sample_weight, dim=0)
+		self._xw_ends_sum += torch.sum(ends * sample_weight, dim=0)
+		self._xw_sum += torch.sum(t * sample_weight.unsqueeze(-1), dim=0)
+
+		r = torch.exp(r) * sample_weight.unsqueeze(-1)
+
+		if lengths is None:
+			X = X.reshape(-1, X.shape[-1])
+			r = r.reshape(-1, r.shape[-1])
+		else:
+			mask = torch.arange(X.shape[1], device=self.device) < \
+				lengths.unsqueeze(1)
+			X, r = X[mask], r[mask]
+
+		for i, node in enumerate(self.nodes):
+			w = r[:, i].reshape(-1, 1)
+			node.distribution.summarize(X, sample_weight=w)
+
+		return logps
+
+	def from_summaries(self):
+		"""Update the model parameters given the extracted statistics.
+
+		This method uses calculated statistics from calls to the `summarize`
+		method to update the distribution parameters. Hyperparameters for the
+		update are passed in at initialization time.
+
+		Note: Internally, a call to `fit` is just a successive call to the
+		`summarize` method followed by the `from_summaries` method.
+		"""
+
+		for node in self.nodes:
+			node.distribution.from_summaries()
+
+		if self.frozen:
+			return
+
+		node_out_count = torch.sum(self._xw_sum, dim=1, keepdims=True)
+		node_out_count += self._xw_ends_sum.unsqueeze(1)
+
+		ends = torch.log(self._xw_ends_sum / node_out_count[:,0])
+		starts = torch.log(self._xw_starts_sum / self._xw_starts_sum.sum())
+		edges = torch.log(self._xw_sum / node_out_count)
+
+		_update_parameter(self.ends, ends, inertia=self.inertia)
+		_update_parameter(self.starts, starts, inertia=self.inertia)
+		_update_parameter(self.edges, edges, inertia=self.inertia)
+		self._reset_cache()
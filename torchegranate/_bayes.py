@@ -10,6 +10,253 @@ from ._utils import _check_parameter
 from ._utils import _reshape_weights
 
 from .distributions._distribution import Distribution
+from .distributions.normal import LOG_2_PI
+
+
+def _stacked_family(distributions):
+	"""Return the shared family of a set of distributions, if there is one.
+
+	The emission matrix and the sufficient statistics of a set of
+	distributions can be calculated in a single batched operation when all
+	of the distributions are of the same supported type, are initialized, and
+	have the cached values needed for calculating log probabilities. This
+	function checks whether that is the case.
+
+
+	Parameters
+	----------
+	distributions: list, tuple, torch.nn.ModuleList
+		A set of distribution objects.
+
+
+	Returns
+	-------
+	family: str or None
+		The name of the shared family, e.g. 'Normal-diag', or None if the
+		distributions cannot be stacked.
+	"""
+
+	d0 = distributions[0]
+	if d0.name not in ("Normal", "Exponential", "Poisson", "Bernoulli"):
+		return None
+
+	family = d0.name
+	if family == "Normal":
+		family = "Normal-{}".format(d0.covariance_type)
+
+	for d in distributions:
+		if type(d) is not type(d0) or d._initialized == False:
+			return None
+
+		if family.startswith("Normal"):
+			if d.covariance_type != d0.covariance_type:
+				return None
+
+			if family == "Normal-full" and not hasattr(d, "_inv_cov"):
+				return None
+			elif family != "Normal-full" and not hasattr(d, "_inv_two_sigma"):
+				return None
+
+	return family
+
+
+def _stacked_dtype(distributions, family):
+	"""Return the dtype of the parameters of a set of stacked distributions.
+
+	The data, responsibilities, and weights are cast to this dtype before
+	the batched operations so that, e.g., float64 distributions are not
+	multiplied with the float32 weights.
+
+
+	Parameters
+	----------
+	distributions: list, tuple, torch.nn.ModuleList
+		A set of distribution objects from the same family.
+
+	family: str
+		The name of the shared family, as returned by `_stacked_family`.
+
+
+	Returns
+	-------
+	dtype: torch.dtype
+		The dtype of the parameters of the first distribution.
+	"""
+
+	d0 = distributions[0]
+	if family.startswith("Normal"):
+		return d0.means.dtype
+	elif family == "Exponential":
+		return d0.scales.dtype
+	elif family == "Poisson":
+		return d0.lambdas.dtype
+	return d0.probs.dtype
+
+
+def _stacked_log_probability(distributions, X):
+	"""Calculate the log probability of each example under each distribution.
+
+	This function stacks the parameters of a set of distributions from the
+	same family into one tensor each, e.g. a (k, d) tensor of means, and
+	then calculates the log probability of every example under every
+	distribution at the same time using matrix multiplications. This gives
+	the same result as calling `log_probability` on each distribution
+	separately but uses a handful of kernels instead of k.
+
+
+	Parameters
+	----------
+	distributions: list, tuple, torch.nn.ModuleList
+		A set of distribution objects from the same family.
+
+	X: torch.Tensor, shape=(-1, d)
+		A set of examples to evaluate.
+
+
+	Returns
+	-------
+	logp: torch.Tensor, shape=(-1, k) or None
+		The log probability of each example under each distribution, or None
+		if the distributions cannot be stacked.
+	"""
+
+	if isinstance(X, torch.masked.MaskedTensor):
+		return None
+
+	family = _stacked_family(distributions)
+	if family is None:
+		return None
+
+	d = X.shape[1]
+
+	if family == "Normal-full":
+		X = _cast_as_tensor(X, dtype=distributions[0].means.dtype)
+
+		inv_covs = torch.stack([dist._inv_cov for dist in distributions])
+		inv_cov_dot_mus = torch.stack([dist._inv_cov_dot_mu 
+			for dist in distributions])
+		log_dets = torch.stack([dist._log_det for dist in distributions])
+
+		logp = torch.matmul(X, inv_covs.transpose(0, 1).reshape(d, -1))
+		logp = logp.reshape(X.shape[0], -1, d) - inv_cov_dot_mus
+		logp = d * LOG_2_PI + torch.sum(logp ** 2, dim=-1)
+		return log_dets - 0.5 * logp
+
+	elif family in ("Normal-diag", "Normal-sphere"):
+		X = _cast_as_tensor(X, dtype=distributions[0].means.dtype)
+
+		means = torch.stack([dist.means.expand(d) for dist in distributions])
+		log_sigmas = torch.stack([dist._log_sigma_sqrt_2pi.expand(d) 
+			for dist in distributions])
+		inv_two_sigmas = torch.stack([dist._inv_two_sigma.expand(d) 
+			for dist in distributions])
+
+		logp = torch.sum((X.unsqueeze(1) - means) ** 2 * inv_two_sigmas, 
+			dim=-1)
+		return torch.sum(log_sigmas, dim=1) - logp
+
+	elif family == "Exponential":
+		X = _check_parameter(X, "X", min_value=0.0)
+		X = _cast_as_tensor(X, dtype=distributions[0].scales.dtype)
+
+		scales = torch.stack([dist.scales for dist in distributions])
+		log_scales = torch.stack([dist._log_scales for dist in distributions])
+		return -torch.sum(log_scales, dim=1) - torch.matmul(X, 1. / scales.T)
+
+	elif family == "Poisson":
+		X = _check_parameter(X, "X", min_value=0.0)
+		X = _cast_as_tensor(X, dtype=distributions[0].lambdas.dtype)
+
+		lambdas = torch.stack([dist.lambdas for dist in distributions])
+		log_lambdas = torch.stack([dist._log_lambdas 
+			for dist in distributions])
+
+		logp = torch.matmul(X, log_lambdas.T) - torch.sum(lambdas, dim=1)
+		return logp - torch.sum(torch.lgamma(X+1), dim=1, keepdims=True)
+
+	elif family == "Bernoulli":
+		X = _check_parameter(X, "X", value_set=(0, 1))
+		X = _cast_as_tensor(X, dtype=distributions[0].probs.dtype)
+
+		log_probs = torch.stack([dist._log_probs for dist in distributions])
+		log_inv_probs = torch.stack([dist._log_inv_probs 
+			for dist in distributions])
+		return torch.matmul(X, log_probs.T) + torch.matmul(1-X, 
+			log_inv_probs.T)
+
+
+def _stacked_summarize(distributions, X, y, sample_weight):
+	"""Extract the sufficient statistics for a set of distributions at once.
+
+	This function takes in a responsibility matrix, where each column holds
+	the weights of the examples for one distribution, and adds the weighted
+	sufficient statistics to the cache of every distribution using a few
+	matrix multiplications. This is equivalent to calling `summarize` on
+	each distribution with `y[:, i:i+1] * sample_weight` as the weights, but
+	the data is only checked, weighted, and squared once.
+
+	Frozen distributions are skipped, as they would be in `summarize`.
+
+
+	Parameters
+	----------
+	distributions: list, tuple, torch.nn.ModuleList
+		A set of distribution objects from the same family.
+
+	X: torch.Tensor, shape=(-1, d)
+		A set of examples to summarize.
+
+	y: torch.Tensor, shape=(-1, k)
+		The weight of each example for each distribution.
+
+	sample_weight: torch.Tensor, shape=(-1, d)
+		The weight of each feature in each example.
+
+
+	Returns
+	-------
+	w_sum: torch.Tensor, shape=(k, d) or None
+		The total weight assigned to each distribution for each feature, or
+		None if the distributions cannot be stacked.
+	"""
+
+	if isinstance(X, torch.masked.MaskedTensor):
+		return None
+
+	family = _stacked_family(distributions)
+	if family is None:
+		return None
+
+	dtype = _stacked_dtype(distributions, family)
+	X = _cast_as_tensor(X, dtype=dtype)
+	y = _cast_as_tensor(y, dtype=dtype)
+	sample_weight = _cast_as_tensor(sample_weight, dtype=dtype)
+
+	if family in ("Exponential", "Poisson"):
+		X = _check_parameter(X, "X", min_value=0)
+	elif family == "Bernoulli":
+		X = _check_parameter(X, "X", value_set=(0, 1))
+
+	Xw = X * sample_weight
+	w_sum = torch.matmul(y.T, sample_weight)
+	xw_sum = torch.matmul(y.T, Xw)
+
+	if family == "Normal-full":
+		xxw_sum = torch.einsum("nk,ni,nj->kij", y, Xw, X)
+	elif family in ("Normal-diag", "Normal-sphere"):
+		xxw_sum = torch.matmul(y.T, Xw * X)
+
+	for i, d in enumerate(distributions):
+		if d.frozen == True:
+			continue
+
+		d._w_sum[:] = d._w_sum + w_sum[i]
+		d._xw_sum[:] = d._xw_sum + xw_sum[i]
+
+		if family.startswith("Normal"):
+			d._xxw_sum[:] = d._xxw_sum + xxw_sum[i]
+
+	return w_sum
 
 
 class BayesMixin(torch.nn.Module):
@@ -51,9 +298,11 @@ class BayesMixin(torch.nn.Module):
 		X = _check_parameter(_cast_as_tensor(X), "X", ndim=2, 
 			shape=(-1, self.d))
 
-		e = torch.empty(X.shape[0], self.k, device=self.device)
-		for i, d in enumerate(self.distributions):
-			e[:, i] = d.log_probability(X)
+		e = _stacked_log_probability(self.distributions, X)
+		if e is None:
+			e = torch.empty(X.shape[0], self.k, device=self.device)
+			for i, d in enumerate(self.distributions):
+				e[:, i] = d.log_probability(X)
 
 		return e + self._log_priors
 
@@ -6,6 +6,13 @@ from ._utils import _cast_as_tensor
 from ._utils import _cast_as_parameter
 from ._utils import _update_parameter
 from ._utils import _check_parameter
+from ._utils import _active_batch_sizes
+from ._utils import _checkpointed_forward_backward
+from ._utils import _scaled_forward
+from ._utils import _scaled_backward
+from ._utils import _scan_forward
+from ._utils import _scan_backward
+from ._utils import _scan_viterbi
 
 from .distributions._distribution import Distribution
 
@@ -29,25 +36,23 @@ def _convert_to_dense_edges(nodes, edges, starts, ends, start, end):
 		return edges, starts, ends
 
 	else:
-		starts = _cast_as_parameter(torch.full(n, -inf))
-		ends = _cast_as_parameter(torch.full(n, -inf))
-		_edges = _cast_as_parameter(torch.full((n, n), -inf))
+		idxs = {node: i for i, node in enumerate(nodes)}
+
+		starts = torch.full((n,), -inf)
+		ends = torch.full((n,), -inf)
+		_edges = torch.full((n, n), -inf)
 		for ni, nj, probability in edges:
 			if ni == start:
-				j = nodes.index(nj)
-				starts[j] = math.log(probability)
+				starts[idxs[nj]] = math.log(probability)
 			
 			elif nj == end:
-				i = nodes.index(ni)
-				ends[i] = math.log(probability)
+				ends[idxs[ni]] = math.log(probability)
 
 			else:
-				i = nodes.index(ni)
-				j = nodes.index(nj)
-
-				_edges[i, j] = math.log(probability)
+				_edges[idxs[ni], idxs[nj]] = math.log(probability)
 
-		return _edges, starts, ends
+		return (_cast_as_parameter(_edges), _cast_as_parameter(starts), 
+			_cast_as_parameter(ends))
 
 
 class _DenseHMM(Distribution):
@@ -109,13 +114,44 @@ class _DenseHMM(Distribution):
 		If you want to freeze individual pameters, or individual values in those
 		parameters, you must modify the `frozen` attribute of the tensor or
 		parameter directly. Default is False.
+
+	checkpoint: bool, optional
+		Whether to run the forward-backward algorithm in a checkpointed mode
+		that only stores the forward messages every sqrt(length) observations
+		and recomputes the rest, summing the expected transitions as they are
+		calculated rather than storing them for every observation. This uses
+		much less memory for long sequences at the cost of running the forward
+		pass twice. Default is False.
+
+	chunk_size: int or None, optional
+		The number of observations at a time over which the probabilities of
+		each transition are calculated and summed in the forward-backward
+		algorithm. Smaller values use less memory. If None, all observations
+		are used at once. Default is None.
+
+	algorithm: str, optional
+		The implementation of the forward and backward algorithms to use. Must
+		be one of 'log', which works with log probabilities, or 'scaled', which
+		works with probabilities that are normalized at each observation and
+		only stores the log of the normalizers, or 'scan', which calculates
+		the messages at every observation at once using a parallel scan over
+		the products of the transition matrices of each step. All return the
+		same values up to numerical precision. 'scaled' avoids calculating
+		logs and exponentials at each step and 'scan', which also applies to
+		the Viterbi algorithm, does O(log l) batched steps rather than l
+		sequential ones at the cost of O(l k^3 log l) work and O(n l k^2)
+		memory, which is useful for a few long sequences. Default is 'log'.
 	"""
 
 
 	def __init__(self, nodes, edges, start, end, starts=None, ends=None, 
-		max_iter=10, tol=0.1, inertia=0.0, frozen=False):
+		max_iter=10, tol=0.1, inertia=0.0, frozen=False, checkpoint=False,
+		chunk_size=None, algorithm='log'):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "_DenseHMM"
+		self.checkpoint = checkpoint
+		self.chunk_size = chunk_size
+		self.algorithm = algorithm
 
 		self.start = start
 		self.end = end
@@ -128,11 +164,11 @@ class _DenseHMM(Distribution):
 		self.n_edges = len(edges)
 
 		if torch.isinf(self.starts).sum() == len(self.starts):
-			self.starts = _cast_as_parameter(torch.ones(self.n_nodes) 
-				/ self.n_nodes)
+			self.starts = _cast_as_parameter(torch.log(torch.ones(
+				self.n_nodes) / self.n_nodes))
 		if torch.isinf(self.ends).sum() == len(self.ends):
-			self.ends = _cast_as_parameter(torch.ones(self.n_nodes) 
-				/ self.n_nodes)
+			self.ends = _cast_as_parameter(torch.log(torch.ones(
+				self.n_nodes) / self.n_nodes))
 
 		self._reset_cache()
 
@@ -155,8 +191,67 @@ class _DenseHMM(Distribution):
 			dtype=torch.float32, requires_grad=False, device=self.device))
 
 
+	def _forward_step(self, f, emissions, priors):
+		"""Advance the forward messages by one observation.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities for a batch at one observation and the emissions at
+		the next observation, it returns the forward log probabilities at the
+		next observation.
+		"""
+
+		t_max = self.edges.max()
+		t = torch.exp(self.edges - t_max)
+
+		p_max = torch.max(f, dim=1, keepdims=True).values
+		p = torch.exp(f - p_max)
+		return torch.log(torch.matmul(p, t)) + t_max + p_max + emissions
+
+	def _backward_step(self, b, emissions, priors):
+		"""Move the backward messages back by one observation.
+
+		This method is meant to only be called internally. Given the backward
+		log probabilities for a batch at one observation and the emissions at
+		that observation, it returns the backward log probabilities at the
+		previous observation.
+		"""
+
+		t_max = self.edges.max()
+		t = torch.exp(self.edges.T - t_max)
+
+		p = b + emissions
+		p_max = torch.max(p, dim=1, keepdims=True).values
+		p = torch.exp(p - p_max)
+		return torch.log(torch.matmul(p, t)) + t_max + p_max
+
+	def _transition_step(self, f, b, emissions, priors):
+		"""Return the log probabilities of each transition at one step.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities at one observation and the backward log
+		probabilities and emissions at the next observation, it returns the
+		unnormalized log probability of taking each transition between them.
+		"""
+
+		return f.unsqueeze(-1) + self.edges + (b + emissions).unsqueeze(-2)
+
+	def _transition_probs(self):
+		"""Return the transition probabilities used by the scaled algorithms."""
+
+		return torch.exp(self.edges)
+
+	def _scaled_forward_step(self, alpha, p):
+		"""Propagate scaled forward probabilities across the transitions."""
+
+		return torch.matmul(alpha, p)
+
+	def _scaled_backward_step(self, beta, p):
+		"""Propagate scaled backward probabilities back across the transitions."""
+
+		return torch.matmul(beta, p.T)
+
 	@torch.inference_mode()
-	def forward(self, emissions, priors):
+	def forward(self, emissions, priors, lengths=None):
 		"""Run the forward algorithm on some data.
 
 		Runs the forward algorithm on a batch of sequences. This is not to be
@@ -184,6 +279,12 @@ class _DenseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -191,7 +292,16 @@ class _DenseHMM(Distribution):
 			The log probabilities calculated by the forward algorithm.
 		"""
 
-		l = emissions.shape[1]
+		if self.algorithm in ('scaled', 'scan'):
+			emissions = torch.clone(emissions)
+			emissions[:, 0] += priors[:, 0]
+
+			if self.algorithm == 'scaled':
+				return _scaled_forward(self, emissions, lengths=lengths)
+			return _scan_forward(self, emissions, lengths=lengths)
+
+		n, l, _ = emissions.shape
+		batch_sizes = _active_batch_sizes(lengths, n, l)
 
 		t_max = self.edges.max()
 		t = torch.exp(self.edges - t_max)
@@ -200,15 +310,18 @@ class _DenseHMM(Distribution):
 		f[1:] += t_max
 
 		for i in range(1, l):
-			p_max = torch.max(f[i-1], dim=1, keepdims=True).values
-			p = torch.exp(f[i-1] - p_max)
-			f[i] += torch.log(torch.matmul(p, t)) + p_max
+			m = batch_sizes[i]
+
+			p_max = torch.max(f[i-1, :m], dim=1, keepdims=True).values
+			p = torch.exp(f[i-1, :m] - p_max)
+			f[i, :m] += torch.log(torch.matmul(p, t)) + p_max
+			f[i, m:] = NEGINF
 
 		f = f.permute(1, 0, 2)
 		return f
 
 	@torch.inference_mode()
-	def backward(self, emissions, priors):
+	def backward(self, emissions, priors, lengths=None):
 		"""Run the backward algorithm on some data.
 
 		Runs the backward algorithm on a batch of sequences. This is not to be
@@ -237,6 +350,12 @@ class _DenseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -244,26 +363,113 @@ class _DenseHMM(Distribution):
 			The log probabilities calculated by the backward algorithm.
 		"""
 
+		if self.algorithm == 'scaled':
+			return _scaled_backward(self, emissions, lengths=lengths)
+		elif self.algorithm == 'scan':
+			return _scan_backward(self, emissions, lengths=lengths)
+
 		n, l, _ = emissions.shape
 
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+
 		b = torch.zeros(l, n, self.n_nodes, dtype=torch.float32, device=self.device) + float("-inf")
-		b[-1] = self.ends
+		b[-1, :batch_sizes[-1]] = self.ends
 
 		t_max = self.edges.max()
 		t = torch.exp(self.edges.T - t_max)
 
 		for i in range(l-2, -1, -1):
-			p = b[i+1] + emissions[:, i+1]
+			m = batch_sizes[i+1]
+
+			p = b[i+1, :m] + emissions[:m, i+1]
 			p_max = torch.max(p, dim=1, keepdims=True).values
 			p = torch.exp(p - p_max)
 
-			b[i] = torch.log(torch.matmul(p, t)) + t_max + p_max
+			b[i, :m] = torch.log(torch.matmul(p, t)) + t_max + p_max
+			b[i, m:batch_sizes[i]] = self.ends
 
 		b = b.permute(1, 0, 2)
 		return b
 
 	@torch.inference_mode()
-	def forward_backward(self, emissions, priors):
+	def viterbi(self, emissions, priors, lengths=None):
+		"""Run the Viterbi algorithm on some data.
+
+		Runs the Viterbi algorithm on a batch of sequences. The Viterbi
+		algorithm is a dynamic programming algorithm that, rather than summing
+		over all paths through the model like the forward algorithm, only keeps
+		the most likely path to each node. Backpointers are stored for each
+		observation and are used at the end to recover the single most likely
+		path through the model, also known as the maximum a posteriori path.
+
+		Note that, as an internal method, this does not take as input the
+		actual sequence of observations but, rather, the emission probabilities
+		calculated from the sequence given the model.
+
+		
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability 
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call. 		
+
+		priors: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		path: torch.Tensor, shape=(-1, -1), dtype=torch.int64
+			The node that each observation is aligned to in the most likely
+			path through the model.
+
+		logp: torch.Tensor, shape=(-1,)
+			The log probability of the most likely path for each example.
+		"""
+
+		if self.algorithm == 'scan':
+			return _scan_viterbi(self, emissions + priors, lengths=lengths)
+
+		n, l, _ = emissions.shape
+		dtype = torch.int16 if self.n_nodes < 2 ** 15 else torch.int32
+
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+
+		ptr = torch.arange(self.n_nodes, dtype=dtype, device=self.device)
+		ptr = ptr.expand(l, n, -1).clone()
+		v = self.starts + emissions[:, 0] + priors[:, 0]
+
+		for i in range(1, l):
+			m = batch_sizes[i]
+
+			v_, idxs = torch.max(v[:m].unsqueeze(-1) + self.edges, dim=1)
+			v[:m] = v_ + emissions[:m, i] + priors[:m, i]
+			ptr[i, :m] = idxs
+
+		logp, state = torch.max(v + self.ends, dim=1)
+
+		path = torch.empty(l, n, dtype=torch.int64, device=self.device)
+		path[-1] = state
+
+		for i in range(l-1, 0, -1):
+			state = ptr[i].gather(1, state.unsqueeze(-1))[:, 0].type(torch.int64)
+			path[i-1] = state
+
+		return path.T, logp
+
+	@torch.inference_mode()
+	def forward_backward(self, emissions, priors, lengths=None):
 		"""Run the forward-backward algorithm on some data.
 
 		Runs the forward-backward algorithm on a batch of sequences. This
@@ -291,6 +497,12 @@ class _DenseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -319,32 +531,55 @@ class _DenseHMM(Distribution):
 			The log probabilities of each sequence given the model.
 		"""
 
+		if self.checkpoint:
+			return _checkpointed_forward_backward(self, emissions, priors, 
+				lengths=lengths)
+
 		n, l, _ = emissions.shape
 
-		f = self.forward(emissions, priors=priors)
-		b = self.backward(emissions, priors=priors)
+		f = self.forward(emissions, priors=priors, lengths=lengths)
+		b = self.backward(emissions, priors=priors, lengths=lengths)
 
-		logp = torch.logsumexp(f[:, -1] + self.ends, dim=1)
+		if lengths is None:
+			f_last = f[:, -1]
+		else:
+			f_last = f[torch.arange(n), lengths-1]
 
-		f_ = f[:, :-1].unsqueeze(-1)
-		b_ = (b[:, 1:] + emissions[:, 1:]).unsqueeze(-2)
+		logp = torch.logsumexp(f_last + self.ends, dim=1)
 
-		t = f_ + b_ + self.edges.unsqueeze(0).unsqueeze(0)
-		t = t.reshape(n, l-1, -1)
-		t = torch.exp(torch.logsumexp(t, dim=1).T - logp).T
-		t = t.reshape(n, int(t.shape[1] ** 0.5), -1)
+		t = torch.full((n, self.n_nodes * self.n_nodes), NEGINF, 
+			device=self.device)
+		chunk_size = self.chunk_size or max(l-1, 1)
+
+		for c in range(0, l-1, chunk_size):
+			i, j = c + 1, min(c + chunk_size, l-1) + 1
+
+			f_ = f[:, i-1:j-1].unsqueeze(-1)
+			b_ = (b[:, i:j] + emissions[:, i:j]).unsqueeze(-2)
+
+			t_ = f_ + b_ + self.edges.unsqueeze(0).unsqueeze(0)
+			t_ = t_.reshape(n, j-i, self.n_nodes * self.n_nodes)
+			t = torch.logaddexp(t, torch.logsumexp(t_, dim=1))
+
+		t = torch.exp(t.T - logp).T
+		t = t.reshape(n, self.n_nodes, self.n_nodes)
 
 		starts = self.starts + emissions[:, 0] + priors[:, 0] + b[:, 0]
 		starts = torch.exp(starts.T - torch.logsumexp(starts, dim=-1)).T
 
-		ends = self.ends + f[:, -1]
+		ends = self.ends + f_last
 		ends = torch.exp(ends.T - torch.logsumexp(ends, dim=-1)).T
 
 		r = f + b
 		r = r - torch.logsumexp(r, dim=2).reshape(n, -1, 1)
+
+		if lengths is not None:
+			mask = torch.arange(l, device=self.device) < lengths.unsqueeze(1)
+			r[~mask] = NEGINF
+
 		return t, r, starts, ends, logp
 
-	def _labeled_summarize(self, X, y):
+	def _labeled_summarize(self, X, y, lengths=None):
 		"""Extract sufficient statistics given a set of labels.
 
 		This method calculates the sufficient statistics from data where the
@@ -373,22 +608,28 @@ class _DenseHMM(Distribution):
 			shape=(X.shape[0], X.shape[1]))
 
 		n, l, d = X.shape
+		k = self.n_nodes
+		y = y.type(torch.int64)
 
 		starts = torch.zeros(n, self.n_nodes, device=self.device)
 		starts[torch.arange(n), y[:, 0]] = 1 
 
+		if lengths is None:
+			lengths = torch.full((n,), l, device=y.device)
+
 		ends = torch.zeros_like(starts)
-		ends[torch.arange(n), y[:, -1]] = 1
+		ends[torch.arange(n), y[torch.arange(n), lengths-1]] = 1
 
-		t = torch.zeros((n, self.n_nodes, self.n_nodes), device=self.device)
-		r = torch.zeros(n, l, self.n_nodes, device=self.device) - inf
+		idxs = y[:, :-1] * k + y[:, 1:]
+		idxs = idxs + torch.arange(n, device=idxs.device).unsqueeze(1) * k * k
 
-		for i in range(n):
-			for j in range(l-1):
-				t[i][y[i, j], y[i, j+1]] += 1
-				r[i, j, y[i, j]] = 0
+		w = torch.arange(1, l, device=y.device) < lengths.unsqueeze(1)
+		t = torch.bincount(idxs.reshape(-1), weights=w.reshape(-1).type(
+			torch.float32), minlength=n*k*k)
+		t = t.reshape(n, k, k).to(self.device)
 
-			r[i, l-1, y[i, l-1]] = 0
+		r = torch.full((n, l, k), -inf, device=self.device)
+		r.scatter_(2, y.unsqueeze(-1).to(self.device), 0)
 
 		if self._initialized:
 			logps = self.log_probability(X)
@@ -398,7 +639,7 @@ class _DenseHMM(Distribution):
 		return t, r, starts, ends, logps
 
 	def summarize(self, X, y=None, sample_weight=None, emissions=None, 
-		priors=None):
+		priors=None, lengths=None):
 		"""Extract the sufficient statistics from a batch of data.
 
 		This method calculates the sufficient statistics from optionally
@@ -434,23 +675,37 @@ class _DenseHMM(Distribution):
 			provided, do not include in the calculations (conceptually
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
 		"""
 
 		if y is None:
 			t, r, starts, ends, logps = self.forward_backward(emissions, 
-				priors=priors)
+				priors=priors, lengths=lengths)
 		else:
 			t, r, starts, ends, logps = self._labeled_summarize(emissions, 
-				y=y)
+				y=y, lengths=lengths)
 
 		self._xw_starts_sum += torch.sum(starts * sample_weight, dim=0)
 		self._xw_ends_sum += torch.sum(ends * sample_weight, dim=0)
 		self._xw_sum += torch.sum(t * sample_weight.unsqueeze(-1), dim=0) 
 
-		X = X.reshape(-1, X.shape[-1])
 		r = torch.exp(r) * sample_weight.unsqueeze(-1)
+
+		if lengths is None:
+			X = X.reshape(-1, X.shape[-1])
+			r = r.reshape(-1, r.shape[-1])
+		else:
+			mask = torch.arange(X.shape[1], device=self.device) < \
+				lengths.unsqueeze(1)
+			X, r = X[mask], r[mask]
+
 		for i, node in enumerate(self.nodes):
-			w = r[:, :, i].reshape(-1, 1)
+			w = r[:, i].reshape(-1, 1)
 			node.distribution.summarize(X, sample_weight=w)
 
 		return logps
@@ -6,6 +6,11 @@ from ._utils import _cast_as_tensor
 from ._utils import _cast_as_parameter
 from ._utils import _update_parameter
 from ._utils import _check_parameter
+from ._utils import _sparse_lookup
+from ._utils import _active_batch_sizes
+from ._utils import _checkpointed_forward_backward
+from ._utils import _scaled_forward
+from ._utils import _scaled_backward
 
 from .distributions._distribution import Distribution
 
@@ -20,29 +25,69 @@ def _convert_to_sparse_edges(nodes, edges, starts, ends, start, end):
 	n = len(nodes)
 
 	if len(edges[0]) == 3 and len(nodes) != 3:
-		_edges = edges
+		_edges = list(edges)
 	else:
+		edges = _cast_as_tensor(edges)
 		n = len(edges)
-		_edges = []
 
-		for i in range(n):
-			for j in range(n):
-				if edges[i, j] != 0:
-					_edges.append((nodes[i], nodes[j], edges[i, j])) 
+		i, j = torch.nonzero(edges, as_tuple=True)
+		_edges = [(nodes[i_], nodes[j_], p) for i_, j_, p in zip(i.tolist(),
+			j.tolist(), edges[i, j].tolist())]
 
 	if starts is not None:
-		for i in range(n):
-			if starts[i] != 0:
-				_edges.append((start, nodes[i], starts[i]))
+		starts = _cast_as_tensor(starts)[:n]
+		for i, p in zip(torch.nonzero(starts)[:, 0].tolist(), 
+			starts[starts != 0].tolist()):
+			_edges.append((start, nodes[i], p))
 
 	if ends is not None:
-		for i in range(n):
-			if ends[i] != 0:
-				_edges.append((nodes[i], end, ends[i]))
+		ends = _cast_as_tensor(ends)[:n]
+		for i, p in zip(torch.nonzero(ends)[:, 0].tolist(), 
+			ends[ends != 0].tolist()):
+			_edges.append((nodes[i], end, p))
 
 	return _edges
 
 
+def _silent_levels(edge_starts, edge_ends, n_nodes, n_silent):
+	"""Return the topological level of the silent node each edge enters.
+
+	Silent nodes have indices n_nodes and above. The level of a silent node is
+	the length of the longest path of silent nodes that leads to it, so that
+	all transitions into the silent nodes of one level come from emitting
+	nodes or silent nodes of lower levels. Edges that enter an emitting node
+	are given a level of -1.
+	"""
+
+	silent = (edge_starts >= n_nodes) & (edge_ends >= n_nodes)
+	src, dst = edge_starts[silent] - n_nodes, edge_ends[silent] - n_nodes
+
+	levels = torch.zeros(n_silent, dtype=torch.int64)
+	degree = torch.bincount(dst, minlength=n_silent)
+	frontier = degree == 0
+	n_visited = 0
+
+	while frontier.any():
+		n_visited += int(frontier.sum())
+
+		mask = frontier[src]
+		levels.scatter_reduce_(0, dst[mask], levels[src[mask]] + 1, 
+			reduce='amax')
+
+		degree[frontier] = -1
+		degree -= torch.bincount(dst[mask], minlength=n_silent)
+		frontier = degree == 0
+
+	if n_visited < n_silent:
+		raise ValueError("Transitions between silent nodes cannot form a " +
+			"cycle.")
+
+	_edge_levels = torch.full_like(edge_ends, -1)
+	mask = edge_ends >= n_nodes
+	_edge_levels[mask] = levels[edge_ends[mask] - n_nodes]
+	return _edge_levels
+
+
 class _SparseHMM(Distribution):
 	"""A hidden Markov model with a sparse transition matrix.
 
@@ -64,6 +109,16 @@ class _SparseHMM(Distribution):
 	matrix, this will be converted to a sparse matrix with all the zeros
 	dropped if you choose `kind='sparse'`.
 
+	Nodes whose distribution is None are silent: they do not align to an
+	observation and are passed through between observations, such as the
+	delete states of a profile hidden Markov model. Internally, silent nodes
+	are placed after the emitting ones, so that the emissions, priors and
+	posteriors only cover the `n_nodes` emitting nodes while the forward and
+	backward messages, start and end probabilities cover all nodes. Within
+	each observation, silent nodes are updated in topological order of the
+	transitions between them, one scatter per level, and so these transitions
+	cannot form a cycle.
+
 
 	Parameters
 	----------
@@ -97,69 +152,99 @@ class _SparseHMM(Distribution):
 		If you want to freeze individual pameters, or individual values in those
 		parameters, you must modify the `frozen` attribute of the tensor or
 		parameter directly. Default is False.
+
+	checkpoint: bool, optional
+		Whether to run the forward-backward algorithm in a checkpointed mode
+		that only stores the forward messages every sqrt(length) observations
+		and recomputes the rest, summing the expected transitions as they are
+		calculated rather than storing them for every observation. This uses
+		much less memory for long sequences at the cost of running the forward
+		pass twice. Default is False.
+
+	chunk_size: int or None, optional
+		The number of observations at a time over which the probabilities of
+		each transition are calculated and summed in the forward-backward
+		algorithm. Smaller values use less memory. If None, all observations
+		are used at once. Default is None.
+
+	algorithm: str, optional
+		The implementation of the forward and backward algorithms to use. Must
+		be one of 'log', which works with log probabilities, or 'scaled', which
+		works with probabilities that are normalized at each observation and
+		only stores the log of the normalizers. Both return the same values up
+		to numerical precision but 'scaled' avoids calculating logs and
+		exponentials at each step. Default is 'log'.
 	"""
 
 	def __init__(self, nodes, edges, start, end, starts=None, ends=None, 
-		max_iter=10, tol=0.1, inertia=0.0, frozen=False):
+		max_iter=10, tol=0.1, inertia=0.0, frozen=False, checkpoint=False,
+		chunk_size=None, algorithm='log'):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "_SparseHMM"
+		self.checkpoint = checkpoint
+		self.chunk_size = chunk_size
+		self.algorithm = algorithm
 
 		self.start = start
 		self.end = end
 
-		self.nodes = nodes
-		self.edges = _convert_to_sparse_edges(nodes, edges, starts, ends,
-			self.start, self.end)
+		self.nodes = [node for node in nodes if node.distribution is not None]
+		silent = [node for node in nodes if node.distribution is None]
 
 		self.n_nodes = len(self.nodes)
-		self.n_edges = len(self.edges)
+		self.n_silent = len(silent)
+		self.nodes = self.nodes + silent
+		n = self.n_nodes + self.n_silent
 
-		self.starts = _cast_as_parameter(torch.full((self.n_nodes,), -inf))
-		self.ends = _cast_as_parameter(torch.full((self.n_nodes,), -inf))
+		if self.n_silent > 0 and (checkpoint or algorithm != 'log'):
+			raise ValueError("Silent nodes can only be used with the 'log' " +
+				"algorithm and without checkpointing.")
 
-		_edge_idx_starts = _cast_as_parameter(torch.empty(self.n_edges, 
-			dtype=torch.int64))
-		_edge_idx_ends = _cast_as_parameter(torch.empty(self.n_edges, 
-			dtype=torch.int64))
-		_edge_log_probs = _cast_as_parameter(torch.empty(self.n_edges, 
-			dtype=torch.float32))
+		self.edges = _convert_to_sparse_edges(nodes, edges, starts, ends,
+			self.start, self.end)
+		self.n_edges = len(self.edges)
+
+		self.starts = _cast_as_parameter(torch.full((n,), -inf))
+		self.ends = _cast_as_parameter(torch.full((n,), -inf))
 
-		idx = 0
-		for ni, nj, probability in self.edges:
-			if ni is self.start:
-				j = self.nodes.index(nj)
-				self.starts[j] = math.log(probability)
+		keys = {node: i for i, node in enumerate(self.nodes)}
+		keys[self.start], keys[self.end] = n, n + 1
 
-			elif nj is self.end:
-				i = self.nodes.index(ni)
-				self.ends[i] = math.log(probability)
+		idxs = torch.tensor([(keys[ni], keys[nj]) for ni, nj, _ in self.edges],
+			dtype=torch.int64).reshape(-1, 2)
+		log_probs = torch.log(torch.tensor([float(probability) for _, _, 
+			probability in self.edges], dtype=torch.float64)).type(
+			torch.float32)
 
-			else:
-				i = self.nodes.index(ni)
-				j = self.nodes.index(nj)
+		is_start = idxs[:, 0] == n
+		is_end = (idxs[:, 1] == n + 1) & ~is_start
+		is_edge = ~(is_start | is_end)
 
-				_edge_idx_starts[idx] = i
-				_edge_idx_ends[idx] = j
-				_edge_log_probs[idx] = math.log(probability)
-				idx += 1
+		self.starts[idxs[is_start, 1]] = log_probs[is_start]
+		self.ends[idxs[is_end, 0]] = log_probs[is_end]
 
 		if torch.isinf(self.starts).sum() == len(self.starts):
-			self.starts = torch.ones(self.n_nodes) / self.n_nodes
+			self.starts = torch.ones(n) / n
 		if torch.isinf(self.ends).sum() == len(self.ends):
-			self.ends = torch.ones(self.n_nodes) / self.n_nodes
+			self.ends = torch.ones(n) / n
 
 		self.nodes = torch.nn.ModuleList(self.nodes)
 
-		self._edge_idx_starts = _cast_as_parameter(_edge_idx_starts[:idx])
-		self._edge_idx_ends = _cast_as_parameter(_edge_idx_ends[:idx])
-		self._edge_log_probs = _cast_as_parameter(_edge_log_probs[:idx])
-		self.n_edges = idx
+		self._edge_idx_starts = _cast_as_parameter(idxs[is_edge, 0])
+		self._edge_idx_ends = _cast_as_parameter(idxs[is_edge, 1])
+		self._edge_log_probs = _cast_as_parameter(log_probs[is_edge])
+		self.n_edges = len(self._edge_log_probs)
+
+		_edge_keys, _edge_key_idxs = torch.sort(self._edge_idx_starts * n + 
+			self._edge_idx_ends)
+		self.register_buffer("_edge_keys", _edge_keys)
+		self.register_buffer("_edge_key_idxs", _edge_key_idxs)
 
-		self._edge_keymap = {}
-		for i in range(idx):
-			start = self._edge_idx_starts[i].item()
-			end = self._edge_idx_ends[i].item()
-			self._edge_keymap[(start, end)] = i
+		_edge_levels = _silent_levels(self._edge_idx_starts, 
+			self._edge_idx_ends, self.n_nodes, self.n_silent)
+		self.register_buffer("_edge_levels", _edge_levels)
+		self.n_levels = int(_edge_levels.max()) + 1 if self.n_edges > 0 \
+			else 0
 
 		self._reset_cache()
 
@@ -175,14 +260,375 @@ class _SparseHMM(Distribution):
 		self.register_buffer("_xw_sum", torch.zeros(self.n_edges, 
 			dtype=torch.float32, device=self.device))
 
-		self.register_buffer("_xw_starts_sum", torch.zeros(self.n_nodes, 
-			dtype=torch.float32, device=self.device))
+		self.register_buffer("_xw_starts_sum", torch.zeros(self.n_nodes + 
+			self.n_silent, dtype=torch.float32, device=self.device))
 
-		self.register_buffer("_xw_ends_sum", torch.zeros(self.n_nodes, 
-			dtype=torch.float32, device=self.device))
+		self.register_buffer("_xw_ends_sum", torch.zeros(self.n_nodes + 
+			self.n_silent, dtype=torch.float32, device=self.device))
+
+	def _forward_step(self, f, emissions, priors):
+		"""Advance the forward messages by one observation.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities for a batch at one observation and the emissions at
+		the next observation, it returns the forward log probabilities at the
+		next observation.
+		"""
+
+		p = f[:, self._edge_idx_starts] + self._edge_log_probs
+
+		alpha = torch.max(p, dim=1, keepdims=True).values
+		p = torch.exp(p - alpha)
+
+		z = torch.zeros_like(f)
+		z.scatter_add_(1, self._edge_idx_ends.expand(len(f), -1), p)
+		return alpha + torch.log(z) + emissions + priors
+
+	def _backward_step(self, b, emissions, priors):
+		"""Move the backward messages back by one observation.
+
+		This method is meant to only be called internally. Given the backward
+		log probabilities for a batch at one observation and the emissions at
+		that observation, it returns the backward log probabilities at the
+		previous observation.
+		"""
+
+		p = (b + emissions + priors)[:, self._edge_idx_ends]
+		p += self._edge_log_probs
+
+		alpha = torch.max(p, dim=1, keepdims=True).values
+		p = torch.exp(p - alpha)
+
+		z = torch.zeros_like(b)
+		z.scatter_add_(1, self._edge_idx_starts.expand(len(b), -1), p)
+		return alpha + torch.log(z)
+
+	def _transition_step(self, f, b, emissions, priors):
+		"""Return the log probabilities of each edge at one step.
+
+		This method is meant to only be called internally. Given the forward
+		log probabilities at one observation and the backward log
+		probabilities and emissions at the next observation, it returns the
+		unnormalized log probability of taking each edge between them.
+		"""
+
+		return f[:, self._edge_idx_starts] + self._edge_log_probs + (b + 
+			emissions + priors)[:, self._edge_idx_ends]
+
+	def _transition_probs(self):
+		"""Return the edge probabilities used by the scaled algorithms."""
+
+		return torch.exp(self._edge_log_probs)
+
+	def _scaled_forward_step(self, alpha, p):
+		"""Propagate scaled forward probabilities across the edges."""
+
+		z = torch.zeros_like(alpha)
+		z.scatter_add_(1, self._edge_idx_ends.expand(len(alpha), -1), 
+			alpha[:, self._edge_idx_starts] * p)
+		return z
+
+	def _scaled_backward_step(self, beta, p):
+		"""Propagate scaled backward probabilities back across the edges."""
+
+		z = torch.zeros_like(beta)
+		z.scatter_add_(1, self._edge_idx_starts.expand(len(beta), -1), 
+			beta[:, self._edge_idx_ends] * p)
+		return z
+
+	def _scatter_logsumexp(self, X, src, dst, log_probs):
+		"""Sum probabilities across a set of edges.
+
+		This method is meant to only be called internally. For each edge, it
+		takes the value of X at the node `src` plus the log probability of the
+		edge and returns, for every node, the log of the sum of these values
+		over the edges whose `dst` is that node.
+		"""
+
+		p = X[:, src] + log_probs
+
+		alpha = torch.max(p, dim=1, keepdims=True).values
+		alpha = torch.where(torch.isinf(alpha), 0, alpha)
+
+		z = torch.zeros(len(X), self.n_nodes + self.n_silent, 
+			device=self.device)
+		z.scatter_add_(1, dst.expand(len(X), -1), torch.exp(p - alpha))
+		return torch.log(z) + alpha
+
+	def _silent_edges(self):
+		"""Return the edges into emitting nodes and into each level of silent
+		nodes.
+
+		This method is meant to only be called internally. The first returned
+		value is the indices of the edges into emitting nodes, which connect
+		one observation to the next, and the second is a list with the indices
+		of the edges into the silent nodes of each topological level, which
+		connect nodes within one observation.
+		"""
+
+		step = torch.where(self._edge_levels == -1)[0]
+		levels = [torch.where(self._edge_levels == i)[0] for i in range(
+			self.n_levels)]
+		return step, levels
+
+	def _silent_forward_step(self, f, levels):
+		"""Propagate forward messages into the silent nodes of one step."""
+
+		for idxs in levels:
+			f = torch.logaddexp(f, self._scatter_logsumexp(f, 
+				self._edge_idx_starts[idxs], self._edge_idx_ends[idxs], 
+				self._edge_log_probs[idxs]))
+
+		return f
+
+	def _silent_backward_step(self, b, levels):
+		"""Propagate backward messages out of the silent nodes of one step."""
+
+		for idxs in reversed(levels):
+			b = torch.logaddexp(b, self._scatter_logsumexp(b, 
+				self._edge_idx_ends[idxs], self._edge_idx_starts[idxs], 
+				self._edge_log_probs[idxs]))
+
+		return b
+
+	def _silent_forward(self, emissions, priors, lengths=None):
+		"""Run the forward algorithm in a model with silent nodes.
+
+		This method is meant to only be called internally. In addition to the
+		forward log probabilities of all nodes at each observation, it returns
+		those of the silent nodes that are passed through before the first
+		observation.
+		"""
+
+		n, l, _ = emissions.shape
+		k = self.n_nodes
+
+		step, levels = self._silent_edges()
+		src, dst = self._edge_idx_starts[step], self._edge_idx_ends[step]
+		log_probs = self._edge_log_probs[step]
+
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+
+		f_pre = torch.full((n, k + self.n_silent), -inf, device=self.device)
+		f_pre[:, k:] = self.starts[k:]
+		f_pre = self._silent_forward_step(f_pre, levels)
+
+		f = torch.full((l, n, k + self.n_silent), -inf, dtype=torch.float32,
+			device=self.device)
+
+		z = torch.logaddexp(self.starts, self._scatter_logsumexp(f_pre, src,
+			dst, log_probs))
+		f[0, :, :k] = z[:, :k] + emissions[:, 0] + priors[:, 0]
+		f[0] = self._silent_forward_step(f[0], levels)
+
+		for i in range(1, l):
+			m = batch_sizes[i]
+
+			z = self._scatter_logsumexp(f[i-1, :m], src, dst, log_probs)
+			f[i, :m, :k] = z[:, :k] + emissions[:m, i] + priors[:m, i]
+			f[i, :m] = self._silent_forward_step(f[i, :m], levels)
+
+		return f.permute(1, 0, 2), f_pre
+
+	def _silent_backward(self, emissions, priors, lengths=None):
+		"""Run the backward algorithm in a model with silent nodes.
+
+		This method is meant to only be called internally. In addition to the
+		backward log probabilities of all nodes at each observation, it
+		returns those of the silent nodes that are passed through before the
+		first observation.
+		"""
+
+		n, l, _ = emissions.shape
+		k = self.n_nodes
+
+		step, levels = self._silent_edges()
+		src, dst = self._edge_idx_starts[step], self._edge_idx_ends[step]
+		log_probs = self._edge_log_probs[step]
+
+		batch_sizes = _active_batch_sizes(lengths, n, l) + [0]
+
+		b = torch.full((l, n, k + self.n_silent), -inf, dtype=torch.float32,
+			device=self.device)
+
+		for i in range(l-1, -1, -1):
+			m = batch_sizes[i+1]
+
+			if m > 0:
+				x = torch.full_like(b[i, :m], -inf)
+				x[:, :k] = b[i+1, :m, :k] + emissions[:m, i+1] + priors[:m, i+1]
+				b[i, :m] = self._scatter_logsumexp(x, dst, src, log_probs)
+
+			b[i, m:batch_sizes[i]] = self.ends
+			b[i, :batch_sizes[i]] = self._silent_backward_step(
+				b[i, :batch_sizes[i]], levels)
+
+		x = torch.full_like(b[0], -inf)
+		x[:, :k] = b[0, :, :k] + emissions[:, 0] + priors[:, 0]
+
+		b_pre = self._scatter_logsumexp(x, dst, src, log_probs)
+		b_pre[:, :k] = -inf
+		b_pre = self._silent_backward_step(b_pre, levels)
+		b_pre[:, :k] = -inf
+
+		return b.permute(1, 0, 2), b_pre
+
+	def _silent_viterbi_step(self, v, ptr, levels, dtype):
+		"""Propagate Viterbi messages into the silent nodes of one step."""
+
+		n = len(v)
+		for idxs in levels:
+			src = self._edge_idx_starts[idxs]
+			dst = self._edge_idx_ends[idxs].expand(n, -1)
+
+			p = v[:, src] + self._edge_log_probs[idxs]
+			v_ = torch.full_like(v, -inf).scatter_reduce_(1, dst, p, 
+				reduce='amax')
+
+			idxs = torch.where(p == v_.gather(1, dst), src, len(self.nodes))
+			idxs = torch.full_like(ptr, len(self.nodes)).scatter_reduce_(1, 
+				dst, idxs.type(dtype), reduce='amin')
+
+			mask = v_ > v
+			v = torch.where(mask, v_, v)
+			ptr = torch.where(mask, idxs, ptr)
+
+		return v, ptr
+
+	def _silent_viterbi(self, emissions, priors, lengths=None):
+		"""Run the Viterbi algorithm in a model with silent nodes.
+
+		This method is meant to only be called internally. Backpointers of
+		emitting nodes point to the node at the previous observation, or to
+		-1 for the start, and those of silent nodes point to the node at the
+		same observation that they were entered from. The returned path only
+		contains the emitting nodes.
+		"""
+
+		n, l, _ = emissions.shape
+		k, n_all = self.n_nodes, len(self.nodes)
+		dtype = torch.int16 if n_all < 2 ** 15 else torch.int32
+
+		step, levels = self._silent_edges()
+		src, dst = self._edge_idx_starts[step], self._edge_idx_ends[step]
+		log_probs = self._edge_log_probs[step]
+
+		batch_sizes = _active_batch_sizes(lengths, n, l) + [0]
+		if lengths is None:
+			lengths = torch.full((n,), l, device=self.device)
+
+		ptr = torch.full((l, n, n_all), -1, dtype=dtype, device=self.device)
+
+		v = torch.full((n, n_all), -inf, device=self.device)
+		v[:, k:] = self.starts[k:]
+		v, _ = self._silent_viterbi_step(v, ptr[0], levels, dtype)
+		v_last = torch.empty_like(v)
+
+		for i in range(l):
+			m = batch_sizes[i]
+			p = v[:m, src] + log_probs
+
+			v_ = torch.full_like(v[:m], -inf).scatter_reduce_(1, 
+				dst.expand(m, -1), p, reduce='amax')
+
+			idxs = torch.where(p == v_.gather(1, dst.expand(m, -1)), src, n_all)
+			idxs = torch.full_like(ptr[i, :m], n_all).scatter_reduce_(1, 
+				dst.expand(m, -1), idxs.type(dtype), reduce='amin')
+
+			if i == 0:
+				mask = self.starts >= v_
+				v_ = torch.where(mask, self.starts, v_)
+				idxs = torch.where(mask, -1, idxs)
+
+			v_[:, :k] += emissions[:m, i] + priors[:m, i]
+			v_[:, k:] = -inf
+
+			v[:m], ptr[i, :m] = self._silent_viterbi_step(v_, idxs, levels, 
+				dtype)
+			v_last[batch_sizes[i+1]:m] = v[batch_sizes[i+1]:m]
+
+		logp, state = torch.max(v_last + self.ends, dim=1)
+		path = torch.zeros(n, l, dtype=torch.int64, device=self.device)
+
+		for i in range(l-1, -1, -1):
+			active = lengths > i
+
+			for _ in range(self.n_levels):
+				silent = state >= k
+				state = torch.where(silent & active, ptr[i].gather(1, 
+					state.unsqueeze(-1).clamp(0, n_all-1))[:, 0].type(
+					torch.int64), state)
+
+			path[:, i] = torch.where(active, state, 0)
+			state = torch.where(active, ptr[i].gather(1, state.unsqueeze(-1
+				).clamp(0, n_all-1))[:, 0].type(torch.int64), state)
+
+		return path, logp
+
+	def _silent_forward_backward(self, emissions, priors, lengths=None):
+		"""Run the forward-backward algorithm in a model with silent nodes.
+
+		This method is meant to only be called internally. Transitions into
+		emitting nodes are counted between consecutive observations, including
+		from the silent nodes passed through before the first observation, and
+		transitions into silent nodes are counted within each observation.
+		"""
+
+		n, l, _ = emissions.shape
+		k = self.n_nodes
+
+		f, f_pre = self._silent_forward(emissions, priors, lengths=lengths)
+		b, b_pre = self._silent_backward(emissions, priors, lengths=lengths)
+
+		if lengths is None:
+			f_last = f[:, -1]
+		else:
+			f_last = f[torch.arange(n), lengths-1]
+
+		logp = torch.logsumexp(f_last + self.ends, dim=1)
+
+		step, levels = self._silent_edges()
+		src, dst = self._edge_idx_starts, self._edge_idx_ends
+		t = torch.full((n, self.n_edges), -inf, device=self.device)
+
+		be = b[:, :, :k] + emissions + priors
+		chunk_size = self.chunk_size or max(l-1, 1)
+
+		t_ = f_pre[:, src[step]] + self._edge_log_probs[step] + be[:, 0, 
+			dst[step]]
+		for c in range(0, l-1, chunk_size):
+			i, j = c + 1, min(c + chunk_size, l-1) + 1
+
+			t__ = f[:, i-1:j-1, src[step]] + be[:, i:j, dst[step]]
+			t__ += self._edge_log_probs[step]
+			t_ = torch.logaddexp(t_, torch.logsumexp(t__, dim=1))
+
+		t[:, step] = t_
+
+		for idxs in levels:
+			t_ = f_pre[:, src[idxs]] + b_pre[:, dst[idxs]]
+			t__ = torch.logsumexp(f[:, :, src[idxs]] + b[:, :, dst[idxs]], 
+				dim=1)
+			t[:, idxs] = torch.logaddexp(t_, t__) + self._edge_log_probs[idxs]
+
+		t = torch.exp(t - logp.unsqueeze(-1))
+
+		starts = torch.cat([be[:, 0], b_pre[:, k:]], dim=-1) + self.starts
+		starts = torch.exp(starts - logp.unsqueeze(-1))
+
+		ends = torch.exp(self.ends + f_last - logp.unsqueeze(-1))
+
+		r = f[:, :, :k] + b[:, :, :k]
+		r = r - torch.logsumexp(r, dim=2, keepdims=True)
+
+		if lengths is not None:
+			mask = torch.arange(l, device=self.device) < lengths.unsqueeze(1)
+			r[~mask] = -inf
+
+		return t, r, starts, ends, logp
 
 	@torch.inference_mode()
-	def forward(self, emissions, priors):
+	def forward(self, emissions, priors, lengths=None):
 		"""Run the forward algorithm on some data.
 
 		Runs the forward algorithm on a batch of sequences. This is not to be
@@ -210,6 +656,12 @@ class _SparseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -217,29 +669,29 @@ class _SparseHMM(Distribution):
 			The log probabilities calculated by the forward algorithm.
 		"""
 
+		if self.n_silent > 0:
+			return self._silent_forward(emissions, priors, lengths=lengths)[0]
+		elif self.algorithm == 'scaled':
+			return _scaled_forward(self, emissions + priors, lengths=lengths)
+
 		n, l, _ = emissions.shape
 
 		f = torch.full((l, n, self.n_nodes), -inf, dtype=torch.float32, 
 			device=self.device)
 		f[0] = self.starts + emissions[:, 0] + priors[:, 0]
 
-		for i in range(1, l):
-			p = f[i-1, :, self._edge_idx_starts]
-			p += self._edge_log_probs.expand(n, -1)
-
-			alpha = torch.max(p, dim=1, keepdims=True).values
-			p = torch.exp(p - alpha)
-
-			z = torch.zeros_like(f[i])
-			z.scatter_add_(1, self._edge_idx_ends.expand(n, -1), p)
+		batch_sizes = _active_batch_sizes(lengths, n, l)
 
-			f[i] = alpha + torch.log(z) + emissions[:, i] + priors[:, i]
+		for i in range(1, l):
+			m = batch_sizes[i]
+			f[i, :m] = self._forward_step(f[i-1, :m], emissions[:m, i], 
+				priors[:m, i])
 
 		f = f.permute(1, 0, 2)
 		return f
 
 	@torch.inference_mode()
-	def backward(self, emissions, priors):
+	def backward(self, emissions, priors, lengths=None):
 		"""Run the backward algorithm on some data.
 
 		Runs the backward algorithm on a batch of sequences. This is not to be
@@ -268,6 +720,12 @@ class _SparseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -275,30 +733,116 @@ class _SparseHMM(Distribution):
 			The log probabilities calculated by the backward algorithm.
 		"""
 
+		if self.n_silent > 0:
+			return self._silent_backward(emissions, priors, lengths=lengths)[0]
+		elif self.algorithm == 'scaled':
+			return _scaled_backward(self, emissions + priors, lengths=lengths)
+
 		n, l, _ = emissions.shape
 
 		b = torch.full((l, n, self.n_nodes), -inf, dtype=torch.float32,
 			device=self.device)
-		b[-1] = self.ends
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+		b[-1, :batch_sizes[-1]] = self.ends
 
 		for i in range(l-2, -1, -1):
-			p = b[i+1, :, self._edge_idx_ends]
-			p += emissions[:, i+1, self._edge_idx_ends] + priors[:, i+1, self._edge_idx_ends]
-			p += self._edge_log_probs.expand(n, -1)
+			m = batch_sizes[i+1]
+			b[i, :m] = self._backward_step(b[i+1, :m], emissions[:m, i+1], 
+				priors[:m, i+1])
+			b[i, m:batch_sizes[i]] = self.ends
 
-			alpha = torch.max(p, dim=1, keepdims=True).values
-			p = torch.exp(p - alpha)
+		b = b.permute(1, 0, 2)
+		return b
 
-			z = torch.zeros_like(b[i])
-			z.scatter_add_(1, self._edge_idx_starts.expand(n, -1), p)
+	@torch.inference_mode()
+	def viterbi(self, emissions, priors, lengths=None):
+		"""Run the Viterbi algorithm on some data.
 
-			b[i] = alpha + torch.log(z)
+		Runs the Viterbi algorithm on a batch of sequences. The Viterbi
+		algorithm is a dynamic programming algorithm that, rather than summing
+		over all paths through the model like the forward algorithm, only keeps
+		the most likely path to each node. Backpointers are stored for each
+		observation and are used at the end to recover the single most likely
+		path through the model, also known as the maximum a posteriori path.
 
-		b = b.permute(1, 0, 2)
-		return b
+		Note that, as an internal method, this does not take as input the
+		actual sequence of observations but, rather, the emission probabilities
+		calculated from the sequence given the model.
+
+		
+		Parameters
+		----------
+		emissions: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability 
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call. 		
+
+		priors: torch.Tensor, shape=(-1, -1, self.n_nodes)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
+
+		Returns
+		-------
+		path: torch.Tensor, shape=(-1, -1), dtype=torch.int64
+			The node that each observation is aligned to in the most likely
+			path through the model.
+
+		logp: torch.Tensor, shape=(-1,)
+			The log probability of the most likely path for each example.
+		"""
+
+		if self.n_silent > 0:
+			return self._silent_viterbi(emissions, priors, lengths=lengths)
+
+		n, l, _ = emissions.shape
+		dtype = torch.int16 if self.n_nodes < 2 ** 15 else torch.int32
+
+		batch_sizes = _active_batch_sizes(lengths, n, l)
+
+		ptr = torch.arange(self.n_nodes, dtype=dtype, device=self.device)
+		ptr = ptr.expand(l, n, -1).clone()
+		v = self.starts + emissions[:, 0] + priors[:, 0]
+
+		for i in range(1, l):
+			m = batch_sizes[i]
+			starts = self._edge_idx_starts.expand(m, -1)
+			ends = self._edge_idx_ends.expand(m, -1)
+
+			p = v[:m, self._edge_idx_starts] + self._edge_log_probs
+
+			v_ = torch.full_like(v[:m], -inf)
+			v_.scatter_reduce_(1, ends, p, reduce='amax')
+
+			idxs = torch.where(p == v_.gather(1, ends), starts, self.n_nodes)
+			idxs = torch.full_like(ptr[i, :m], self.n_nodes).scatter_reduce_(1, 
+				ends, idxs.type(dtype), reduce='amin')
+
+			v[:m] = v_ + emissions[:m, i] + priors[:m, i]
+			ptr[i, :m] = idxs.clamp_(max=self.n_nodes-1)
+
+		logp, state = torch.max(v + self.ends, dim=1)
+
+		path = torch.empty(l, n, dtype=torch.int64, device=self.device)
+		path[-1] = state
+
+		for i in range(l-1, 0, -1):
+			state = ptr[i].gather(1, state.unsqueeze(-1))[:, 0].type(torch.int64)
+			path[i-1] = state
+
+		return path.T, logp
 
 	@torch.inference_mode()
-	def forward_backward(self, emissions, priors):
+	def forward_backward(self, emissions, priors, lengths=None):
 		"""Run the forward-backward algorithm on some data.
 
 		Runs the forward-backward algorithm on a batch of sequences. This
@@ -326,6 +870,12 @@ class _SparseHMM(Distribution):
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
 
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
+
 
 		Returns
 		-------
@@ -354,28 +904,53 @@ class _SparseHMM(Distribution):
 			The log probabilities of each sequence given the model.
 		"""
 
+		if self.n_silent > 0:
+			return self._silent_forward_backward(emissions, priors, 
+				lengths=lengths)
+		elif self.checkpoint:
+			return _checkpointed_forward_backward(self, emissions, priors, 
+				lengths=lengths)
+
 		n, l, _ = emissions.shape
-		f = self.forward(emissions, priors=priors)
-		b = self.backward(emissions, priors=priors)
+		f = self.forward(emissions, priors=priors, lengths=lengths)
+		b = self.backward(emissions, priors=priors, lengths=lengths)
+
+		if lengths is None:
+			f_last = f[:, -1]
+		else:
+			f_last = f[torch.arange(n), lengths-1]
+
+		logp = torch.logsumexp(f_last + self.ends, dim=1)
 
-		logp = torch.logsumexp(f[:, -1] + self.ends, dim=1)
+		t = torch.full((n, self.n_edges), -inf, device=self.device)
+		chunk_size = self.chunk_size or max(l-1, 1)
 
-		t = f[:, :-1, self._edge_idx_starts] + b[:, 1:, self._edge_idx_ends]
-		t += emissions[:, 1:, self._edge_idx_ends] + priors[:, 1:, self._edge_idx_ends]
-		t += self._edge_log_probs.expand(n, l-1, -1)
-		t = torch.exp(torch.logsumexp(t, dim=1).T - logp).T
+		for c in range(0, l-1, chunk_size):
+			i, j = c + 1, min(c + chunk_size, l-1) + 1
+
+			t_ = f[:, i-1:j-1, self._edge_idx_starts] + b[:, i:j, self._edge_idx_ends]
+			t_ += emissions[:, i:j, self._edge_idx_ends] + priors[:, i:j, self._edge_idx_ends]
+			t_ += self._edge_log_probs.expand(n, j-i, -1)
+			t = torch.logaddexp(t, torch.logsumexp(t_, dim=1))
+
+		t = torch.exp(t.T - logp).T
 
 		starts = self.starts + emissions[:, 0] + priors[:, 0] + b[:, 0]
 		starts = torch.exp(starts.T - torch.logsumexp(starts, dim=-1)).T
 
-		ends = self.ends + f[:, -1]
+		ends = self.ends + f_last
 		ends = torch.exp(ends.T - torch.logsumexp(ends, dim=-1)).T
 
 		r = f + b
 		r = (r - torch.logsumexp(r, dim=2).reshape(n, -1, 1))
+
+		if lengths is not None:
+			mask = torch.arange(l, device=self.device) < lengths.unsqueeze(1)
+			r[~mask] = -inf
+
 		return t, r, starts, ends, logp
 
-	def _labeled_summarize(self, X, y):
+	def _labeled_summarize(self, X, y, lengths=None):
 		"""Extract sufficient statistics given a set of labels.
 
 		This method calculates the sufficient statistics from data where the
@@ -396,30 +971,43 @@ class _SparseHMM(Distribution):
 			Default is None.
 		"""
 
+		if self.n_silent > 0:
+			raise ValueError("Labeled training is not supported for models " +
+				"with silent nodes.")
+
 		y = _check_parameter(_cast_as_tensor(y), "y", ndim=2, min_value=0, 
 			max_value=self.n_nodes-1, dtypes=(torch.int32, torch.int64),
 			shape=(X.shape[0], X.shape[1]))
 
 		n, l, d = X.shape
+		y = y.type(torch.int64).to(self.device)
 
 		starts = torch.zeros(n, self.n_nodes, device=self.device)
 		starts[torch.arange(n), y[:, 0]] = 1 
 
+		if lengths is None:
+			lengths = torch.full((n,), l, device=self.device)
+
 		ends = torch.zeros_like(starts)
-		ends[torch.arange(n), y[:, -1]] = 1
+		ends[torch.arange(n), y[torch.arange(n), lengths-1]] = 1
+
+		w = torch.arange(1, l, device=self.device) < lengths.unsqueeze(1)
 
-		t = torch.zeros((n, self.n_edges), device=self.device)
-		r = torch.zeros(n, l, self.n_nodes, device=self.device) - inf
+		idxs = _sparse_lookup(self._edge_keys, self._edge_key_idxs, 
+			y[:, :-1] * self.n_nodes + y[:, 1:], -1)
+		if torch.any(idxs[w] == -1):
+			raise ValueError("Parameter y contains a transition that is not " +
+				"an edge in the model.")
 
-		for i in range(n):
-			for j in range(l-1):
-				edge = y[i, j].item(), y[i, j+1].item()
-				idx = self._edge_keymap[edge]
-				
-				t[i][idx] += 1
-				r[i, j, y[i, j]] = 0
+		idxs = idxs + torch.arange(n, device=self.device).unsqueeze(1) * \
+			self.n_edges
 
-			r[i, l-1, y[i, l-1]] = 0
+		t = torch.bincount(idxs.reshape(-1).clamp(min=0), weights=w.reshape(-1
+			).type(torch.float32), minlength=n*self.n_edges)
+		t = t.reshape(n, self.n_edges)
+
+		r = torch.full((n, l, self.n_nodes), -inf, device=self.device)
+		r.scatter_(2, y.unsqueeze(-1), 0)
 
 		if self._initialized:
 			logps = self.log_probability(X)
@@ -430,7 +1018,7 @@ class _SparseHMM(Distribution):
 
 
 	def summarize(self, X, y=None, sample_weight=None, emissions=None, 
-		priors=None):
+		priors=None, lengths=None):
 		"""Extract the sufficient statistics from a batch of data.
 
 		This method calculates the sufficient statistics from optionally
@@ -467,22 +1055,37 @@ class _SparseHMM(Distribution):
 			provided, do not include in the calculations (conceptually
 			equivalent to a uniform probability, but without scaling the
 			probabilities).
+
+		lengths: torch.Tensor, shape=(-1,), optional
+			The length of each sequence when sequences of different lengths
+			have been padded to a common length, sorted in descending order.
+			At each step only the sequences that have not yet ended are
+			updated. Default is None, meaning each sequence is full length.
 		"""
 
 		if y is None:
 			t, r, starts, ends, logps = self.forward_backward(emissions, 
-				priors=priors)
+				priors=priors, lengths=lengths)
 		else:
-			t, r, starts, ends, logps = self._labeled_summarize(X, y=y)
+			t, r, starts, ends, logps = self._labeled_summarize(X, y=y, 
+				lengths=lengths)
 
 		self._xw_starts_sum += torch.sum(starts * sample_weight, dim=0)
 		self._xw_ends_sum += torch.sum(ends * sample_weight, dim=0)
 		self._xw_sum += torch.sum(t * sample_weight, dim=0) 
 
-		X = X.reshape(-1, X.shape[-1])
 		r = torch.exp(r) * sample_weight.unsqueeze(1)
-		for i, node in enumerate(self.nodes):
-			w = r[:, :, i].reshape(-1, 1)
+
+		if lengths is None:
+			X = X.reshape(-1, X.shape[-1])
+			r = r.reshape(-1, r.shape[-1])
+		else:
+			mask = torch.arange(X.shape[1], device=self.device) < \
+				lengths.unsqueeze(1)
+			X, r = X[mask], r[mask]
+
+		for i, node in enumerate(self.nodes[:self.n_nodes]):
+			w = r[:, i].reshape(-1, 1)
 			node.distribution.summarize(X, sample_weight=w)
 
 		return logps
@@ -498,24 +1101,19 @@ class _SparseHMM(Distribution):
 		`summarize` method followed by the `from_summaries` method.
 		"""
 
-		for node in self.nodes:
+		for node in self.nodes[:self.n_nodes]:
 			node.distribution.from_summaries()
 
 		if self.frozen:
 			return
 
 		node_out_count = torch.clone(self._xw_ends_sum)
-		for start, count in zip(self._edge_idx_starts, self._xw_sum):
-			node_out_count[start] += count
+		node_out_count.scatter_add_(0, self._edge_idx_starts, self._xw_sum)
 
 		ends = torch.log(self._xw_ends_sum / node_out_count)
 		starts = torch.log(self._xw_starts_sum / self._xw_starts_sum.sum())
-		_edge_log_probs = torch.empty_like(self._edge_log_probs)
-
-		for i in range(self.n_edges):
-			t = self._xw_sum[i]
-			t_sum = node_out_count[self._edge_idx_starts[i]]
-			_edge_log_probs[i] = torch.log(t / t_sum)
+		_edge_log_probs = torch.log(self._xw_sum / node_out_count[
+			self._edge_idx_starts])
 
 		_update_parameter(self.ends, ends, inertia=self.inertia)
 		_update_parameter(self.starts, starts, inertia=self.inertia)
@@ -1,6 +1,7 @@
 # _utils.py
 # Jacob Schreiber <jmschreiber91@gmail.com>
 
+import math
 import numpy
 import torch
 
@@ -10,28 +11,48 @@ from apricot import FeatureBasedSelection
 
 eps = torch.finfo(torch.float32).eps
 
+_SUFFICIENT_STATISTICS = ("_w_sum", "_xw_sum", "_xxw_sum", "_logx_w_sum", 
+	"_xw_starts_sum", "_xw_ends_sum")
+
 class BufferList(torch.nn.Module):
-	"""A buffer list."""
+	"""A buffer list.
+
+	The buffers are registered on the module so that they are moved by `to`
+	and included in `state_dict`, and are always read back from the module
+	so that indexing returns the moved or loaded tensors. Assigning to an
+	index replaces the buffer, which may have a different shape.
+	"""
 
 	def __init__(self, buffers):
 		super(BufferList, self).__init__()
 
-		self.buffers = []
 		for i, b in enumerate(buffers):
-			name = "_buffer_{}".format(i)
-			
-			self.register_buffer(name, b)
-			self.buffers.append(getattr(self, name))
+			self.register_buffer("_buffer_{}".format(i), b)
 
 	def __repr__(self):
-		return str(self.buffers)
+		return str(list(self))
+
+	def __len__(self):
+		return len(self._buffers)
+
+	def __iter__(self):
+		return (self[i] for i in range(len(self)))
 
 	def __getitem__(self, i):
-		return self.buffers[i]
+		if i < 0:
+			i += len(self)
+
+		return getattr(self, "_buffer_{}".format(i))
+
+	def __setitem__(self, i, b):
+		if i < 0:
+			i += len(self)
+
+		self.register_buffer("_buffer_{}".format(i), b)
 
 	@property
 	def dtype(self):
-		return self.buffers[0].dtype
+		return self[0].dtype
 
 
 def _cast_as_tensor(value, dtype=None):
@@ -262,6 +283,119 @@ def _check_shapes(parameters, names):
 					"shape.".format(names[i], names[j]))
 
 
+def _ravel_multi_index(X, shape):
+	"""Convert a set of multi-dimensional indexes into flat indexes.
+
+	This is the torch equivalent of `numpy.ravel_multi_index`, where the
+	coordinates are given along the last dimension of X. The returned indexes
+	can be used to index into the flattened version of a contiguous tensor
+	with the given shape.
+
+
+	Parameters
+	----------
+	X: torch.Tensor, shape=(..., len(shape))
+		A tensor of integer coordinates.
+
+	shape: tuple
+		The shape of the tensor being indexed into.
+
+
+	Returns
+	-------
+	idxs: torch.Tensor, shape=X.shape[:-1]
+		The flat index of each set of coordinates.
+	"""
+
+	strides = [1]
+	for n in reversed(shape[1:]):
+		strides.insert(0, strides[0] * int(n))
+
+	strides = torch.tensor(strides, dtype=torch.int64, device=X.device)
+	return torch.sum(X.type(torch.int64) * strides, dim=-1)
+
+
+def _sparse_lookup(keys, values, idxs, default):
+	"""Look up values in a sparse table stored as sorted keys.
+
+	A sparse table is stored as a sorted tensor of flat indexes, `keys`, and
+	a tensor of the values at those indexes. Each of the queried indexes is
+	found using a binary search and, if it is not stored in the table, the
+	default value is returned instead.
+
+
+	Parameters
+	----------
+	keys: torch.Tensor, shape=(k,), dtype=torch.int64
+		The sorted flat indexes that are stored in the table.
+
+	values: torch.Tensor, shape=(k,)
+		The value stored at each index.
+
+	idxs: torch.Tensor, dtype=torch.int64
+		The flat indexes to look up.
+
+	default: float or torch.Tensor, shape=idxs.shape
+		The value to return for indexes not stored in the table.
+
+
+	Returns
+	-------
+	y: torch.Tensor, shape=idxs.shape
+		The value of each queried index.
+	"""
+
+	default = torch.as_tensor(default, dtype=values.dtype, 
+		device=values.device).expand(idxs.shape)
+
+	if len(keys) == 0:
+		return torch.clone(default)
+
+	pos = torch.searchsorted(keys, idxs).clamp(max=len(keys)-1)
+	return torch.where(keys[pos] == idxs, values[pos], default)
+
+
+def _sparse_add(keys, values, idxs, weights):
+	"""Add weights into a sparse table stored as sorted keys.
+
+	The indexes are merged with the keys already in the table and the
+	weights of repeated indexes are summed, such that the returned table only
+	grows with the number of distinct indexes that have been observed.
+
+
+	Parameters
+	----------
+	keys: torch.Tensor, shape=(k,), dtype=torch.int64
+		The sorted flat indexes that are stored in the table.
+
+	values: torch.Tensor, shape=(k,)
+		The value stored at each index.
+
+	idxs: torch.Tensor, shape=(n,), dtype=torch.int64
+		The flat indexes to add weight to.
+
+	weights: torch.Tensor, shape=(n,)
+		The weight to add to each index.
+
+
+	Returns
+	-------
+	keys: torch.Tensor, shape=(k',), dtype=torch.int64
+		The sorted flat indexes stored in the updated table.
+
+	values: torch.Tensor, shape=(k',)
+		The value stored at each index in the updated table.
+	"""
+
+	keys_, inverse = torch.unique(torch.cat([keys, idxs]), sorted=True, 
+		return_inverse=True)
+
+	values_ = torch.zeros(len(keys_), dtype=values.dtype, device=values.device)
+	values_.scatter_add_(0, inverse, torch.cat([values, 
+		weights.type(values.dtype)]))
+	return keys_, values_
+
+
 def _reshape_weights(X, sample_weight, device='cpu'):
 	"""Handle a sample weight tensor by creating and reshaping it.
 
@@ -309,7 +443,381 @@ def _reshape_weights(X, sample_weight, device='cpu'):
 	return sample_weight
 
 
-def _initialize_centroids(X, k, algorithm='first-k', random_state=None):
+def _check_batches(X):
+	"""Check whether the data is a collection of batches.
+
+	Models can be fit either to a single tensor of data or to an iterable
+	that yields batches of data, such as a `torch.utils.data.DataLoader`.
+	Because lists and tuples are valid inputs for a single tensor, only
+	iterables that are not lists, tuples, arrays or tensors are considered
+	to be collections of batches. The iterable must be able to be iterated
+	over multiple times because each iteration of EM is one pass over it.
+
+
+	Parameters
+	----------
+	X: anything
+		The data passed into a model.
+
+
+	Returns
+	-------
+	is_batches: bool
+		Whether the data is a collection of batches.
+	"""
+
+	if X is None or isinstance(X, (list, tuple, numpy.ndarray, torch.Tensor)):
+		return False
+
+	if not hasattr(X, "__iter__"):
+		return False
+
+	if iter(X) is X:
+		raise ValueError("Batches must be provided as an iterable that can "
+			"be iterated over multiple times, e.g. a DataLoader, and not as "
+			"a generator or iterator.")
+
+	return True
+
+
+def _iter_batches(X):
+	"""Iterate over a collection of batches.
+
+	Each batch can either be a tensor of examples or a list or tuple of the
+	form (X,) or (X, sample_weight), as produced by a DataLoader wrapping a
+	TensorDataset.
+
+
+	Parameters
+	----------
+	X: iterable
+		A collection of batches.
+
+
+	Returns
+	-------
+	batches: generator
+		A generator of (X, sample_weight) pairs where sample_weight may be
+		None.
+	"""
+
+	for batch in X:
+		if isinstance(batch, (list, tuple)):
+			if len(batch) == 1:
+				yield batch[0], None
+			elif len(batch) == 2:
+				yield batch[0], batch[1]
+			else:
+				raise ValueError("Batches must be of the form X, (X,) or "
+					"(X, sample_weight).")
+		else:
+			yield batch, None
+
+
+def _summarize_batches(model, X, sample_weight=None, **kwargs):
+	"""Summarize data that is optionally split into batches.
+
+	This function calls the `summarize` method of a model on the data. If
+	the data is a collection of batches, the sufficient statistics are
+	accumulated across all of the batches and the summed log probability
+	(or other objective) returned by `summarize` is returned.
+
+
+	Parameters
+	----------
+	model: torch.nn.Module
+		A model with a `summarize` method.
+
+	X: list, tuple, numpy.ndarray, torch.Tensor, or iterable
+		Either a set of examples or a collection of batches of examples.
+
+	sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+		A set of weights for the examples. Must be None when X is a collection
+		of batches, because the weights must then be provided in the batches.
+		Default is None.
+
+	kwargs: dict
+		Any other arguments to pass into `summarize`.
+
+
+	Returns
+	-------
+	logp: torch.Tensor
+		The value returned by `summarize`, summed across all batches.
+	"""
+
+	if not _check_batches(X):
+		return model.summarize(X, sample_weight=sample_weight, **kwargs)
+
+	if sample_weight is not None:
+		raise ValueError("When passing in batches, sample_weight must be "
+			"provided in each batch.")
+
+	logp = 0
+	for X_, w_ in _iter_batches(X):
+		logp_ = model.summarize(X_, sample_weight=w_, **kwargs)
+		logp += logp_.sum() if isinstance(logp_, torch.Tensor) else logp_
+
+	return logp
+
+
+def _partial_fit(model, X, sample_weight=None, **kwargs):
+	"""Perform one step of online EM on a batch of data.
+
+	Online EM keeps a running average of the sufficient statistics rather
+	than of the parameters. Given the statistics s_{t-1} accumulated so far
+	and the statistics s of a new batch, normalized by the number of examples
+	in the batch, the running statistics are updated as
+
+		s_t = (1 - rho_t) * s_{t-1} + rho_t * s
+
+	where rho_t = (t + step_offset) ** -step_decay is a decaying step size.
+	The parameters are then set using `from_summaries` on s_t. Sufficient
+	statistics are identified as the `_w_sum`, `_xw_sum`, `_xxw_sum`,
+	`_logx_w_sum`, `_xw_starts_sum` and `_xw_ends_sum` buffers of the model
+	and any of its submodules.
+
+
+	Parameters
+	----------
+	model: torch.nn.Module
+		A model with `summarize` and `from_summaries` methods and with
+		`step_offset` and `step_decay` attributes.
+
+	X: list, tuple, numpy.ndarray, torch.Tensor
+		A batch of examples.
+
+	sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+		A set of weights for the examples. Default is ones.
+
+	kwargs: dict
+		Any other arguments to pass into `summarize`.
+
+
+	Returns
+	-------
+	logp: torch.Tensor
+		The value returned by `summarize` on the batch.
+	"""
+
+	n = len(X)
+	rho = (model._n_online_steps + model.step_offset) ** -model.step_decay
+
+	if sample_weight is None:
+		sample_weight = torch.full((n,), rho / n, device=model.device)
+	else:
+		sample_weight = _cast_as_tensor(sample_weight, 
+			dtype=torch.float32) * rho / n
+
+	logp = model.summarize(X, sample_weight=sample_weight, **kwargs)
+
+	statistics = {}
+	for name, buffer in model.named_buffers():
+		if name.split(".")[-1] not in _SUFFICIENT_STATISTICS:
+			continue
+
+		if name in model._online_statistics:
+			buffer += (1 - rho) * model._online_statistics[name]
+
+		statistics[name] = torch.clone(buffer)
+
+	model.from_summaries()
+	model._online_statistics = statistics
+	model._n_online_steps += 1
+	return logp
+
+
+def _nearest_squared_distances(X, centroids, memory_budget=None):
+	"""Find the nearest centroid to each example and the squared distance.
+
+	The squared Euclidean distances are expanded into a single matrix
+	multiplication and computed a block of rows at a time so that the full
+	distance matrix between X and the centroids never needs to exist.
+
+
+	Parameters
+	----------
+	X: torch.Tensor, shape=(-1, d)
+		A set of examples.
+
+	centroids: torch.Tensor, shape=(-1, d)
+		A set of centroids.
+
+	memory_budget: int or None, optional
+		The maximum number of distances to compute at a time. If None, compute
+		all rows at once. Default is None.
+
+
+	Returns
+	-------
+	distances: torch.Tensor, shape=(-1,)
+		The squared distance from each example to its nearest centroid.
+
+	idxs: torch.Tensor, shape=(-1,)
+		The index of the nearest centroid to each example.
+	"""
+
+	XX = torch.sum(X ** 2, dim=1)
+	CC = torch.sum(centroids ** 2, dim=1)
+	batch_size = max(len(X), 1)
+	if memory_budget is not None:
+		batch_size = max(1, int(memory_budget) // len(centroids))
+
+	distances, idxs = [], []
+	for start in range(0, len(X), batch_size):
+		end = start + batch_size
+
+		d = torch.addmm(CC, X[start:end], centroids.T, alpha=-2)
+		d += XX[start:end].unsqueeze(1)
+
+		d, i = torch.min(d, dim=1)
+		distances.append(d)
+		idxs.append(i)
+
+	return torch.clamp(torch.cat(distances), min=0), torch.cat(idxs)
+
+
+def _kmeans_plusplus(X, k, generator, sample_weight=None):
+	"""Select k examples from X using k-means++ seeding.
+
+	Each example after the first is sampled with probability proportional to
+	its weight times its squared distance to the nearest example already
+	selected. Only a vector of these distances is kept and each step updates
+	it with a single matrix-vector product.
+
+
+	Parameters
+	----------
+	X: torch.Tensor, shape=(-1, d)
+		A set of examples.
+
+	k: int
+		The number of examples to select.
+
+	generator: torch.Generator
+		The generator to draw random numbers from.
+
+	sample_weight: torch.Tensor, shape=(-1,), or None, optional
+		The weight of each example. If None, each example has a weight of 1.
+		Default is None.
+
+
+	Returns
+	-------
+	idxs: torch.Tensor, shape=(k,)
+		The indexes of the selected examples.
+	"""
+
+	if sample_weight is None:
+		sample_weight = torch.ones(len(X), device=X.device)
+
+	XX = torch.sum(X ** 2, dim=1)
+	chosen = torch.zeros(len(X), dtype=torch.bool, device=X.device)
+	distances = torch.full((len(X),), float("inf"), device=X.device)
+
+	p = sample_weight
+	idxs = []
+	for i in range(k):
+		if i > 0:
+			p = sample_weight * distances
+			if p.sum() <= 0:
+				p = sample_weight * ~chosen
+			if p.sum() <= 0:
+				p = (~chosen).type(torch.float32)
+
+		idx = torch.multinomial(p, 1, generator=generator)
+		c = X[idx[0]]
+
+		d = torch.clamp(XX - 2 * torch.mv(X, c) + torch.sum(c ** 2), min=0)
+		distances = torch.minimum(distances, d)
+		chosen[idx] = True
+		idxs.append(idx)
+
+	return torch.cat(idxs)
+
+
+def _kmeans_parallel(X, k, generator, n_rounds=5, oversampling=2.0, 
+	memory_budget=None, sample_weight=None):
+	"""Select k examples from X using k-means|| seeding.
+
+	Rather than selecting one example at a time, each of `n_rounds` rounds
+	samples every example independently with probability proportional to its
+	weight times its squared distance to the nearest candidate, adding roughly
+	`oversampling * k` candidates per round. The candidates are then weighted
+	by the total weight of the examples closest to them and reduced to k
+	examples using weighted k-means++.
+
+
+	Parameters
+	----------
+	X: torch.Tensor, shape=(-1, d)
+		A set of examples.
+
+	k: int
+		The number of examples to select.
+
+	generator: torch.Generator
+		The generator to draw random numbers from.
+
+	n_rounds: int, optional
+		The number of oversampling rounds. Default is 5.
+
+	oversampling: float, optional
+		The expected number of candidates added each round, as a multiple of
+		k. Default is 2.
+
+	memory_budget: int or None, optional
+		The maximum number of distances to compute at a time. If None, compute
+		all distances at once. Default is None.
+
+	sample_weight: torch.Tensor, shape=(-1,), or None, optional
+		The weight of each example. If None, each example has a weight of 1.
+		Default is None.
+
+
+	Returns
+	-------
+	idxs: torch.Tensor, shape=(k,)
+		The indexes of the selected examples.
+	"""
+
+	if sample_weight is None:
+		idxs = torch.randint(len(X), (1,), generator=generator, 
+			device=X.device)
+	else:
+		idxs = torch.multinomial(sample_weight, 1, generator=generator)
+
+	distances, _ = _nearest_squared_distances(X, X[idxs], memory_budget)
+
+	for _ in range(n_rounds):
+		p = distances
+		if sample_weight is not None:
+			p = sample_weight * distances
+
+		total = p.sum()
+		if total <= 0:
+			break
+
+		p = torch.clamp(oversampling * k * p / total, max=1)
+		new_idxs = torch.nonzero(torch.bernoulli(p, generator=generator))[:, 0]
+		if len(new_idxs) == 0:
+			continue
+
+		d, _ = _nearest_squared_distances(X, X[new_idxs], memory_budget)
+		distances = torch.minimum(distances, d)
+		idxs = torch.cat([idxs, new_idxs])
+
+	if len(idxs) < k:
+		return _kmeans_plusplus(X, k, generator, sample_weight)
+
+	_, y = _nearest_squared_distances(X, X[idxs], memory_budget)
+	weights = torch.bincount(y, weights=sample_weight, minlength=len(idxs)
+		).type(torch.float32)
+	return idxs[_kmeans_plusplus(X[idxs], k, generator, weights)]
+
+
+def _initialize_centroids(X, k, algorithm='first-k', random_state=None,
+	memory_budget=None, sample_weight=None):
 	if isinstance(k, torch.Tensor):
 		k = k.item()
 		
@@ -330,3 +838,611 @@ def _initialize_centroids(X, k, algorithm='first-k', random_state=None):
 	elif algorithm == 'submodular-feature-based':
 		selector = FeatureBasedSelection(k, random_state=random_state)
 		return selector.fit_transform(X)
+
+	elif algorithm in ('kmeans++', 'kmeans||'):
+		generator = torch.Generator(device=X.device)
+		generator.manual_seed(int(random_state.randint(2**31)))
+
+		X_ = X
+		if isinstance(X, torch.masked.MaskedTensor):
+			X_ = X._masked_data * X._masked_mask
+
+		X_ = X_.type(torch.float32)
+		if sample_weight is not None:
+			if isinstance(sample_weight, torch.masked.MaskedTensor):
+				sample_weight = (sample_weight._masked_data * 
+					sample_weight._masked_mask)
+
+			if sample_weight.ndim == 2:
+				sample_weight = sample_weight.mean(dim=1)
+
+			sample_weight = sample_weight.type(torch.float32).to(X.device)
+
+		if algorithm == 'kmeans++':
+			idxs = _kmeans_plusplus(X_, k, generator, sample_weight)
+		else:
+			idxs = _kmeans_parallel(X_, k, generator, 
+				memory_budget=memory_budget, sample_weight=sample_weight)
+
+		return _cast_as_tensor(torch.clone(X[idxs]), dtype=torch.float32)
+
+
+def _active_batch_sizes(lengths, n, l):
+	"""Return the number of sequences that are active at each step.
+
+	When a batch of sequences of different lengths is padded to a common
+	length and sorted by length in descending order, the sequences that have
+	not yet ended at each step are always the first ones in the batch. This
+	returns how many of them there are at each step so that the algorithms can
+	shrink the batch as sequences end instead of computing over padding.
+
+
+	Parameters
+	----------
+	lengths: torch.Tensor or None, shape=(n,)
+		The length of each sequence, sorted in descending order. If None, each
+		sequence has length l.
+
+	n: int
+		The number of sequences.
+
+	l: int
+		The length that the sequences are padded to.
+
+
+	Returns
+	-------
+	batch_sizes: list
+		The number of active sequences at each of the l steps.
+	"""
+
+	if lengths is None:
+		return [n] * l
+
+	steps = torch.arange(l, device=lengths.device).unsqueeze(1)
+	return torch.sum(lengths.unsqueeze(0) > steps, dim=1).tolist()
+
+
+@torch.inference_mode()
+def _checkpointed_forward_backward(model, emissions, priors, lengths=None):
+	"""Run the forward-backward algorithm storing only some forward messages.
+
+	The forward-backward algorithm usually stores the forward and backward
+	messages for every observation, as well as the probability of every
+	transition at every step before summing them, which takes memory linear
+	in the length of the sequences. Instead, this stores the forward messages
+	only every s = ceil(sqrt(l)) observations. The backward pass then walks
+	over the segments between these checkpoints from last to first,
+	recomputes the forward messages within each segment from its checkpoint,
+	and adds the expected transitions at each step into a running sum. This
+	takes O(sqrt(l)) messages of memory, aside from the returned
+	responsibilities, at the cost of running the forward pass twice.
+
+	The model must implement `_forward_step`, `_backward_step` and
+	`_transition_step`, and the returned values are the same as those of its
+	`forward_backward` method.
+
+
+	Parameters
+	----------
+	model: _DenseHMM or _SparseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		Precalculated emission log probabilities.
+
+	priors: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		Prior log probabilities of assigning each symbol to each node.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	transitions: torch.Tensor, shape=(-1, *model._xw_sum.shape)
+		The expected number of transitions across each edge for each example.
+
+	responsibility: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log posterior probabilities of each observation under each node.
+
+	starts: torch.Tensor, shape=(-1, model.n_nodes)
+		The probabilities of starting at each node.
+
+	ends: torch.Tensor, shape=(-1, model.n_nodes)
+		The probabilities of ending at each node.
+
+	logp: torch.Tensor, shape=(-1,)
+		The log probabilities of each sequence given the model.
+	"""
+
+	n, l, k = emissions.shape
+	batch_sizes = _active_batch_sizes(lengths, n, l) + [0]
+	s = max(1, math.ceil(l ** 0.5))
+
+	neginf = lambda: torch.full((n, k), float("-inf"), device=model.device)
+
+	def _step(f, i):
+		m = batch_sizes[i]
+		f_ = neginf()
+		f_[:m] = model._forward_step(f[:m], emissions[:m, i], priors[:m, i])
+		return f_
+
+	f = model.starts + emissions[:, 0] + priors[:, 0]
+	f_last = neginf()
+	checkpoints = []
+
+	for i in range(l):
+		if i > 0:
+			f = _step(f, i)
+		if i % s == 0:
+			checkpoints.append(f)
+
+		f_last[batch_sizes[i+1]:batch_sizes[i]] = f[batch_sizes[i+1]:
+			batch_sizes[i]]
+
+	logp = torch.logsumexp(f_last + model.ends, dim=1)
+
+	t = torch.zeros(n, *model._xw_sum.shape, device=model.device)
+	r = torch.empty(n, l, k, device=model.device)
+	b = neginf()
+
+	for c in range(len(checkpoints)-1, -1, -1):
+		fs = [checkpoints[c]]
+		for i in range(c*s+1, min(c*s+s, l)):
+			fs.append(_step(fs[-1], i))
+
+		for i in range(min(c*s+s, l)-1, c*s-1, -1):
+			f, m = fs[i - c*s], batch_sizes[i+1]
+			b_ = neginf()
+
+			if m > 0:
+				p = model._transition_step(f[:m], b[:m], emissions[:m, i+1], 
+					priors[:m, i+1])
+				t[:m] += torch.exp(p - logp[:m].reshape(-1, *[1]*(p.ndim-1)))
+				b_[:m] = model._backward_step(b[:m], emissions[:m, i+1], 
+					priors[:m, i+1])
+
+			b_[m:batch_sizes[i]] = model.ends
+			b = b_
+
+			r_ = f + b
+			r[:, i] = r_ - torch.logsumexp(r_, dim=1, keepdims=True)
+
+	starts = model.starts + emissions[:, 0] + priors[:, 0] + b
+	starts = torch.exp(starts.T - torch.logsumexp(starts, dim=-1)).T
+
+	ends = model.ends + f_last
+	ends = torch.exp(ends.T - torch.logsumexp(ends, dim=-1)).T
+
+	if lengths is not None:
+		mask = torch.arange(l, device=model.device) < lengths.unsqueeze(1)
+		r[~mask] = float("-inf")
+
+	return t, r, starts, ends, logp
+
+
+def _scaled_forward(model, emissions, lengths=None):
+	"""Run the forward algorithm in probability space with scaling.
+
+	Rather than working with log probabilities, which requires a log and an
+	exp at every step, this implementation works with probabilities and, as
+	in Rabiner (1989), divides the forward messages at each step by their sum
+	so that they do not underflow. Emissions are converted to probabilities
+	once, after subtracting the maximum at each observation, and the log of
+	the normalizers and of these maximums are added back at the end, so that
+	the returned values are the same log probabilities as in the log-space
+	implementation. Each step of the loop is only a propagation through the
+	transitions, a multiplication, a sum and a division.
+
+	The model must implement `_transition_probs` and `_scaled_forward_step`.
+
+
+	Parameters
+	----------
+	model: _DenseHMM or _SparseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probability of each observation under each node, including
+		any priors.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	f: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probabilities calculated by the forward algorithm.
+	"""
+
+	n, l, k = emissions.shape
+	batch_sizes = _active_batch_sizes(lengths, n, l)
+	tiny = torch.finfo(torch.float32).tiny
+
+	emissions = emissions.permute(1, 0, 2)
+	e_max = torch.amax(emissions, dim=-1, keepdims=True)
+	e_max = torch.where(torch.isinf(e_max), 0, e_max)
+
+	alpha = torch.empty(l, n, k, device=model.device)
+	torch.sub(emissions, e_max, out=alpha).exp_()
+	c = torch.ones(l, n, 1, device=model.device)
+	p = model._transition_probs()
+
+	alpha[0] *= torch.exp(model.starts)
+	c[0] = alpha[0].sum(dim=-1, keepdims=True).clamp_(min=tiny)
+	alpha[0] /= c[0]
+
+	for i in range(1, l):
+		m = batch_sizes[i]
+
+		alpha[i, :m] *= model._scaled_forward_step(alpha[i-1, :m], p)
+		z = alpha[i, :m].sum(dim=-1, keepdims=True).clamp_(min=tiny)
+
+		alpha[i, :m] /= z
+		alpha[i, m:] = 0
+		c[i, :m] = z
+
+	f = alpha.log_()
+	f += torch.cumsum(torch.log(c) + e_max, dim=0)
+	return f.permute(1, 0, 2)
+
+
+def _scaled_backward(model, emissions, lengths=None):
+	"""Run the backward algorithm in probability space with scaling.
+
+	This is the backward counterpart to `_scaled_forward`. The backward
+	messages are divided by their sum at each step and the log of these
+	normalizers, and of the maximum emission at each observation, are added
+	back at the end so that the returned values are log probabilities.
+
+	The model must implement `_transition_probs` and `_scaled_backward_step`.
+
+
+	Parameters
+	----------
+	model: _DenseHMM or _SparseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probability of each observation under each node, including
+		any priors.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	b: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probabilities calculated by the backward algorithm.
+	"""
+
+	n, l, k = emissions.shape
+	batch_sizes = _active_batch_sizes(lengths, n, l)
+	tiny = torch.finfo(torch.float32).tiny
+
+	emissions = emissions.permute(1, 0, 2)
+	e_max = torch.amax(emissions, dim=-1, keepdims=True)
+	e_max = torch.where(torch.isinf(e_max), 0, e_max)
+
+	e = torch.empty(l, n, k, device=model.device)
+	torch.sub(emissions, e_max, out=e).exp_()
+	d = torch.ones(l, n, 1, device=model.device)
+	s = torch.zeros(l, n, 1, device=model.device)
+	p = model._transition_probs()
+
+	# The emissions are overwritten with the backward messages as the
+	# algorithm proceeds, with the messages for the current observation
+	# kept in `beta` until the emissions there are no longer needed.
+	ends = torch.exp(model.ends)
+	beta = torch.zeros(n, k, device=model.device)
+	beta[:batch_sizes[-1]] = ends
+
+	for i in range(l-2, -1, -1):
+		m = batch_sizes[i+1]
+
+		a = model._scaled_backward_step(beta[:m] * e[i+1, :m], p)
+		z = a.sum(dim=-1, keepdims=True).clamp_(min=tiny)
+
+		e[i+1, :m] = beta[:m]
+		e[i+1, m:] = 0
+
+		beta[:m] = a.div_(z)
+		beta[m:batch_sizes[i]] = ends
+		d[i, :m] = z
+		s[i, :m] = e_max[i+1, :m]
+
+	e[0] = beta
+
+	s += torch.log(d)
+	s = torch.flip(torch.cumsum(torch.flip(s, dims=(0,)), dim=0), dims=(0,))
+
+	b = e.log_()
+	b += s
+	return b.permute(1, 0, 2)
+
+
+def _log_matmul(A, B):
+	"""Multiply two batches of matrices in the log semiring.
+
+	This returns log(exp(A) @ exp(B)), calculated stably by subtracting the
+	maximum of each row of A and of each column of B before exponentiating.
+
+
+	Parameters
+	----------
+	A: torch.Tensor, shape=(..., k, k)
+		A batch of matrices of log probabilities.
+
+	B: torch.Tensor, shape=(..., k, k)
+		A batch of matrices of log probabilities.
+
+
+	Returns
+	-------
+	C: torch.Tensor, shape=(..., k, k)
+		The products of the matrices in the log semiring.
+	"""
+
+	a_max = torch.amax(A, dim=-1, keepdims=True)
+	a_max = torch.where(torch.isinf(a_max), 0, a_max)
+
+	b_max = torch.amax(B, dim=-2, keepdims=True)
+	b_max = torch.where(torch.isinf(b_max), 0, b_max)
+
+	C = torch.matmul(torch.exp(A - a_max), torch.exp(B - b_max))
+	return torch.log(C) + a_max + b_max
+
+
+def _max_matmul(A, B):
+	"""Multiply two batches of matrices in the max-plus semiring.
+
+	This returns the maximum over m of A[..., i, m] + B[..., m, j], looping
+	over m so that only tensors the size of A are created.
+
+
+	Parameters
+	----------
+	A: torch.Tensor, shape=(..., k, k)
+		A batch of matrices of log probabilities.
+
+	B: torch.Tensor, shape=(..., k, k)
+		A batch of matrices of log probabilities.
+
+
+	Returns
+	-------
+	C: torch.Tensor, shape=(..., k, k)
+		The products of the matrices in the max-plus semiring.
+	"""
+
+	C = A[..., :, 0:1] + B[..., 0:1, :]
+	for m in range(1, A.shape[-1]):
+		torch.maximum(C, A[..., :, m:m+1] + B[..., m:m+1, :], out=C)
+
+	return C
+
+
+def _associative_scan(X, op, reverse=False):
+	"""Calculate the inclusive scan of a sequence under an associative op.
+
+	This uses the Hillis-Steele algorithm, which calculates all prefixes, or
+	suffixes when `reverse` is True, in log2(l) rounds where each round
+	applies the operation to every position at once. Although this does
+	O(l log l) work instead of O(l), each round is a single batched call
+	that can use all cores even when there are few sequences.
+
+
+	Parameters
+	----------
+	X: torch.Tensor, shape=(-1, l, ...)
+		The elements to scan over, with the second dimension being the one
+		that is scanned.
+
+	op: callable
+		An associative function that takes in an earlier and a later batch of
+		elements and returns their combination.
+
+	reverse: bool, optional
+		Whether to calculate suffixes rather than prefixes. Default is False.
+
+
+	Returns
+	-------
+	X: torch.Tensor, shape=(-1, l, ...)
+		The combination of all elements up to, or from when `reverse` is True,
+		each position.
+	"""
+
+	l, d = X.shape[1], 1
+	while d < l:
+		if reverse:
+			X = torch.cat([op(X[:, :-d], X[:, d:]), X[:, -d:]], dim=1)
+		else:
+			X = torch.cat([X[:, :d], op(X[:, :-d], X[:, d:])], dim=1)
+
+		d *= 2
+
+	return X
+
+
+def _scan_transitions(model, emissions, lengths=None, shift=0):
+	"""Return the transition matrix for each step of a dense HMM.
+
+	The matrix for step i is the transition log probabilities plus the
+	emissions at step i + shift added to each row. Steps past the end of a
+	sequence, given `lengths`, are replaced with the identity matrix of the
+	log semiring so that they do not change the scan.
+	"""
+
+	n, l, k = emissions.shape
+	X = model.edges + emissions[:, shift:].unsqueeze(-2)
+
+	if lengths is not None:
+		eye = torch.full((k, k), float("-inf"), device=model.device)
+		eye.fill_diagonal_(0)
+
+		idx = torch.arange(l - shift, device=model.device) + shift
+		X[idx >= lengths.unsqueeze(-1)] = eye
+
+	return X
+
+
+def _scan_forward(model, emissions, lengths=None):
+	"""Run the forward algorithm of a dense HMM using a parallel scan.
+
+	The forward messages at step i are the start probabilities and emissions
+	at the first observation multiplied, in the log semiring, by the
+	transition matrices of each step up to i. Because this product is
+	associative, all of the messages can be calculated in log2(l) rounds of
+	batched matrix products using `_associative_scan`. The start
+	probabilities are included as a first matrix whose rows are each the
+	initial forward message, so that the first row of each prefix is the
+	forward message at that step.
+
+
+	Parameters
+	----------
+	model: _DenseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probability of each observation under each node, including
+		any priors.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	f: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probabilities calculated by the forward algorithm.
+	"""
+
+	n, l, k = emissions.shape
+
+	f0 = model.starts + emissions[:, :1]
+	X = torch.cat([f0.unsqueeze(-2).expand(-1, -1, k, -1), 
+		_scan_transitions(model, emissions, lengths, shift=1)], dim=1)
+
+	f = _associative_scan(X, _log_matmul)[:, :, 0]
+	if lengths is not None:
+		mask = torch.arange(l, device=model.device) >= lengths.unsqueeze(-1)
+		f[mask] = float("-inf")
+
+	return f
+
+
+def _scan_backward(model, emissions, lengths=None):
+	"""Run the backward algorithm of a dense HMM using a parallel scan.
+
+	This is the backward counterpart to `_scan_forward`. The backward messages
+	at step i are the suffix products of the transition matrices of the
+	following steps, with a final matrix whose columns are each the end
+	probabilities, so that the first column of each suffix is the backward
+	message at that step.
+
+
+	Parameters
+	----------
+	model: _DenseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probability of each observation under each node.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	b: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probabilities calculated by the backward algorithm.
+	"""
+
+	n, l, k = emissions.shape
+
+	ends = model.ends.unsqueeze(-1).expand(n, 1, k, k)
+	X = torch.cat([_scan_transitions(model, emissions, lengths, shift=1), 
+		ends], dim=1)
+
+	b = _associative_scan(X, _log_matmul, reverse=True)[..., 0]
+	if lengths is not None:
+		mask = torch.arange(l, device=model.device) >= lengths.unsqueeze(-1)
+		b[mask] = float("-inf")
+
+	return b
+
+
+def _scan_viterbi(model, emissions, lengths=None):
+	"""Run the Viterbi algorithm of a dense HMM using parallel scans.
+
+	The Viterbi messages are calculated like the forward messages in
+	`_scan_forward` but in the max-plus semiring. The backpointers at every
+	step are then calculated at once from these messages and the path is
+	recovered with a second scan that composes the backpointers of each step,
+	so that the node at step i is the composition of the backpointers after
+	step i applied to the best final node.
+
+
+	Parameters
+	----------
+	model: _DenseHMM
+		The hidden Markov model to run the algorithm with.
+
+	emissions: torch.Tensor, shape=(-1, -1, model.n_nodes)
+		The log probability of each observation under each node, including
+		any priors.
+
+	lengths: torch.Tensor, shape=(-1,), optional
+		The length of each sequence, sorted in descending order, when
+		sequences of different lengths have been padded to a common length.
+		Default is None.
+
+
+	Returns
+	-------
+	path: torch.Tensor, shape=(-1, -1), dtype=torch.int64
+		The node that each observation is aligned to in the most likely
+		path through the model.
+
+	logp: torch.Tensor, shape=(-1,)
+		The log probability of the most likely path for each example.
+	"""
+
+	n, l, k = emissions.shape
+
+	v0 = model.starts + emissions[:, :1]
+	X = torch.cat([v0.unsqueeze(-2).expand(-1, -1, k, -1), 
+		_scan_transitions(model, emissions, lengths, shift=1)], dim=1)
+
+	v = _associative_scan(X, _max_matmul)[:, :, 0]
+	logp, state = torch.max(v[:, -1] + model.ends, dim=-1)
+
+	ptr = torch.max(v[:, :-1].unsqueeze(-1) + model.edges, dim=-2).indices
+	if lengths is not None:
+		idx = torch.arange(1, l, device=model.device)
+		ptr[idx >= lengths.unsqueeze(-1)] = torch.arange(k, 
+			device=model.device)
+
+	ptr = _associative_scan(ptr, lambda a, b: a.gather(-1, b), reverse=True)
+
+	path = torch.empty(n, l, dtype=torch.int64, device=model.device)
+	path[:, :-1] = ptr.gather(-1, state.reshape(n, 1, 1).expand(-1, l-1, 1)
+		)[..., 0]
+	path[:, -1] = state
+	return path, logp
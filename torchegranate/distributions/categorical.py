@@ -140,11 +140,8 @@ class Categorical(Distribution):
 		X = _check_parameter(_cast_as_tensor(X), "X", min_value=0.0,
 			max_value=self.n_keys-1, ndim=2, shape=(-1, self.d))
 
-		logps = torch.zeros(X.shape[0], dtype=self.probs.dtype)
-		for i in range(self.d):
-			logps += self._log_probs[i][X[:, i]]
-
-		return logps
+		X = X.type(torch.int64).T
+		return torch.gather(self._log_probs, 1, X).sum(dim=0)
 
 	def summarize(self, X, sample_weight=None):
 		"""Extract the sufficient statistics from a batch of data.
@@ -178,9 +175,12 @@ class Categorical(Distribution):
 			ndim=2, shape=(-1, self.d))
 		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight))
 
+		idxs = X.type(torch.int64) + torch.arange(self.d, 
+			device=self.device) * self.n_keys
+
 		self._w_sum += torch.sum(sample_weight, dim=0)
-		for i in range(self.n_keys):
-			self._xw_sum[:, i] += torch.sum((X == i) * sample_weight, dim=0)
+		self._xw_sum.view(-1).scatter_add_(0, idxs.reshape(-1), 
+			sample_weight.reshape(-1).type(self._xw_sum.dtype))
 
 	def from_summaries(self):
 		"""Update the model parameters given the extracted statistics.
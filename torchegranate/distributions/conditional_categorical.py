@@ -1,6 +1,7 @@
 # conditional_categorical.py
 # Contact: Jacob Schreiber <jmschreiber91@gmail.com>
 
+import math
 import numpy
 import torch
 import itertools
@@ -10,16 +11,44 @@ from .._utils import _cast_as_parameter
 from .._utils import _update_parameter
 from .._utils import _check_parameter
 from .._utils import _reshape_weights
+from .._utils import _ravel_multi_index
+from .._utils import _sparse_lookup
+from .._utils import _sparse_add
 
 from .._utils import BufferList
 
 from ._distribution import Distribution
 from .categorical import Categorical
 
+
+def _sparse_cell_lookup(keys, values, parent_keys, parent_values, idxs, 
+	n_child, default):
+	"""Look up cells in a sparse conditional probability table.
+
+	Observed cells are stored in `keys` and `values`. An unobserved cell takes
+	the value stored for its parent combination in `parent_keys` and
+	`parent_values` or, if the parent combination was not observed either,
+	the default value.
+	"""
+
+	parent_default = _sparse_lookup(parent_keys, parent_values, 
+		idxs // n_child, default)
+	return _sparse_lookup(keys, values, idxs, parent_default)
+
+
 class ConditionalCategorical(Distribution):
-	"""Still under development."""
+	"""Still under development.
+
+	When `sparse=True`, only the observed cells of each conditional table are
+	stored. The probabilities of observed cells are kept in `probs` with their
+	flat indexes in `keys`, and the probability of an unobserved child value
+	given an observed parent combination is kept in `parent_probs` with the
+	flat indexes of those parent combinations in `parent_keys`. Unobserved
+	parent combinations are uniform over the child values.
+	"""
 	
-	def __init__(self, probs=None, n_categories=None, pseudocount=0, inertia=0.0, frozen=False):
+	def __init__(self, probs=None, n_categories=None, pseudocount=0, inertia=0.0, frozen=False, 
+		sparse=False):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "ConditionalCategorical"
 
@@ -39,10 +68,32 @@ class ConditionalCategorical(Distribution):
 			self.n_categories = n_categories
 		
 		self.pseudocount = _check_parameter(pseudocount, "pseudocount")
+		self.sparse = _check_parameter(sparse, "sparse", value_set=(True, False))
 
 		self._initialized = probs is not None
 		self.d = len(self.probs) if self._initialized else None
 		self.n_parents = len(self.probs[0].shape) if self._initialized else None
+
+		if self._initialized and self.sparse:
+			keys, parent_keys, parent_probs = [], [], []
+
+			for j, prob in enumerate(self.probs):
+				prob = prob.reshape(-1)
+				keys.append(torch.nonzero(prob)[:, 0])
+				parent_keys.append(torch.unique(keys[j] // 
+					self.n_categories[j][-1]))
+				parent_probs.append(torch.zeros(len(parent_keys[j]), 
+					dtype=prob.dtype, device=prob.device))
+
+			probs = [prob.reshape(-1)[keys_].detach() for prob, keys_ in 
+				zip(self.probs, keys)]
+
+			del self.probs
+			self.keys = BufferList(keys)
+			self.probs = BufferList(probs)
+			self.parent_keys = BufferList(parent_keys)
+			self.parent_probs = BufferList(parent_probs)
+
 		self._reset_cache()
 
 	def _initialize(self, d, n_categories):
@@ -54,8 +105,18 @@ class ConditionalCategorical(Distribution):
 				self.n_categories.append(tuple(n_cat.tolist()))
 
 		self.n_parents = len(self.n_categories[0])
-		self.probs = torch.nn.ParameterList([_cast_as_parameter(torch.zeros(
-			*cats, device=self.device, requires_grad=False)) for cats in self.n_categories])
+
+		if self.sparse:
+			_empty = lambda dtype: BufferList([torch.zeros(0, dtype=dtype, 
+				device=self.device) for _ in range(d)])
+
+			self.keys = _empty(torch.int64)
+			self.probs = _empty(torch.float32)
+			self.parent_keys = _empty(torch.int64)
+			self.parent_probs = _empty(torch.float32)
+		else:
+			self.probs = torch.nn.ParameterList([_cast_as_parameter(torch.zeros(
+				*cats, device=self.device, requires_grad=False)) for cats in self.n_categories])
 
 		self._initialized = True
 		super()._initialize(d)
@@ -64,6 +125,22 @@ class ConditionalCategorical(Distribution):
 		if self._initialized == False:
 			return
 
+		if self.sparse:
+			dtype, device = self.probs[0].dtype, self.probs[0].device
+			_empty = lambda dtype: BufferList([torch.zeros(0, dtype=dtype, 
+				device=device) for _ in range(self.d)])
+
+			self._w_keys = _empty(torch.int64)
+			self._w_sum = _empty(dtype)
+			self._xw_keys = _empty(torch.int64)
+			self._xw_sum = _empty(dtype)
+
+			self._log_probs = BufferList([torch.log(prob) for prob in 
+				self.probs])
+			self._log_parent_probs = BufferList([torch.log(prob) for prob in 
+				self.parent_probs])
+			return
+
 		_w_sum = []
 		_xw_sum = []
 
@@ -83,9 +160,18 @@ class ConditionalCategorical(Distribution):
 		logps = torch.zeros(len(X), dtype=self.probs[0].dtype, device=X.device, 
 			requires_grad=False)
 
-		for i in range(len(X)):
-			for j in range(self.d):
-				logps[i] += self._log_probs[j][tuple(X[i, :, j])]
+		for j in range(self.d):
+			_check_parameter(X[:, :, j], "X", min_value=0, 
+				max_value=torch.tensor(self.n_categories[j]) - 1)
+			idxs = _ravel_multi_index(X[:, :, j], self.n_categories[j])
+
+			if self.sparse:
+				n_child = self.n_categories[j][-1]
+				logps += _sparse_cell_lookup(self.keys[j], self._log_probs[j], 
+					self.parent_keys[j], self._log_parent_probs[j], idxs, 
+					n_child, -math.log(n_child))
+			else:
+				logps += self._log_probs[j].view(-1)[idxs]
 
 		return logps
 
@@ -116,17 +202,33 @@ class ConditionalCategorical(Distribution):
 		_check_parameter(_cast_as_tensor(sample_weight), "sample_weight", 
 			min_value=0, ndim=2, shape=(X.shape[0], X.shape[2]))
 
-		for i in range(len(X)):
-			for j in range(self.d):
-				X_ = tuple(X[i, :, j])
+		for j in range(self.d):
+			_check_parameter(X[:, :, j], "X", min_value=0, 
+				max_value=torch.tensor(self.n_categories[j]) - 1)
+
+		for j in range(self.d):
+			idxs = _ravel_multi_index(X[:, :, j], self.n_categories[j])
+			w = sample_weight[:, j].type(self._xw_sum[j].dtype)
+
+			if self.sparse:
+				self._w_keys[j], self._w_sum[j] = _sparse_add(self._w_keys[j], 
+					self._w_sum[j], idxs // self.n_categories[j][-1], w)
+				self._xw_keys[j], self._xw_sum[j] = _sparse_add(
+					self._xw_keys[j], self._xw_sum[j], idxs, w)
+				continue
 
-				self._w_sum[j][X_[:-1]] += sample_weight[i, j]
-				self._xw_sum[j][X_] += sample_weight[i, j]
+			self._w_sum[j].view(-1).index_put_((idxs // 
+				self.n_categories[j][-1],), w, accumulate=True)
+			self._xw_sum[j].view(-1).index_put_((idxs,), w, accumulate=True)
 
 	def from_summaries(self):
 		if self.frozen == True:
 			return
 
+		if self.sparse:
+			self._sparse_from_summaries()
+			return
+
 		for i in range(self.d):
 			probs = self._xw_sum[i] / self._w_sum[i].unsqueeze(-1)
 			probs = torch.nan_to_num(probs, 1. / probs.shape[-1])
@@ -135,3 +237,39 @@ class ConditionalCategorical(Distribution):
 
 		self._reset_cache()
 
+	def _sparse_from_summaries(self):
+		for i in range(self.d):
+			n_child = self.n_categories[i][-1]
+
+			keys = self._xw_keys[i]
+			w_sum = _sparse_lookup(self._w_keys[i], self._w_sum[i], 
+				keys // n_child, 0) + self.pseudocount * n_child
+			probs = torch.nan_to_num((self._xw_sum[i] + self.pseudocount) / 
+				w_sum, 1. / n_child)
+
+			parent_keys = self._w_keys[i]
+			parent_probs = torch.nan_to_num(self.pseudocount / (self._w_sum[i] 
+				+ self.pseudocount * n_child), 1. / n_child)
+
+			if self.inertia > 0:
+				new = keys, probs, parent_keys, parent_probs
+				old = (self.keys[i], self.probs[i], self.parent_keys[i], 
+					self.parent_probs[i])
+
+				keys = torch.unique(torch.cat([old[0], new[0]]))
+				probs = self.inertia * _sparse_cell_lookup(*old, keys, n_child, 
+					1. / n_child) + (1 - self.inertia) * _sparse_cell_lookup(
+					*new, keys, n_child, 1. / n_child)
+
+				parent_keys = torch.unique(torch.cat([old[2], new[2]]))
+				parent_probs = self.inertia * _sparse_lookup(old[2], old[3], 
+					parent_keys, 1. / n_child) + (1 - self.inertia) * \
+					_sparse_lookup(new[2], new[3], parent_keys, 1. / n_child)
+
+			self.keys[i] = keys
+			self.probs[i] = probs
+			self.parent_keys[i] = parent_keys
+			self.parent_probs[i] = parent_probs
+
+		self._reset_cache()
+
@@ -1,21 +1,33 @@
 # joint_categorical.py
 # Contact: Jacob Schreiber <jmschreiber91@gmail.com>
 
+import math
 import torch
 
 from .._utils import _cast_as_tensor
 from .._utils import _update_parameter
 from .._utils import _check_parameter
 from .._utils import _reshape_weights
+from .._utils import _ravel_multi_index
+from .._utils import _sparse_lookup
+from .._utils import _sparse_add
 
 from ._distribution import Distribution
 from .categorical import Categorical
 
 
 class JointCategorical(Distribution):
-	"""Still under development."""
+	"""Still under development.
+
+	When `sparse=True`, only the cells of the joint table that have been
+	observed are stored, as a sorted tensor of flat indexes in `keys` with
+	their probabilities in `probs`. Every other cell has the probability
+	`default_prob`, which comes from the pseudocount. Memory is proportional
+	to the number of observed cells rather than to the size of the table.
+	"""
 	
-	def __init__(self, probs=None, n_categories=None, pseudocount=0, inertia=0.0, frozen=False):
+	def __init__(self, probs=None, n_categories=None, pseudocount=0, inertia=0.0, frozen=False, 
+		sparse=False):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "JointCategorical"
 
@@ -24,6 +36,7 @@ class JointCategorical(Distribution):
 
 		self.n_categories = _check_parameter(n_categories, "n_categories", min_value=2)
 		self.pseudocount = _check_parameter(pseudocount, "pseudocount")
+		self.sparse = _check_parameter(sparse, "sparse", value_set=(True, False))
 
 		self._initialized = probs is not None
 		self.d = len(self.probs.shape) if self._initialized else None
@@ -38,10 +51,27 @@ class JointCategorical(Distribution):
 		else:
 			self.n_categories = None
 
+		if self._initialized and self.sparse:
+			probs = self.probs.reshape(-1)
+			keys = torch.nonzero(probs)[:, 0]
+
+			del self.probs
+			self.register_buffer("keys", keys)
+			self.register_buffer("probs", probs[keys])
+			self.register_buffer("default_prob", torch.tensor(0, 
+				dtype=probs.dtype))
+
 		self._reset_cache()
 
 	def _initialize(self, d, n_categories):
-		self.probs = torch.zeros(*n_categories)
+		if self.sparse:
+			del self.probs
+			self.register_buffer("keys", torch.zeros(0, dtype=torch.int64))
+			self.register_buffer("probs", torch.zeros(0))
+			self.register_buffer("default_prob", torch.tensor(0.))
+			n_categories = tuple(int(n) for n in n_categories)
+		else:
+			self.probs = torch.zeros(*n_categories)
 
 		self.n_categories = n_categories
 		self._initialized = True
@@ -51,23 +81,51 @@ class JointCategorical(Distribution):
 		if self._initialized == False:
 			return
 
-		self._w_sum = torch.zeros(self.d, dtype=self.probs.dtype)
-		self._xw_sum = torch.zeros(*self.n_categories, dtype=self.probs.dtype)
+		if self.sparse:
+			dtype, device = self.probs.dtype, self.probs.device
+
+			self.register_buffer("_w_sum", torch.zeros(self.d, dtype=dtype, 
+				device=device))
+			self.register_buffer("_xw_keys", torch.zeros(0, 
+				dtype=torch.int64, device=device))
+			self.register_buffer("_xw_sum", torch.zeros(0, dtype=dtype, 
+				device=device))
+			self.register_buffer("_log_probs", torch.log(self.probs))
+			self.register_buffer("_log_default_prob", torch.log(
+				self.default_prob))
+			return
 
+		self._w_sum = torch.zeros(self.d, dtype=self.probs.dtype)
 		self._log_probs = torch.log(self.probs)
+		self._xw_sum = torch.zeros(*self.n_categories, dtype=self.probs.dtype)
 
 	def log_probability(self, X):
 		X = _check_parameter(_cast_as_tensor(X), "X", 
 			value_set=tuple(range(max(self.n_categories)+1)), ndim=2, 
 			shape=(-1, self.d))
+		X = _check_parameter(X, "X", max_value=torch.tensor(
+			self.n_categories) - 1)
 
-		logps = torch.zeros(len(X), dtype=self.probs.dtype)
-		for i in range(len(X)):
-			logps[i] = self._log_probs[tuple(X[i])]
+		idxs = _ravel_multi_index(X, self.n_categories)
+		if self.sparse:
+			return _sparse_lookup(self.keys, self._log_probs, idxs, 
+				self._log_default_prob)
 
-		return logps
+		return self._log_probs.reshape(-1)[idxs]
 
 	def marginal(self, dims=0):
+		if self.sparse:
+			n = self.n_categories[dims]
+			stride = math.prod(self.n_categories[dims+1:])
+			values = (self.keys // stride) % n
+
+			probs = torch.full((n,), math.prod(self.n_categories) // n, 
+				dtype=self.probs.dtype)
+			probs.scatter_add_(0, values, -torch.ones_like(self.probs))
+			probs *= self.default_prob
+			probs.scatter_add_(0, values, self.probs)
+			return Categorical(probs.unsqueeze(1))
+
 		dims = tuple(i for i in range(self.probs.ndim) if i != dims)
 		return Categorical(self.probs.sum(dim=dims).unsqueeze(1))
 
@@ -83,19 +141,49 @@ class JointCategorical(Distribution):
 
 		X = _check_parameter(X, "X", shape=(-1, self.d), 
 			value_set=tuple(range(max(self.n_categories)+1)))
+		X = _check_parameter(X, "X", max_value=torch.tensor(
+			self.n_categories) - 1)
 
 		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
 			dtype=torch.float32))[:,0]
 
+		idxs = _ravel_multi_index(X, self.n_categories)
 		self._w_sum += torch.sum(sample_weight, dim=0)
-		for i in range(len(X)):
-			self._xw_sum[tuple(X[i])] += sample_weight[i]
+
+		if self.sparse:
+			self._xw_keys, self._xw_sum = _sparse_add(self._xw_keys, 
+				self._xw_sum, idxs, sample_weight)
+			return
+
+		counts = torch.bincount(idxs, weights=sample_weight.type(
+			self._xw_sum.dtype), minlength=self._xw_sum.numel())
+		self._xw_sum += counts.reshape(self._xw_sum.shape)
 
 	def from_summaries(self):
 		if self.frozen == True:
 			return
 
-		probs = self._xw_sum / self._w_sum[0]
+		if self.sparse:
+			n_cells = math.prod(int(n) for n in self.n_categories)
+			w_sum = self._w_sum[0] + self.pseudocount * n_cells
+			probs = (self._xw_sum + self.pseudocount) / w_sum
+			default_prob = self.pseudocount / w_sum
+
+			if self.inertia > 0:
+				keys = torch.unique(torch.cat([self.keys, self._xw_keys]))
+				probs = self.inertia * _sparse_lookup(self.keys, self.probs, 
+					keys, self.default_prob) + (1 - self.inertia) * \
+					_sparse_lookup(self._xw_keys, probs, keys, default_prob)
+				default_prob = self.inertia * self.default_prob + \
+					(1 - self.inertia) * default_prob
+			else:
+				keys = self._xw_keys
+
+			self.keys = keys
+			self.probs = probs
+			self.default_prob = default_prob
+		else:
+			probs = self._xw_sum / self._w_sum[0]
+			_update_parameter(self.probs, probs, self.inertia)
 
-		_update_parameter(self.probs, probs, self.inertia)
 		self._reset_cache()
@@ -9,6 +9,7 @@ from .._utils import _cast_as_parameter
 from .._utils import _update_parameter
 from .._utils import _check_parameter
 from .._utils import _reshape_weights
+from .._utils import _summarize_batches
 
 from ._distribution import Distribution
 
@@ -171,11 +172,16 @@ class ZeroInflated(Distribution):
 		Parameters
 		----------
 		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
-			A set of examples to evaluate. 
+			A set of examples to evaluate. Alternatively, an iterable that
+			yields batches of examples, such as a DataLoader, where each batch
+			is either a tensor or a tuple of (X, sample_weight). In this case
+			the sufficient statistics are accumulated across all batches in
+			each iteration.
 
 		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
 			A set of weights for the examples. This can be either of shape
-			(-1, self.d) or a vector of shape (-1,). Default is ones.
+			(-1, self.d) or a vector of shape (-1,). Must be None if X is a
+			collection of batches. Default is ones.
 
 
 		Returns
@@ -188,7 +194,7 @@ class ZeroInflated(Distribution):
 			start_time = time.time()
 
 			last_logp = logp
-			logp = self.summarize(X, sample_weight=sample_weight)
+			logp = _summarize_batches(self, X, sample_weight=sample_weight)
 
 			if i > 0:
 				improvement = logp - last_logp
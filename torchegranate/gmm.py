@@ -1,6 +1,7 @@
 # gmm.py
 # Author: Jacob Schreiber <jmschreiber91@gmail.com>
 
+import copy
 import time
 import numpy
 import torch
@@ -10,10 +11,15 @@ from ._utils import _cast_as_parameter
 from ._utils import _update_parameter
 from ._utils import _check_parameter
 from ._utils import _reshape_weights
+from ._utils import _summarize_batches
+from ._utils import _check_batches
+from ._utils import _partial_fit
 
 from .distributions._distribution import Distribution
 
 from ._bayes import BayesMixin
+from ._bayes import _stacked_log_probability
+from ._bayes import _stacked_summarize
 
 from .kmeans import KMeans
 
@@ -53,6 +59,21 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 	priors: tuple, numpy.ndarray, torch.Tensor, or None. shape=(k,), optional
 		The prior probabilities over the given distributions. Default is None.
 
+	init: str, optional
+		The initialization to use for the k-means initialization approach.
+		Default is 'random'. Must be one of:
+
+			'first-k': Use the first k examples from the data set
+			'random': Use a random set of k examples from the data set
+			'submodular-facility-location': Use a facility location submodular
+				objective to initialize the k-means algorithm
+			'submodular-feature-based': Use a feature-based submodular objective
+				to initialize the k-means algorithm.
+			'kmeans++': Sample each centroid with probability proportional to
+				its squared distance from the centroids already chosen
+			'kmeans||': Sample candidates in a few oversampling rounds and
+				recluster them with weighted k-means++
+
 	max_iter: int, optional
 		The number of iterations to do in the EM step of fitting the
 		distribution. Default is 10.
@@ -76,10 +97,32 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 
 	verbose: bool, optional
 		Whether to print the improvement and timings during training.
+
+	step_offset: float, optional
+		The offset tau in the step size (t + tau) ** -kappa used by
+		`partial_fit`, where t is the number of previous calls. Larger values
+		slow down the early updates. Must be at least 1. Default is 1.0.
+
+	step_decay: float, (0.5, 1], optional
+		The decay kappa in the step size (t + tau) ** -kappa used by
+		`partial_fit`. Smaller values forget old batches faster. Default is
+		0.6.
+
+	n_init: int, optional
+		The number of initializations to fit when `fit` is called on a model
+		whose distributions have not been initialized. Each restart is a copy
+		of the model initialized with its own k-means clustering, and the
+		restarts are fit at the same time. When the distributions can be
+		stacked, each EM iteration calculates the log probabilities and
+		sufficient statistics of all restarts with a single set of batched
+		operations over the n_init * k distributions. The restart with the
+		highest log probability is kept. Must be fit to a single tensor.
+		Default is 1.
 	"""
 
 	def __init__(self, distributions, priors=None, init='random', max_iter=1000, 
-		tol=0.1, inertia=0.0, frozen=False, random_state=None, verbose=False):
+		tol=0.1, inertia=0.0, frozen=False, random_state=None, verbose=False,
+		step_offset=1.0, step_decay=0.6, n_init=1):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "GeneralMixtureModel"
 
@@ -109,6 +152,15 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		self.max_iter = max_iter
 		self.tol = tol
 		self.random_state = random_state
+
+		self.step_offset = _check_parameter(step_offset, "step_offset", 
+			min_value=1.0, ndim=0)
+		self.step_decay = _check_parameter(step_decay, "step_decay", 
+			min_value=0.5, max_value=1.0, ndim=0)
+		self.n_init = _check_parameter(n_init, "n_init", min_value=1, ndim=0,
+			dtypes=(int,))
+		self._n_online_steps = 0
+		self._online_statistics = {}
 		self._reset_cache()
 
 	def _initialize(self, X, sample_weight=None):
@@ -159,6 +211,143 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		self._reset_cache()
 		super()._initialize(X.shape[1])
 
+	def _summarize_restarts(self, models, X, sample_weight):
+		"""Extract the sufficient statistics for a set of restarts at once.
+
+		This method is meant to only be called internally. When the
+		distributions of every restart can be stacked, the log probabilities
+		of the examples under all n_init * k distributions are calculated
+		with one call to `_stacked_log_probability`, normalized within each
+		restart, and summarized with one call to `_stacked_summarize`.
+		Otherwise, `summarize` is called on each restart.
+
+
+		Parameters
+		----------
+		models: list
+			The restarts to summarize.
+
+		X: torch.Tensor, shape=(-1, self.d)
+			A set of examples to summarize.
+
+		sample_weight: torch.Tensor, shape=(-1, self.d)
+			The weight of each feature in each example.
+
+
+		Returns
+		-------
+		logp: torch.Tensor, shape=(len(models),)
+			The total log probability of the examples under each restart.
+		"""
+
+		distributions = [d for model in models for d in model.distributions]
+
+		e = _stacked_log_probability(distributions, X)
+		if e is None:
+			return torch.stack([model.summarize(X, sample_weight=sample_weight) 
+				for model in models])
+
+		e = e.reshape(X.shape[0], len(models), self.k)
+		e += torch.stack([model._log_priors for model in models])
+
+		logp = torch.logsumexp(e, dim=-1, keepdims=True)
+		y = torch.exp_(e.sub_(logp)).reshape(X.shape[0], -1)
+
+		w_sum = _stacked_summarize(distributions, X, y, sample_weight)
+		w_sum = w_sum.mean(dim=-1).reshape(len(models), self.k)
+
+		for model, w_sum_ in zip(models, w_sum):
+			if model.frozen == False:
+				model._w_sum[:] = model._w_sum + w_sum_
+
+		return torch.sum(logp, dim=(0, 2))
+
+	def _fit_restarts(self, X, sample_weight=None):
+		"""Fit `n_init` restarts at the same time and keep the best one.
+
+		This method is meant to only be called internally. Each restart is a
+		copy of this model that is initialized separately, and then all
+		restarts are updated together using `_summarize_restarts`. A restart
+		stops being updated when its improvement falls under `tol`, as in
+		`fit`, and the restart with the highest log probability after fitting
+		is kept.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A set of examples to evaluate.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		self
+		"""
+
+		X = _check_parameter(_cast_as_tensor(X), "X", ndim=2)
+
+		random_state = self.random_state
+		if not isinstance(random_state, numpy.random.mtrand.RandomState):
+			random_state = numpy.random.RandomState(random_state)
+
+		models = []
+		for i in range(self.n_init):
+			model = copy.deepcopy(self)
+			model.n_init = 1
+			model.random_state = random_state
+			model._initialize(X, sample_weight=sample_weight)
+			models.append(model)
+
+		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
+			dtype=torch.float32), device=self.device)
+
+		active = models
+		logp = None
+		for i in range(self.max_iter):
+			start_time = time.time()
+
+			last_logp = logp
+			logp = self._summarize_restarts(active, X, sample_weight)
+
+			converged = torch.zeros(len(active), dtype=torch.bool, 
+				device=logp.device)
+			if i > 0:
+				improvement = logp - last_logp
+				duration = time.time() - start_time
+
+				if self.verbose:
+					print("[{}] Improvement: {}, Time: {:4.4}s".format(i, 
+						improvement, duration))
+
+				converged = improvement < self.tol
+
+			for model, converged_ in zip(active, converged):
+				if converged_:
+					model._reset_cache()
+				else:
+					model.from_summaries()
+
+			logp = logp[~converged]
+			active = [model for model, converged_ in zip(active, converged) 
+				if not converged_]
+
+			if len(active) == 0:
+				break
+
+		logp = torch.stack([model.log_probability(X).sum() for model in models])
+		best = models[int(torch.argmax(logp))]
+
+		self.distributions = best.distributions
+		self.priors = best.priors
+		self.d = best.d
+		self._initialized = True
+		self._reset_cache()
+		return self
+
 	def fit(self, X, sample_weight=None):
 		"""Fit the model to optionally weighted examples.
 
@@ -175,11 +364,16 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		Parameters
 		----------
 		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
-			A set of examples to evaluate. 
+			A set of examples to evaluate. Alternatively, an iterable that
+			yields batches of examples, such as a DataLoader, where each batch
+			is either a tensor or a tuple of (X, sample_weight). In this case
+			the sufficient statistics are accumulated across all batches in
+			each iteration.
 
 		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
 			A set of weights for the examples. This can be either of shape
-			(-1, self.d) or a vector of shape (-1,). Default is ones.
+			(-1, self.d) or a vector of shape (-1,). Must be None if X is a
+			collection of batches. Default is ones.
 
 
 		Returns
@@ -187,12 +381,18 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		self
 		"""
 
+		if self.n_init > 1 and not self._initialized and not self.frozen:
+			if _check_batches(X):
+				raise ValueError("n_init cannot be used with batches.")
+
+			return self._fit_restarts(X, sample_weight=sample_weight)
+
 		logp = None
 		for i in range(self.max_iter):
 			start_time = time.time()
 
 			last_logp = logp
-			logp = self.summarize(X, sample_weight=sample_weight)
+			logp = _summarize_batches(self, X, sample_weight=sample_weight)
 
 			if i > 0:
 				improvement = logp - last_logp
@@ -210,6 +410,35 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		self._reset_cache()
 		return self
 
+	def partial_fit(self, X, sample_weight=None):
+		"""Update the model using a single batch of data with online EM.
+
+		This method performs one step of online, or stochastic, EM. The
+		sufficient statistics of the batch are blended into a running average
+		of the sufficient statistics seen so far using a step size that decays
+		as (t + step_offset) ** -step_decay, and the parameters are then
+		updated from that running average. Calling this method on a stream of
+		batches keeps the model current without refitting on all of the data.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A batch of examples.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		self
+		"""
+
+		_partial_fit(self, X, sample_weight=sample_weight)
+		return self
+
 	def summarize(self, X, sample_weight=None):
 		"""Extract the sufficient statistics from a batch of data.
 
@@ -247,7 +476,12 @@ class GeneralMixtureModel(BayesMixin, Distribution):
 		logp = torch.logsumexp(e, dim=1, keepdims=True)
 		y = torch.exp(e - logp)
 
-		z = torch.clone(self._w_sum)
+		w_sum = _stacked_summarize(self.distributions, X, y, sample_weight)
+		if w_sum is not None:
+			if self.frozen == False:
+				self._w_sum[:] = self._w_sum + w_sum.mean(dim=-1)
+
+			return torch.sum(logp)
 
 		for i, d in enumerate(self.distributions):
 			d.summarize(X, y[:, i:i+1] * sample_weight)
@@ -9,6 +9,10 @@ from ._utils import _cast_as_tensor
 from ._utils import _update_parameter
 from ._utils import _check_parameter
 from ._utils import _reshape_weights
+from ._utils import _check_batches
+from ._utils import _iter_batches
+from ._utils import _summarize_batches
+from ._utils import _partial_fit
 
 from .distributions._distribution import Distribution
 
@@ -18,6 +22,7 @@ from ._base import Node
 
 from ._sparse_hmm import _SparseHMM
 from ._dense_hmm import _DenseHMM
+from ._banded_hmm import _BandedHMM
 
 from .kmeans import KMeans
 
@@ -42,6 +47,73 @@ def _cast_distributions(distributions):
 	return nodes
 
 
+def _emitting_nodes(nodes):
+	return [node for node in nodes if node.distribution is not None]
+
+
+def _transition_indices(nodes, edges, start, end):
+	if isinstance(edges, torch.Tensor):
+		return torch.nonzero(edges, as_tuple=True)
+
+	idxs = {node: i for i, node in enumerate(nodes)}
+	ij = torch.tensor([(idxs[ni], idxs[nj]) for ni, nj, _ in edges 
+		if ni is not start and nj is not end], dtype=torch.int64)
+
+	ij = ij.reshape(-1, 2)
+	return ij[:, 0], ij[:, 1]
+
+
+def _estimate_backend_costs(n_nodes, rows, cols, batch_size):
+	"""Estimate the time that each backend takes per observation.
+
+	This function is meant to only be called internally. Each backend has a
+	fixed overhead per observation plus a cost per sequence that scales with
+	the number of values it updates: every pair of nodes for the dense
+	backend, every edge for the sparse backend, and every node for each
+	offset of the banded backend. The constants were measured on a CPU and are
+	only used to rule out backends that are clearly slower before timing the
+	rest.
+	"""
+
+	n_edges = len(rows)
+	n_offsets = len(torch.unique(cols - rows))
+
+	return {
+		'dense': 4e-5 + 2e-10 * batch_size * n_nodes ** 2,
+		'sparse': 8e-5 + 1.5e-8 * batch_size * n_edges,
+		'banded': n_offsets * (3.5e-5 + 4e-9 * batch_size * n_nodes)
+	}
+
+
+def _benchmark_backend(model, n_nodes, device, batch_size, length, 
+	n_repeats=3):
+	"""Time the forward algorithm of a backend on a synthetic batch.
+
+	This function is meant to only be called internally. It returns the
+	fastest of several runs, after one run to warm up, in seconds per
+	observation.
+	"""
+
+	emissions = torch.full((batch_size, length, n_nodes), -1.0, device=device)
+	priors = torch.zeros_like(emissions)
+	model.forward(emissions, priors)
+
+	timings = []
+	for _ in range(n_repeats):
+		if emissions.is_cuda:
+			torch.cuda.synchronize(device)
+
+		tic = time.time()
+		model.forward(emissions, priors)
+
+		if emissions.is_cuda:
+			torch.cuda.synchronize(device)
+
+		timings.append((time.time() - tic) / length)
+
+	return min(timings)
+
+
 def _check_inputs(model, X, priors, emissions):
 	if X is None and emissions is None:
 		raise ValueError("Must pass in one of `X` or `emissions`.")
@@ -64,6 +136,81 @@ def _check_inputs(model, X, priors, emissions):
 	return emissions, priors
 
 
+def _check_ragged(X):
+	"""Return whether X is a collection of sequences of their own lengths."""
+
+	return isinstance(X, (list, tuple)) and len(X) > 0 and all(
+		isinstance(x, (numpy.ndarray, torch.Tensor)) and x.ndim == 2 
+		for x in X)
+
+
+def _pad_sequences(X, name, idxs, lengths, **kwargs):
+	"""Check each sequence and pad them, in the given order, to one tensor."""
+
+	X = [_check_parameter(_cast_as_tensor(X[i]), name, **kwargs) for i in idxs]
+	if [len(x) for x in X] != lengths.tolist():
+		raise ValueError("Each sequence in {} must have the same length as "
+			"the corresponding sequence in X.".format(name))
+
+	return torch.nn.utils.rnn.pad_sequence(X, batch_first=True)
+
+
+def _check_ragged_inputs(model, X, priors, y=None):
+	"""Pad sequences of different lengths and calculate their emissions.
+
+	The sequences are sorted by length in descending order so that, at each
+	step of the algorithms, the sequences that have not yet ended are the
+	first ones in the batch. Emissions are only calculated for the
+	observations and not for the padding.
+	"""
+
+	lengths = torch.tensor([len(x) for x in X])
+	lengths, idxs = torch.sort(lengths, descending=True, stable=True)
+
+	X = _pad_sequences(X, "X", idxs, lengths, ndim=2, shape=(-1, model.d))
+	mask = torch.arange(X.shape[1]) < lengths.unsqueeze(1)
+
+	emissions = torch.zeros(X.shape[0], X.shape[1], model.n_nodes, 
+		device=model.device)
+	emissions[mask] = model._emission_matrix(X[mask].unsqueeze(0))[0]
+
+	if priors is None:
+		priors = torch.zeros(1, device=model.device).expand_as(emissions)
+	else:
+		priors = _pad_sequences(priors, "priors", idxs, lengths, ndim=2, 
+			shape=(-1, model.n_nodes))
+
+	if y is not None:
+		y = _pad_sequences(y, "y", idxs, lengths, ndim=1)
+
+	return X, emissions, priors, y, lengths, idxs
+
+
+def _bucket_plan(lengths, n_nodes, memory_budget=None):
+	"""Group sequences into batches of similar lengths under a memory budget.
+
+	Sequences are sorted by length in descending order and each batch is
+	filled greedily, starting from the longest remaining sequence, with as
+	many sequences as keep n * l * n_nodes within the budget, where n is the
+	number of sequences in the batch and l is the length of the longest one.
+	This is the size of the forward and of the backward tensors for the batch.
+	Because neighboring sequences have similar lengths, little computation is
+	spent on padding. A batch always contains at least one sequence.
+	"""
+
+	lengths, idxs = torch.sort(lengths, descending=True, stable=True)
+	if memory_budget is None:
+		return [idxs]
+
+	plan, start = [], 0
+	while start < len(idxs):
+		n = max(1, int(memory_budget // (lengths[start].item() * n_nodes)))
+		plan.append(idxs[start:start+n])
+		start += n
+
+	return plan
+
+
 class HiddenMarkovModel(GraphMixin, Distribution):
 	"""A hidden Markov model.
 
@@ -78,12 +225,15 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 	the primary computation to use matrix multiplications which can be very
 	fast. However, if the matrix is sparse, these matrix multiplications will
 	be fairly slow and end up significantly slower than the sparse version of
-	a matrix multiplication.
+	a matrix multiplication. When the non-zero transitions lie on a few
+	diagonals, a banded implementation that shifts the messages by each
+	offset is faster than either.
 
-	This object is a wrapper for both implementations, which can be specified
+	This object is a wrapper for these implementations, which can be specified
 	using the `kind` parameter. Choosing the right implementation will not
 	effect the accuracy of the results but will change the speed at which they
-	are calculated. 	
+	are calculated. Passing in `kind='auto'` will choose the implementation
+	that runs the fastest on a small synthetic batch. 	
 
 	Separately, there are two ways to instantiate the hidden Markov model. The
 	first is by passing in a set of distributions, a dense transition matrix, 
@@ -95,6 +245,24 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 	matrix, this will be converted to a sparse matrix with all the zeros
 	dropped if you choose `kind='sparse'`.
 
+	Nodes can be silent, meaning that they do not align to an observation, by
+	passing in a `Node` whose distribution is None. Between observations, a
+	path can pass through any number of silent nodes, such as the delete
+	states of a profile hidden Markov model, which avoids replacing them with
+	many more emitting nodes. Silent nodes can only be used when `kind` is
+	'sparse', or 'auto', which then chooses 'sparse', and the transitions
+	between them cannot form a cycle. Emissions, priors, posteriors and
+	predictions only cover the emitting nodes, in the order that they were
+	given, and `n_nodes` is the number of emitting nodes once the model is
+	baked.
+
+	Sequences of different lengths can be passed in as a list of tensors,
+	each of shape (length, d), rather than as a single tensor. These are
+	sorted by length and padded, and the algorithms only compute over the
+	sequences that have not yet ended at each step. Methods that return a
+	value per observation, such as `predict`, then return a list with one
+	tensor per sequence.
+
 
 	Parameters
 	----------
@@ -116,9 +284,20 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		The probability of ending at each node. If not provided, assumes
 		these probabilities are uniform. Default is None.
 
-	kind: str, 'sparse' or 'dense', optional
+	kind: str, 'sparse', 'dense', 'banded', or 'auto', optional
 		The underlying implementation of the transition matrix to use.
-		Default is 'sparse'. 
+		'banded' is meant for models, such as left-to-right and profile
+		hidden Markov models, where each node i only transitions to nodes
+		i + o for a few offsets o. The transitions are then stored as a
+		(k, bandwidth) matrix, `edges[i, c]` being the log probability of
+		moving from node i to node i + `_model.offsets[c]`, and calculated
+		by shifting the messages by each offset. 'auto' chooses one of the
+		others when the model is baked, first estimating the time per
+		observation of each from the number of nodes, edges and offsets and
+		then timing the forward algorithm of those that are close to the best
+		estimate on a small synthetic batch. The chosen implementation is
+		stored in `backend` and the estimated or measured seconds per
+		observation in `backend_costs`. Default is 'sparse'. 
 
 	init: str, optional
 		The initialization to use for the k-means initialization approach.
@@ -130,6 +309,10 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 				objective to initialize the k-means algorithm
 			'submodular-feature-based': Use a feature-based submodular objective
 				to initialize the k-means algorithm.
+			'kmeans++': Sample each centroid with probability proportional to
+				its squared distance from the centroids already chosen
+			'kmeans||': Sample candidates in a few oversampling rounds and
+				recluster them with weighted k-means++
 
 	max_iter: int, optional
 		The number of iterations to do in the EM step, which for HMMs is
@@ -158,15 +341,71 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 
 	verbose: bool, optional
 		Whether to print the improvement and timings during training.
+
+	step_offset: float, optional
+		The offset tau in the step size (t + tau) ** -kappa used by
+		`partial_fit`, where t is the number of previous calls. Larger values
+		slow down the early updates. Must be at least 1. Default is 1.0.
+
+	step_decay: float, (0.5, 1], optional
+		The decay kappa in the step size (t + tau) ** -kappa used by
+		`partial_fit`. Smaller values forget old batches faster. Default is
+		0.6.
+
+	memory_budget: int or None, optional
+		The maximum number of floats, n * l * n_nodes, in the forward or
+		backward tensors of one batch when summarizing data. Sequences are
+		grouped into batches of similar lengths that fit within this budget,
+		see `bucket_plan`, and the statistics are accumulated across batches.
+		If None, all sequences are summarized at once. Default is None.
+
+	checkpoint: bool, optional
+		Whether to run the forward-backward algorithm in a checkpointed mode
+		that only stores the forward messages every sqrt(length) observations
+		and recomputes the rest, summing the expected transitions as they are
+		calculated rather than storing them for every observation. This uses
+		much less memory for long sequences at the cost of running the forward
+		pass twice. Default is False.
+
+	chunk_size: int or None, optional
+		The number of observations at a time over which the probabilities of
+		each transition are calculated and summed in the forward-backward
+		algorithm. Smaller values use less memory. If None, all observations
+		are used at once. Default is None.
+
+	algorithm: str, optional
+		The implementation of the forward and backward algorithms to use. Must
+		be one of 'log', which works with log probabilities, or 'scaled', which
+		works with probabilities that are normalized at each observation and
+		only stores the log of the normalizers, or 'scan', which calculates
+		the messages at every observation at once using a parallel scan over
+		the products of the transition matrices of each step. All return the
+		same values up to numerical precision. 'scaled' avoids calculating
+		logs and exponentials at each step, which is faster for models with
+		few nodes, and the Viterbi algorithm always works with log
+		probabilities when it is used. 'scan' can only be used when `kind` is
+		'dense', or 'auto', which then chooses 'dense', and also applies to
+		the Viterbi algorithm. It does O(log l) batched steps rather than l
+		sequential ones at the cost of O(l k^3 log l) work and O(n l k^2)
+		memory, which is useful for a few long sequences where there is
+		little parallelism across sequences. Default is 'log'.
 	"""
 
 	def __init__(self, nodes=None, edges=None, starts=None, ends=None, 
 		kind="sparse", init='random', max_iter=1000, tol=0.1, 
-		inertia=0.0, frozen=False, random_state=None, verbose=False):
+		inertia=0.0, frozen=False, random_state=None, verbose=False,
+		step_offset=1.0, step_decay=0.6, memory_budget=None, 
+		checkpoint=False, chunk_size=None, algorithm='log'):
 		super().__init__(inertia=inertia, frozen=frozen)
 		self.name = "HiddenMarkovModel"
 
-		_check_parameter(kind, "kind", value_set=('sparse', 'dense'))
+		_check_parameter(kind, "kind", value_set=('sparse', 'dense', 'banded',
+			'auto'))
+		_check_parameter(algorithm, "algorithm", value_set=('log', 'scaled',
+			'scan'))
+
+		if algorithm == 'scan' and kind not in ('dense', 'auto'):
+			raise ValueError("algorithm 'scan' can only be used with dense HMMs.")
 
 		self.nodes = _cast_distributions(nodes)
 
@@ -198,6 +437,8 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		self.end = Node(None, "end")
 
 		self.kind = kind
+		self.backend = None
+		self.backend_costs = None
 		self.init = init
 		self.max_iter = _check_parameter(max_iter, "max_iter", min_value=1, 
 			ndim=0, dtypes=(int, torch.int32, torch.int64))
@@ -205,9 +446,25 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		self.random_state = random_state
 		self.verbose = verbose
 
-		self.d = self.nodes[0].distribution.d if nodes is not None else None
+		self.step_offset = _check_parameter(step_offset, "step_offset", 
+			min_value=1.0, ndim=0)
+		self.step_decay = _check_parameter(step_decay, "step_decay", 
+			min_value=0.5, max_value=1.0, ndim=0)
+		self._n_online_steps = 0
+		self._online_statistics = {}
+
+		self.memory_budget = _check_parameter(memory_budget, "memory_budget",
+			min_value=1, ndim=0)
+		self.checkpoint = _check_parameter(checkpoint, "checkpoint", 
+			value_set=(True, False))
+		self.chunk_size = _check_parameter(chunk_size, "chunk_size", 
+			min_value=1, ndim=0, dtypes=(int, torch.int32, torch.int64))
+		self.algorithm = algorithm
+
+		emitting = _emitting_nodes(self.nodes)
+		self.d = emitting[0].distribution.d if len(emitting) > 0 else None
 		self._model = None
-		self._initialized = all(n.distribution._initialized for n in self.nodes)
+		self._initialized = all(n.distribution._initialized for n in emitting)
 
 	def bake(self):
 		"""Finalize the model after adding in edges manually.
@@ -218,21 +475,85 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		inference.
 		"""
 
-		if self.kind == 'dense':
-			self._model = _DenseHMM(nodes=self.nodes, edges=self.edges,
-				start=self.start, end=self.end, starts=self.starts, 
-				ends=self.ends, max_iter=self.max_iter, tol=self.tol, 
-				inertia=self.inertia, frozen=self.frozen)
+		if self.kind not in ('sparse', 'auto') and len(_emitting_nodes(
+			self.nodes)) < len(self.nodes):
+			raise ValueError("Silent nodes can only be used with sparse HMMs.")
 
-		elif self.kind == 'sparse':
-			self._model = _SparseHMM(nodes=self.nodes, edges=self.edges,
-				start=self.start, end=self.end, starts=self.starts, 
-				ends=self.ends, max_iter=self.max_iter, tol=self.tol, 
-				inertia=self.inertia, frozen=self.frozen)
+		if self.kind == 'auto':
+			self.backend, self._model = self._select_backend()
+		else:
+			self.backend = self.kind
+			self._model = self._build_backend(self.kind)
 
 		self.n_nodes = self._model.n_nodes
 		self.n_edges = self._model.n_edges
 
+		emitting = _emitting_nodes(self.nodes)
+		self.d = emitting[0].distribution.d
+		self._initialized = all(n.distribution._initialized for n in emitting)
+
+	def _build_backend(self, kind):
+		"""Build the implementation of the given kind.
+
+		This method is meant to only be called internally.
+		"""
+
+		backend = {'dense': _DenseHMM, 'sparse': _SparseHMM, 
+			'banded': _BandedHMM}[kind]
+
+		return backend(nodes=self.nodes, edges=self.edges, start=self.start, 
+			end=self.end, starts=self.starts, ends=self.ends, 
+			max_iter=self.max_iter, tol=self.tol, inertia=self.inertia, 
+			frozen=self.frozen, checkpoint=self.checkpoint, 
+			chunk_size=self.chunk_size, algorithm=self.algorithm)
+
+	def _select_backend(self, batch_size=8, length=8):
+		"""Choose the fastest implementation for this model.
+
+		This method is meant to only be called internally. Models with silent
+		nodes can only use the sparse implementation and the 'scan' algorithm
+		can only use the dense one. Otherwise, the time per observation of
+		each implementation is estimated from the number of nodes, edges and
+		offsets, and those within a factor of four of the best estimate are
+		built and timed on a synthetic batch on the device of the
+		distributions. The estimated or, when timed, measured seconds per
+		observation are stored in `backend_costs`.
+		"""
+
+		nodes = _emitting_nodes(self.nodes)
+		if len(nodes) < len(self.nodes):
+			kinds, self.backend_costs = ['sparse'], {}
+		elif self.algorithm == 'scan':
+			kinds, self.backend_costs = ['dense'], {}
+		else:
+			rows, cols = _transition_indices(self.nodes, self.edges, 
+				self.start, self.end)
+			self.backend_costs = _estimate_backend_costs(len(nodes), rows, 
+				cols, batch_size)
+
+			best = min(self.backend_costs.values())
+			kinds = [kind for kind, cost in self.backend_costs.items() 
+				if cost <= 4 * best]
+
+		if len(kinds) == 1:
+			kind, model = kinds[0], self._build_backend(kinds[0])
+		else:
+			device = nodes[0].distribution.device
+			models = {}
+
+			for kind in kinds:
+				models[kind] = self._build_backend(kind).to(device)
+				self.backend_costs[kind] = _benchmark_backend(models[kind], 
+					len(nodes), device, batch_size, length)
+
+			kind = min(kinds, key=self.backend_costs.get)
+			model = models[kind]
+
+		if self.verbose:
+			print("Backend: {}, Costs: {}".format(kind, self.backend_costs))
+
+		return kind, model
+
 	def _reset_cache(self):
 		"""Reset the internally stored statistics.
 
@@ -243,10 +564,10 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		"""
 
 		self._model._reset_cache()
-		for node in self.nodes:
+		for node in _emitting_nodes(self.nodes):
 			node.distribution._reset_cache()
 
-		if self.kind == 'sparse':
+		if self.backend == 'sparse':
 			self.edges = self._model._edge_log_probs
 		else:
 			self.edges = self._model.edges
@@ -272,6 +593,14 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			(-1, len) or a vector of shape (-1,). Default is ones.
 		"""
 
+		if _check_ragged(X):
+			lengths = torch.tensor([len(x) for x in X])
+			X = torch.cat([_cast_as_tensor(x) for x in X]).unsqueeze(0)
+
+			if sample_weight is not None:
+				sample_weight = torch.repeat_interleave(_cast_as_tensor(
+					sample_weight).reshape(-1), lengths)
+
 		X = _check_parameter(_cast_as_tensor(X), "X", ndim=3)
 		X = X.reshape(-1, X.shape[-1])
 
@@ -282,12 +611,13 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			sample_weight = _check_parameter(sample_weight, "sample_weight", 
 				min_value=0., ndim=1, shape=(len(X),)).reshape(-1, 1)
 
-		y_hat = KMeans(self.n_nodes, init=self.init, max_iter=1, 
+		nodes = _emitting_nodes(self.nodes)
+		y_hat = KMeans(len(nodes), init=self.init, max_iter=1, 
 			random_state=self.random_state).fit_predict(X, 
 			sample_weight=sample_weight)
 
-		for i in range(self.n_nodes):
-			self.nodes[i].distribution.fit(X[y_hat == i], 
+		for i, node in enumerate(nodes):
+			node.distribution.fit(X[y_hat == i], 
 				sample_weight=sample_weight[y_hat == i])
 
 		self._initialized = True
@@ -321,10 +651,11 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		n, k, _ = X.shape
 		X = X.reshape(-1, self.d)
 
-		e = torch.empty((k, self.n_nodes, n), dtype=torch.float32, 
+		nodes = _emitting_nodes(self.nodes)
+		e = torch.empty((k, len(nodes), n), dtype=torch.float32, 
 			requires_grad=False, device=self.device)
 		
-		for i, node in enumerate(self.nodes):
+		for i, node in enumerate(nodes):
 			logp = node.distribution.log_probability(X)
 			if isinstance(logp, torch.masked.MaskedTensor):
 				logp = logp._masked_data
@@ -372,6 +703,9 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			The log probabilities calculated by the forward algorithm.
 		"""
 
+		if _check_ragged(X):
+			return self._ragged("forward", X, priors=priors)[0]
+
 		if check_inputs:
 			emissions, priors = _check_inputs(self, X, emissions, priors) 
 		else:
@@ -381,6 +715,25 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 
 		return self._model.forward(emissions, priors=priors)
 
+	def _ragged(self, method, X, priors=None):
+		"""Run an algorithm on sequences of different lengths.
+
+		This method is meant to only be called internally. It sorts and pads
+		the sequences, runs the given method of the underlying model on them,
+		and returns the outputs, and the lengths, in the original order. The
+		outputs are padded to the length of the longest sequence.
+		"""
+
+		_, emissions, priors, _, lengths, idxs = _check_ragged_inputs(self, X, 
+			priors)
+		y = getattr(self._model, method)(emissions, priors=priors, 
+			lengths=lengths)
+
+		unsort = torch.argsort(idxs)
+		if isinstance(y, tuple):
+			return tuple(y_[unsort] for y_ in y), lengths[unsort]
+		return y[unsort], lengths[unsort]
+
 	def backward(self, X, emissions=None, priors=None, check_inputs=True):
 		"""Run the backward algorithm on some data.
 
@@ -421,6 +774,9 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			The log probabilities calculated by the backward algorithm.
 		"""
 
+		if _check_ragged(X):
+			return self._ragged("backward", X, priors=priors)[0]
+
 		if check_inputs:
 			emissions, priors = _check_inputs(self, X, emissions, priors) 
 		else:
@@ -495,6 +851,9 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			The log probabilities of each sequence given the model.
 		"""
 
+		if _check_ragged(X):
+			return self._ragged("forward_backward", X, priors=priors)[0]
+
 		if check_inputs:
 			emissions, priors = _check_inputs(self, X, emissions, priors) 
 		else:
@@ -504,6 +863,64 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 
 		return self._model.forward_backward(emissions, priors=priors)
 
+	def viterbi(self, X=None, emissions=None, priors=None, check_inputs=True):
+		"""Run the Viterbi algorithm on some data.
+
+		Runs the Viterbi algorithm on a batch of sequences. Rather than
+		summing over all paths through the model like the forward algorithm,
+		the Viterbi algorithm keeps only the most likely path to each node and
+		returns the single most likely path through the model for each
+		sequence, also known as the maximum a posteriori (MAP) path. This
+		only requires a single pass over each sequence and so is faster and
+		uses less memory than decoding with the forward-backward algorithm.
+
+		
+		Parameters
+		----------
+		X: list, numpy.ndarray, torch.Tensor, shape=(-1, -1, d)
+			A set of examples to evaluate. Does not need to be passed in if
+			emissions are. 
+
+		emissions: list, numpy.ndarray, torch.Tensor, shape=(-1, -1, n_nodes)
+			Precalculated emission log probabilities. These are the
+			probabilities of each observation under each probability 
+			distribution. When running some algorithms it is more efficient
+			to precalculate these and pass them into each call.
+
+		priors: list, numpy.ndarray, torch.Tensor, shape=(-1, -1, d)
+			Prior probabilities of assigning each symbol to each node. If not
+			provided, do not include in the calculations (conceptually
+			equivalent to a uniform probability, but without scaling the
+			probabilities).
+
+		check_inputs: bool, optional
+			Whether to check the shape of the inputs and calculate emission
+			matrices. Default is True.
+
+
+		Returns
+		-------
+		path: torch.Tensor, shape=(-1, -1), dtype=torch.int64
+			The node that each observation is aligned to in the most likely
+			path through the model.
+
+		logp: torch.Tensor, shape=(-1,)
+			The log probability of the most likely path for each example.
+		"""
+
+		if _check_ragged(X):
+			(path, logp), lengths = self._ragged("viterbi", X, priors=priors)
+			return [p[:l] for p, l in zip(path, lengths)], logp
+
+		if check_inputs:
+			emissions, priors = _check_inputs(self, X, priors, emissions) 
+		else:
+			if emissions is None:
+				raise ValueError("Must check inputs if not passing in "
+					"a pre-calculated emission matrix.")
+
+		return self._model.viterbi(emissions, priors=priors)
+
 	def log_probability(self, X, priors=None, check_inputs=True):
 		"""Calculate the log probability of each example.
 
@@ -534,6 +951,11 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			The log probability of each example.
 		"""
 
+		if _check_ragged(X):
+			f, lengths = self._ragged("forward", X, priors=priors)
+			f = f[torch.arange(len(f)), lengths-1]
+			return torch.logsumexp(f + self._model.ends, dim=1)
+
 		f = self.forward(X, priors=priors, check_inputs=check_inputs)
 		return torch.logsumexp(f[:, -1] + self._model.ends, dim=1)
 
@@ -564,6 +986,11 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			component as calculated by the forward-backward algorithm.
 		"""
 
+		if _check_ragged(X):
+			(_, r, _, _, _), lengths = self._ragged("forward_backward", X, 
+				priors=priors)
+			return [r_[:l] for r_, l in zip(r, lengths)]
+
 		_, r, _, _, _ = self.forward_backward(X, priors=priors)
 		return r
 
@@ -594,7 +1021,11 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			as calculated by the forward-backward algorithm.
 		"""
 
-		return torch.exp(self.predict_log_proba(X, priors=priors))
+		r = self.predict_log_proba(X, priors=priors)
+		if isinstance(r, list):
+			return [torch.exp(r_) for r_ in r]
+
+		return torch.exp(r)
 
 	def predict(self, X, priors=None):
 		"""Predicts the component for each observation.
@@ -623,7 +1054,11 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			as calculated by the forward-backward algorithm.
 		"""
 
-		return torch.argmax(self.predict_log_proba(X, priors=priors), dim=-1)
+		r = self.predict_log_proba(X, priors=priors)
+		if isinstance(r, list):
+			return [torch.argmax(r_, dim=-1) for r_ in r]
+
+		return torch.argmax(r, dim=-1)
 
 	def fit(self, X, y=None, sample_weight=None, priors=None):
 		"""Fit the model to optionally weighted examples.
@@ -642,17 +1077,23 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		Parameters
 		----------
 		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len, self.d)
-			A set of examples to evaluate. 
+			A set of examples to evaluate. Alternatively, an iterable that
+			yields batches of examples, such as a DataLoader, where each batch
+			is either a tensor or a tuple of (X, sample_weight). In this case
+			the sufficient statistics are accumulated across all batches in
+			each iteration and the model is initialized on the first batch.
 
 		y: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len), optional 
 			A set of labels with the same number of examples and length as the
 			observations that indicate which node in the model that each
 			observation should be assigned to. Passing this in means that the
-			model uses labeled training instead of Baum-Welch. Default is None.
+			model uses labeled training instead of Baum-Welch. Cannot be used
+			when X is a collection of batches. Default is None.
 
 		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
 			A set of weights for the examples. This can be either of shape
-			(-1, self.d) or a vector of shape (-1,). Default is ones.
+			(-1, self.d) or a vector of shape (-1,). Must be None if X is a
+			collection of batches. Default is ones.
 
 
 		Returns
@@ -660,13 +1101,22 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		self
 		"""
 
+		if _check_batches(X) and y is not None:
+			raise ValueError("Labeled training is not supported when passing "
+				"in batches.")
+
 		if not self._initialized:
-			self._initialize(X, sample_weight=sample_weight)
+			if _check_batches(X):
+				X_, w_ = next(_iter_batches(X))
+				self._initialize(X_, sample_weight=w_)
+			else:
+				self._initialize(X, sample_weight=sample_weight)
 
 		logp, last_logp = None, None
 		for i in range(self.max_iter):
 			start_time = time.time()
-			logp = self.summarize(X, y=y, sample_weight=sample_weight).sum()
+			logp = _summarize_batches(self, X, y=y, 
+				sample_weight=sample_weight).sum()
 
 			if i > 0:
 				improvement = logp - last_logp
@@ -684,7 +1134,8 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			self.from_summaries()
 
 		if self.verbose:
-			logp = self.summarize(X, y=y, sample_weight=sample_weight).sum()
+			logp = _summarize_batches(self, X, y=y, 
+				sample_weight=sample_weight).sum()
 
 			improvement = logp - last_logp
 			duration = time.time() - start_time
@@ -695,6 +1146,40 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		self._reset_cache()
 		return self
 
+	def partial_fit(self, X, y=None, sample_weight=None):
+		"""Update the model using a single batch of data with online EM.
+
+		This method performs one step of online, or stochastic, EM. The
+		sufficient statistics of the batch are blended into a running average
+		of the sufficient statistics seen so far using a step size that decays
+		as (t + step_offset) ** -step_decay, and the parameters are then
+		updated from that running average. Calling this method on a stream of
+		batches keeps the model current without refitting on all of the data.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len, self.d)
+			A batch of examples.
+
+		y: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len), optional 
+			A set of labels with the same number of examples and length as the
+			observations that indicate which node in the model that each
+			observation should be assigned to. Default is None.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		self
+		"""
+
+		_partial_fit(self, X, sample_weight=sample_weight, y=y)
+		return self
+
 	def summarize(self, X, y=None, sample_weight=None, emissions=None, 
 		priors=None):
 		"""Extract the sufficient statistics from a batch of data.
@@ -740,6 +1225,19 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 			The log probability of each example.
 		"""
 
+		if self.memory_budget is not None and emissions is None:
+			if not _check_ragged(X):
+				X = _cast_as_tensor(X)
+
+			plan = self.bucket_plan(X)
+			if len(plan) > 1:
+				return self._summarize_buckets(X, plan, y=y, 
+					sample_weight=sample_weight, priors=priors)
+
+		if _check_ragged(X):
+			return self._summarize_ragged(X, y=y, sample_weight=sample_weight, 
+				priors=priors)
+
 		X = _check_parameter(_cast_as_tensor(X), "X", ndim=3, 
 			shape=(-1, -1, self.d))
 		emissions, priors = _check_inputs(self, X, emissions, priors)
@@ -758,6 +1256,85 @@ class HiddenMarkovModel(GraphMixin, Distribution):
 		return self._model.summarize(X, y=y, 
 			sample_weight=sample_weight, emissions=emissions, priors=priors)
 
+	def bucket_plan(self, X):
+		"""Return the batches that the sequences are summarized in.
+
+		Sequences are grouped into batches of similar lengths such that the
+		forward and backward tensors of each batch, of n * l * n_nodes floats,
+		fit within `memory_budget`. This method returns that grouping so
+		that it can be inspected before training.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, len, self.d)
+			A set of examples, or a list of sequences of different lengths.
+
+
+		Returns
+		-------
+		plan: list of torch.Tensor
+			The indexes of the sequences in each batch, in the order that the
+			batches are summarized.
+		"""
+
+		if _check_ragged(X):
+			lengths = torch.tensor([len(x) for x in X])
+		else:
+			X = _check_parameter(_cast_as_tensor(X), "X", ndim=3)
+			lengths = torch.full((X.shape[0],), X.shape[1])
+
+		return _bucket_plan(lengths, self.n_nodes, self.memory_budget)
+
+	def _summarize_buckets(self, X, plan, y=None, sample_weight=None, 
+		priors=None):
+		"""Extract the sufficient statistics one batch at a time.
+
+		This method is meant to only be called internally. Each batch in the
+		plan is summarized separately, which adds its statistics to those
+		already stored, and the log probabilities are returned in the
+		original order.
+		"""
+
+		if sample_weight is not None:
+			sample_weight = _cast_as_tensor(sample_weight)
+
+		_select = lambda Z, idxs: None if Z is None else (
+			[Z[i] for i in idxs] if isinstance(Z, (list, tuple)) else Z[idxs])
+
+		logps = torch.empty(len(X), device=self.device)
+		for idxs in plan:
+			logps[idxs] = self.summarize(_select(X, idxs), y=_select(y, idxs),
+				sample_weight=_select(sample_weight, idxs), 
+				priors=_select(priors, idxs))
+
+		return logps
+
+	def _summarize_ragged(self, X, y=None, sample_weight=None, priors=None):
+		"""Extract the sufficient statistics from sequences of different lengths.
+
+		This method is meant to only be called internally. The sequences, and
+		any labels and priors, are sorted by length and padded, and only the
+		observations, not the padding, are summarized.
+		"""
+
+		if sample_weight is None:
+			sample_weight = torch.ones(len(X), device=self.device)
+		else:
+			sample_weight = _check_parameter(_cast_as_tensor(sample_weight),
+				"sample_weight", min_value=0., ndim=1, shape=(len(X),))
+
+		if not self._initialized and y is None:
+			self._initialize(X, sample_weight=sample_weight)
+
+		X, emissions, priors, y, lengths, idxs = _check_ragged_inputs(self, X, 
+			priors, y=y)
+
+		logps = self._model.summarize(X, y=y, 
+			sample_weight=sample_weight[idxs].reshape(-1, 1), 
+			emissions=emissions, priors=priors, lengths=lengths)
+		return logps[torch.argsort(idxs)]
+
 	def from_summaries(self):
 		"""Update the model parameters given the extracted statistics.
 
@@ -2,6 +2,7 @@
 # Author: Jacob Schreiber
 
 import time
+import numpy
 import torch
 
 from ._utils import _cast_as_tensor
@@ -9,6 +10,9 @@ from ._utils import _cast_as_parameter
 from ._utils import _update_parameter
 from ._utils import _check_parameter
 from ._utils import _reshape_weights
+from ._utils import _check_batches
+from ._utils import _summarize_batches
+from ._utils import _partial_fit
 from ._utils import _initialize_centroids
 
 from ._utils import eps
@@ -45,6 +49,10 @@ class KMeans(torch.nn.Module):
 				objective to initialize the k-means algorithm
 			'submodular-feature-based': Use a feature-based submodular objective
 				to initialize the k-means algorithm.
+			'kmeans++': Sample each centroid with probability proportional to
+				its squared distance from the centroids already chosen
+			'kmeans||': Sample candidates in a few oversampling rounds and
+				recluster them with weighted k-means++
 
 	max_iter: int, optional
 		The number of iterations to do in the EM step of fitting the
@@ -69,10 +77,76 @@ class KMeans(torch.nn.Module):
 
 	verbose: bool, optional
 		Whether to print the improvement and timings during training.
+
+	step_offset: float, optional
+		The offset tau in the step size (t + tau) ** -kappa used by
+		`partial_fit`, where t is the number of previous calls. Larger values
+		slow down the early updates. Must be at least 1. Default is 1.0.
+
+	step_decay: float, (0.5, 1], optional
+		The decay kappa in the step size (t + tau) ** -kappa used by
+		`partial_fit`. Smaller values forget old batches faster. Default is
+		0.6.
+
+	memory_budget: int or None, optional
+		The maximum number of floats, n * k, in the distances between one
+		block of n examples and the centroids when predicting or summarizing
+		data. Examples are assigned to their nearest centroid one block at a
+		time and the statistics are accumulated across blocks, so that memory
+		does not grow with the number of examples beyond the data itself. If
+		None, all examples are processed at once. Default is None.
+
+	algorithm: str, optional
+		The algorithm to use in `fit`. Must be one of:
+
+			'lloyd': Calculate the distance between every example and every
+				centroid in each iteration
+			'hamerly': Keep a single lower bound on the distance between each
+				example and its second-nearest centroid, and only calculate
+				the distances to every centroid for examples where it is not
+				larger than the distance to the assigned one. This uses O(n)
+				memory for the bounds.
+			'elkan': Also keep a lower bound on the distance between every
+				example and every centroid, and skip the distances that these
+				bounds and the distances between centroids show cannot be the
+				nearest. This uses O(n * k) memory for the bounds.
+
+		Because the distance between each example and its assigned centroid
+		is calculated exactly in every iteration, all three give the same
+		clusters up to ties and rounding, and 'elkan' and 'hamerly' skip most
+		of the work once few examples change clusters. 'elkan' and 'hamerly'
+		can only be used when fitting to a single tensor without missing
+		values. Default is 'lloyd'.
+
+	nprobe: int or None, optional
+		The number of coarse cells to search when predicting. If not None,
+		the centroids are themselves clustered into `n_cells` coarse cells
+		the first time `predict` is called after the centroids change, and
+		each example is only compared to the centroids in the `nprobe` cells
+		with the nearest coarse centroids. This makes `predict` approximate,
+		with larger values trading speed for a higher chance of returning the
+		exact nearest centroid. If None, every centroid is compared against.
+		Default is None.
+
+	n_cells: int or None, optional
+		The number of coarse cells to cluster the centroids into when `nprobe`
+		is not None. If None, use the square root of k. Default is None.
+
+	n_init: int, optional
+		The number of initializations to fit when `fit` is called on a model
+		whose centroids have not been initialized. The restarts are fit at
+		the same time using Lloyd iterations on one tensor of shape
+		(n_init, k, d), so that each iteration is a single matrix
+		multiplication between the examples and all of the centroids, and
+		the restart with the smallest total distance between the examples and
+		their nearest centroid is kept. Must be fit to a single tensor.
+		Default is 1.
 	"""
 
 	def __init__(self, k=None, centroids=None, init='first-k', max_iter=10, 
-		tol=0.1, inertia=0.0, frozen=False, random_state=None, verbose=False):
+		tol=0.1, inertia=0.0, frozen=False, random_state=None, verbose=False,
+		step_offset=1.0, step_decay=0.6, memory_budget=None, 
+		algorithm='lloyd', nprobe=None, n_cells=None, n_init=1):
 		super().__init__()
 		self.name = "KMeans"
 		self._device = _cast_as_parameter([0.0])
@@ -85,7 +159,8 @@ class KMeans(torch.nn.Module):
 
 		self.init = _check_parameter(init, "init", value_set=("random", 
 			"first-k", "submodular-facility-location", 
-			"submodular-feature-based"), ndim=0, dtypes=(str,))
+			"submodular-feature-based", "kmeans++", "kmeans||"), ndim=0, 
+			dtypes=(str,))
 		self.max_iter = _check_parameter(_cast_as_tensor(max_iter), "max_iter",
 			ndim=0, min_value=1, dtypes=(int, torch.int32, torch.int64))
 		self.tol = _check_parameter(_cast_as_tensor(tol), "tol", ndim=0,
@@ -97,6 +172,24 @@ class KMeans(torch.nn.Module):
 		self.random_state = random_state
 		self.verbose = _check_parameter(verbose, "verbose", 
 			value_set=(True, False))
+		self.step_offset = _check_parameter(step_offset, "step_offset", 
+			min_value=1.0, ndim=0)
+		self.step_decay = _check_parameter(step_decay, "step_decay", 
+			min_value=0.5, max_value=1.0, ndim=0)
+		self.memory_budget = _check_parameter(memory_budget, "memory_budget",
+			min_value=1, ndim=0)
+		self.algorithm = _check_parameter(algorithm, "algorithm", 
+			value_set=("lloyd", "elkan", "hamerly"), ndim=0, dtypes=(str,))
+		self.nprobe = _check_parameter(nprobe, "nprobe", min_value=1, ndim=0,
+			dtypes=(int,))
+		self.n_cells = _check_parameter(n_cells, "n_cells", min_value=2, 
+			ndim=0, dtypes=(int,))
+		self.n_init = _check_parameter(n_init, "n_init", min_value=1, ndim=0,
+			dtypes=(int,))
+		self._bounds = None
+		self._index = None
+		self._n_online_steps = 0
+		self._online_statistics = {}
 
 		if self.k is None and self.centroids is None:
 			raise ValueError("Must specify one of `k` or `centroids`.")
@@ -113,7 +206,7 @@ class KMeans(torch.nn.Module):
 		except:
 			return 'cpu'
 
-	def _initialize(self, X):
+	def _initialize(self, X, sample_weight=None):
 		"""Initialize the probability distribution.
 
 		This method is meant to only be called internally. It initializes the
@@ -125,11 +218,21 @@ class KMeans(torch.nn.Module):
 		----------
 		X: list, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
 			The data to use to initialize the model.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Used by the 'kmeans++'
+			and 'kmeans||' initializations. Default is ones.
 		"""
 
 		X = _check_parameter(_cast_as_tensor(X), "X", ndim=2)
+		if sample_weight is not None:
+			sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
+				dtype=torch.float32), device=X.device)
+
 		centroids = _initialize_centroids(X, self.k, algorithm=self.init, 
-			random_state=self.random_state)
+			random_state=self.random_state, memory_budget=self.memory_budget,
+			sample_weight=sample_weight)
 		
 		if isinstance(centroids, torch.masked.MaskedTensor):
 			centroids = centroids._masked_data * centroids._masked_mask
@@ -152,6 +255,7 @@ class KMeans(torch.nn.Module):
 		calculations.
 		"""
 
+		self._index = None
 		if self._initialized == False:
 			return
 
@@ -199,11 +303,174 @@ class KMeans(torch.nn.Module):
 		distances[:] = torch.clamp(XX - 2*Xc + self._centroid_sum, min=0)
 		return torch.sqrt(distances / n)
 
+	def _blocks(self, X):
+		"""Return the slices of the blocks of examples to process at once.
+
+		This method is meant to only be called internally. Each block has as
+		many examples as keep the distances to every centroid within
+		`memory_budget`, and at least one.
+		"""
+
+		n = X.shape[0]
+		if self.memory_budget is None:
+			return [slice(0, n)]
+
+		batch_size = max(1, int(self.memory_budget // self.k))
+		return [slice(i, i+batch_size) for i in range(0, max(n, 1), 
+			batch_size)]
+
+	def _nearest(self, X, n_nearest=1):
+		"""Find the nearest centroid to each example in a block.
+
+		This method is meant to only be called internally. It calculates the
+		same distances as `_distances` in a single buffer, without the
+		temporaries for each term, and takes the minimum and the argmin in
+		one pass before the square root, which then only needs to be taken
+		of the minimum distances.
+
+
+		Parameters
+		----------
+		X: torch.Tensor, shape=(-1, self.d)
+			A block of examples that has already been checked.
+
+		n_nearest: int, optional
+			The number of nearest centroids to return for each example. If
+			more than one, the returned tensors have one column per centroid
+			in order of distance. Default is 1.
+
+
+		Returns
+		-------
+		y_hat: torch.Tensor, shape=(-1,) or (-1, n_nearest)
+			The index of the nearest centroid to each example.
+
+		distances: torch.Tensor, shape=(-1,) or (-1, n_nearest)
+			The Euclidean distance between each example and its nearest
+			centroid.
+		"""
+
+		if isinstance(X, torch.masked.MaskedTensor):
+			n = X._masked_mask.sum(dim=1)
+			X = X._masked_data * X._masked_mask
+		else:
+			n = X.shape[1]
+
+		distances = torch.addmm(self._centroid_sum, X, self.centroids.T, 
+			alpha=-2)
+		distances += torch.sum(X**2, dim=1).unsqueeze(1)
+
+		if n_nearest == 1:
+			distances, y_hat = torch.min(distances, dim=1)
+		else:
+			distances, y_hat = torch.topk(distances, n_nearest, dim=1, 
+				largest=False)
+			n = n.unsqueeze(1) if isinstance(n, torch.Tensor) else n
+
+		return y_hat, torch.sqrt(torch.clamp(distances, min=0) / n)
+
+	def _build_index(self):
+		"""Cluster the centroids into coarse cells for approximate prediction.
+
+		This method is meant to only be called internally. The centroids are
+		clustered with k-means into `n_cells` coarse cells and sorted by cell
+		so that the centroids in each cell are contiguous. The index is
+		stored as a tuple of the coarse centroids, the centroids in sorted
+		order, their squared norms, their original indexes, and the start and
+		size of each cell.
+		"""
+
+		centroids = self.centroids.detach()
+
+		k = int(self.k)
+		n_cells = max(2, min(self.n_cells or int(round(k ** 0.5)), k))
+
+		coarse = KMeans(n_cells, init='kmeans++', max_iter=10, 
+			random_state=self.random_state, memory_budget=self.memory_budget,
+			algorithm='hamerly').fit(centroids)
+		cells = coarse.predict(centroids)
+
+		order = torch.argsort(cells)
+		counts = torch.bincount(cells, minlength=n_cells)
+		starts = torch.cumsum(counts, dim=0) - counts
+
+		self._index = (coarse, centroids[order], self._centroid_sum[0, order],
+			order, starts.tolist(), counts.tolist())
+
+	def _nearest_approximate(self, X):
+		"""Find the approximately nearest centroid to each example in a block.
+
+		This method is meant to only be called internally. Each example is
+		assigned to the `nprobe` coarse cells with the nearest coarse
+		centroids. The pairs of examples and cells are then grouped by cell so
+		that the distances between the examples probing a cell and its
+		centroids are a single matrix multiplication, and the nearest
+		centroid is kept across the cells each example probes.
+
+
+		Parameters
+		----------
+		X: torch.Tensor, shape=(-1, self.d)
+			A block of examples that has already been checked.
+
+
+		Returns
+		-------
+		y_hat: torch.Tensor, shape=(-1,)
+			The index of the approximately nearest centroid to each example.
+
+		distances: torch.Tensor, shape=(-1,)
+			The Euclidean distance between each example and that centroid.
+		"""
+
+		if self._index is None:
+			self._build_index()
+
+		coarse, centroids, centroid_sum, order, starts, counts = self._index
+		nprobe = min(self.nprobe, len(counts))
+
+		probes = coarse._nearest(X, n_nearest=nprobe)[0]
+		if isinstance(X, torch.masked.MaskedTensor):
+			n = X._masked_mask.sum(dim=1)
+			X = X._masked_data * X._masked_mask
+		else:
+			n = X.shape[1]
+
+		probes = probes.reshape(-1)
+		idxs = torch.argsort(probes)
+		examples = torch.div(idxs, nprobe, rounding_mode='floor')
+		n_probes = torch.bincount(probes, minlength=len(counts)).tolist()
+
+		y_hat = torch.zeros(X.shape[0], dtype=torch.int64, device=X.device)
+		distances = torch.full((X.shape[0],), float("inf"), device=X.device)
+
+		end = 0
+		for start, count, n_probe in zip(starts, counts, n_probes):
+			if count == 0 or n_probe == 0:
+				end += n_probe
+				continue
+
+			i = examples[end:end+n_probe]
+			end += n_probe
+
+			d = torch.addmm(centroid_sum[start:start+count], X[i], 
+				centroids[start:start+count].T, alpha=-2)
+			d, j = torch.min(d, dim=1)
+
+			closer = d < distances[i]
+			distances[i] = torch.where(closer, d, distances[i])
+			y_hat[i] = torch.where(closer, order[j + start], y_hat[i])
+
+		distances += torch.sum(X**2, dim=1)
+		return y_hat, torch.sqrt(torch.clamp(distances, min=0) / n)
+
 	def predict(self, X):
 		"""Calculate the cluster assignment for each example.
 
 		This method calculates cluster assignment for each example as the
-		nearest centroid according to the Euclidean distance.
+		nearest centroid according to the Euclidean distance. If `nprobe` is
+		not None, only the centroids in the `nprobe` nearest coarse cells are
+		searched and the assignment is approximate.
 
 
 		Parameters
@@ -218,7 +485,14 @@ class KMeans(torch.nn.Module):
 			The predicted label for each example.
 		"""
 
-		return self._distances(X).argmin(dim=1)
+		X = _check_parameter(_cast_as_tensor(X, dtype=torch.float32), "X", 
+			ndim=2, shape=(-1, self.d))
+
+		nearest = self._nearest
+		if self.nprobe is not None:
+			nearest = self._nearest_approximate
+
+		return torch.cat([nearest(X[idxs])[0] for idxs in self._blocks(X)])
 
 	def summarize(self, X, sample_weight=None):
 		"""Extract the sufficient statistics from a batch of data.
@@ -248,30 +522,176 @@ class KMeans(torch.nn.Module):
 			return 0
 
 		if not self._initialized:
-			self._initialize(X)
+			self._initialize(X, sample_weight=sample_weight)
 
 		X = _check_parameter(_cast_as_tensor(X, dtype=torch.float32), "X", 
 			ndim=2, shape=(-1, self.d))
 		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
 			dtype=torch.float32), device=self.device)
 
-		distances = self._distances(X)
-		y_hat = distances.argmin(dim=1)
+		distance = 0
+		for idxs in self._blocks(X):
+			X_, w_ = X[idxs], sample_weight[idxs]
+			y_hat, distances = self._nearest(X_)
+
+			if isinstance(X, torch.masked.MaskedTensor):
+				w_ = w_._masked_data * X_._masked_mask
+				X_ = X_._masked_data * X_._masked_mask
+
+			y_hat = y_hat.unsqueeze(1).expand(-1, self.d)
+			self._w_sum.scatter_add_(0, y_hat, w_)
+			self._xw_sum.scatter_add_(0, y_hat, X_ * w_)
+
+			distance += distances.sum()
+		
+		return distance
+
+	def _summarize_bounded(self, X, sample_weight=None):
+		"""Extract the sufficient statistics while skipping distances.
+
+		This method is meant to only be called internally by `fit` when
+		`algorithm` is 'elkan' or 'hamerly'. The first call calculates every
+		distance and stores the assignments and lower bounds in `_bounds`.
+		Later calls lower these bounds by how far each centroid has moved,
+		calculate the exact distance between each example and its assigned
+		centroid, and only calculate the other distances where the bounds, or
+		half the distance between the assigned centroid and another, are
+		smaller than it. The statistics and returned value are the same as
+		those of `summarize`.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A set of examples to summarize.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		distance: torch.Tensor
+			The summed distance between each example and its nearest
+			centroid.
+		"""
+
+		if self.frozen:
+			return 0
+
+		if not self._initialized:
+			self._initialize(X, sample_weight=sample_weight)
+
+		X = _check_parameter(_cast_as_tensor(X, dtype=torch.float32), "X", 
+			ndim=2, shape=(-1, self.d))
+		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
+			dtype=torch.float32), device=self.device)
 
 		if isinstance(X, torch.masked.MaskedTensor):
-			for i in range(self.k):
-				idx = y_hat == i
+			raise ValueError("algorithm '{}' cannot be used with missing " 
+				"values.".format(self.algorithm))
 
-				self._w_sum[i][:] = self._w_sum[i] + sample_weight[idx].sum(dim=0)
-				self._xw_sum[i][:] = self._xw_sum[i] + (X[idx] * 
-					sample_weight[idx]).sum(dim=0)
+		if self._bounds is None:
+			lower, moved = None, torch.zeros(self.k, device=self.device)
+
+			if self.algorithm == 'elkan':
+				lower = torch.cat([self._distances(X[idxs]) for idxs in 
+					self._blocks(X)])
+				upper, y_hat = torch.topk(lower, 2, dim=1, largest=False)
+			else:
+				y_hat, upper = map(torch.cat, zip(*[self._nearest(X[idxs], 2) 
+					for idxs in self._blocks(X)]))
+
+			upper, second, y_hat = upper[:, 0], upper[:, 1], y_hat[:, 0]
 
 		else:
-			y_hat = y_hat.unsqueeze(1).expand(-1, self.d)
-			self._w_sum.scatter_add_(0, y_hat, sample_weight)
-			self._xw_sum.scatter_add_(0, y_hat, X * sample_weight)
-		
-		return distances.min(dim=1).values.sum()
+			y_hat, second, lower, moved, centroids = self._bounds
+			shift = torch.sqrt(torch.sum((self.centroids - centroids) ** 2, 
+				dim=1) / self.d)
+
+			upper = torch.cat([torch.linalg.vector_norm(X[idxs] - 
+				self.centroids[y_hat[idxs]], dim=1) for idxs in self._blocks(X)])
+			upper /= self.d ** 0.5
+
+			# The distance to every other centroid can only have decreased by
+			# as much as the furthest that any other centroid has moved.
+			values, idxs = torch.topk(shift, 2)
+			second = second - torch.where(y_hat == idxs[0], values[1], 
+				values[0])
+
+			centroid_distances = torch.cdist(self.centroids, 
+				self.centroids) / self.d ** 0.5
+			centroid_distances.fill_diagonal_(float("inf"))
+			half = centroid_distances.min(dim=1).values / 2
+
+			rows = torch.where(upper > torch.maximum(half[y_hat], second))[0]
+
+			if self.algorithm == 'elkan':
+				# Lower bounds are stored plus how far their centroid had moved
+				# when they were set, so that they do not all need to be
+				# lowered every iteration.
+				moved = moved + shift
+				rows_ = rows
+
+				bounds = torch.maximum(lower[rows].sub_(moved), 
+					centroid_distances.div_(2)[y_hat[rows]])
+				mask = bounds.lt_(upper[rows].unsqueeze(1)).type(torch.bool)
+
+				needed = mask.any(dim=1)
+				rows, mask = rows[needed], mask[needed]
+				n_pairs = int(torch.count_nonzero(mask))
+
+				# Calculating the distance of each pair separately is much
+				# slower per distance than a matrix multiplication, so whole
+				# rows are calculated once enough of their pairs are needed.
+				if n_pairs * 32 >= len(rows) * self.k:
+					distances = torch.cat([self._distances(X[rows[idxs]]) for 
+						idxs in self._blocks(rows)])
+
+					lower[rows] = distances + moved
+					upper[rows], y_hat[rows] = torch.min(distances, dim=1)
+
+				elif n_pairs > 0:
+					i, j = torch.nonzero(mask, as_tuple=True)
+					i = rows[i]
+
+					batch_size = len(i)
+					if self.memory_budget is not None:
+						batch_size = max(1, int(self.memory_budget // self.d))
+
+					distances = torch.cat([torch.linalg.vector_norm(
+						X[i[b:b+batch_size]] - self.centroids[j[b:b+batch_size]],
+						dim=1) for b in range(0, len(i), batch_size)])
+					distances /= self.d ** 0.5
+					lower[i, j] = distances + moved[j]
+
+					best = torch.clone(upper).scatter_reduce_(0, i, distances, 
+						reduce='amin')
+					closer = (distances == best[i]) & (distances < upper[i])
+
+					y_hat_ = torch.full_like(y_hat, self.k).scatter_reduce_(0, 
+						i[closer], j[closer], reduce='amin')
+					y_hat = torch.where(y_hat_ < self.k, y_hat_, y_hat)
+					upper = best
+
+				bounds = lower[rows_] - moved
+				bounds.scatter_(1, y_hat[rows_].unsqueeze(1), float("inf"))
+				second[rows_] = bounds.min(dim=1).values
+
+			elif len(rows) > 0:
+				y_hat_, values = map(torch.cat, zip(*[self._nearest(
+					X[rows[idxs]], 2) for idxs in self._blocks(rows)]))
+
+				upper[rows], second[rows] = values[:, 0], values[:, 1]
+				y_hat[rows] = y_hat_[:, 0]
+
+		self._bounds = y_hat, second, lower, moved, torch.clone(self.centroids)
+
+		y_hat = y_hat.unsqueeze(1).expand(-1, self.d)
+		self._w_sum.scatter_add_(0, y_hat, sample_weight)
+		self._xw_sum.scatter_add_(0, y_hat, X * sample_weight)
+		return upper.sum()
 
 	def from_summaries(self):
 		"""Update the model parameters given the extracted statistics.
@@ -291,6 +711,185 @@ class KMeans(torch.nn.Module):
 		_update_parameter(self.centroids, centroids, self.inertia)
 		self._reset_cache()
 
+	def _summarize_restarts(self, X, sample_weight, n, centroids):
+		"""Extract the sufficient statistics for a set of restarts at once.
+
+		This method is meant to only be called internally. The centroids of
+		every restart are flattened into one (-1, d) matrix so that the
+		distances between a block of examples and every centroid are a single
+		matrix multiplication, and the statistics of every restart are
+		accumulated with one scatter per block. When each example has a single
+		weight, the total weights are counted with `bincount` instead.
+
+
+		Parameters
+		----------
+		X: torch.Tensor, shape=(-1, self.d)
+			A set of examples with missing values set to zero.
+
+		sample_weight: torch.Tensor, shape=(-1, self.d)
+			The weight of each feature in each example, zero where missing.
+
+		n: int or torch.Tensor, shape=(-1,)
+			The number of observed features in each example.
+
+		centroids: torch.Tensor, shape=(-1, self.k, self.d)
+			The centroids of each restart.
+
+
+		Returns
+		-------
+		distance: torch.Tensor, shape=(-1,)
+			The total distance between the examples and their nearest centroid
+			in each restart.
+
+		w_sum: torch.Tensor, shape=(-1, self.k, self.d)
+			The total weight of the examples assigned to each centroid.
+
+		xw_sum: torch.Tensor, shape=(-1, self.k, self.d)
+			The total weighted value of the examples assigned to each centroid.
+		"""
+
+		r, k, d = centroids.shape
+		centroid_sum = torch.sum(centroids ** 2, dim=-1).reshape(1, -1)
+		offsets = torch.arange(r, device=X.device) * k
+		shared_weight = sample_weight.stride(1) == 0
+
+		distance = torch.zeros(r, device=X.device)
+		w_sum = torch.zeros(r, k, d, device=X.device)
+		xw_sum = torch.zeros(r, k, d, device=X.device)
+
+		batch_size = max(X.shape[0], 1)
+		if self.memory_budget is not None:
+			batch_size = max(1, int(self.memory_budget // (r*k)))
+
+		for start in range(0, X.shape[0], batch_size):
+			X_ = X[start:start+batch_size]
+			w_ = sample_weight[start:start+batch_size]
+
+			distances = torch.addmm(centroid_sum, X_, centroids.reshape(-1, 
+				d).T, alpha=-2).reshape(-1, r, k)
+			distances, y_hat = torch.min(distances, dim=-1)
+			distances += torch.sum(X_ ** 2, dim=1).unsqueeze(1)
+
+			n_ = n[start:start+batch_size].unsqueeze(1) if isinstance(n, 
+				torch.Tensor) else n
+			distance += torch.sqrt(torch.clamp(distances, min=0) / n_).sum(
+				dim=0)
+
+			y_hat = y_hat.T
+			if shared_weight:
+				w_sum += torch.bincount((y_hat + offsets.unsqueeze(1)).reshape(
+					-1), weights=w_[:, 0].repeat(r), minlength=r*k).reshape(r, 
+					k, 1)
+			else:
+				w_sum.scatter_add_(1, y_hat.unsqueeze(-1).expand(-1, -1, d),
+					w_.unsqueeze(0).expand(r, -1, -1))
+
+			xw_sum.scatter_add_(1, y_hat.unsqueeze(-1).expand(-1, -1, d),
+				(X_ * w_).unsqueeze(0).expand(r, -1, -1))
+
+		return distance, w_sum, xw_sum
+
+	def _fit_restarts(self, X, sample_weight=None):
+		"""Fit `n_init` restarts at the same time and keep the best one.
+
+		This method is meant to only be called internally. Each restart is
+		initialized separately and then all restarts are updated together
+		using `_summarize_restarts`. A restart stops being updated when its
+		improvement falls under `tol`, as in `fit`, and the restart with the
+		smallest total distance after fitting is kept.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A set of examples to evaluate.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		self
+		"""
+
+		X = _check_parameter(_cast_as_tensor(X, dtype=torch.float32), "X", 
+			ndim=2)
+		sample_weight = _reshape_weights(X, _cast_as_tensor(sample_weight, 
+			dtype=torch.float32), device=self.device)
+
+		random_state = self.random_state
+		if not isinstance(random_state, numpy.random.mtrand.RandomState):
+			random_state = numpy.random.RandomState(random_state)
+
+		centroids = []
+		for i in range(self.n_init):
+			centroids_ = _initialize_centroids(X, self.k, algorithm=self.init, 
+				random_state=random_state, memory_budget=self.memory_budget,
+				sample_weight=sample_weight)
+
+			if isinstance(centroids_, torch.masked.MaskedTensor):
+				centroids_ = centroids_._masked_data * centroids_._masked_mask
+
+			centroids.append(centroids_.to(self.device))
+
+		centroids = torch.stack(centroids)
+
+		if isinstance(X, torch.masked.MaskedTensor):
+			n = X._masked_mask.sum(dim=1)
+			sample_weight = sample_weight._masked_data * X._masked_mask
+			X = X._masked_data * X._masked_mask
+		else:
+			n = X.shape[1]
+
+		active = torch.arange(self.n_init, device=self.device)
+		d_current = None
+		for i in range(self.max_iter):
+			start_time = time.time()
+
+			d_previous = d_current
+			d_current, w_sum, xw_sum = self._summarize_restarts(X, 
+				sample_weight, n, centroids[active])
+
+			converged = torch.zeros(len(active), dtype=torch.bool, 
+				device=self.device)
+
+			if i > 0:
+				improvement = d_previous - d_current
+				duration = time.time() - start_time
+
+				if self.verbose:
+					print("[{}] Improvement: {}, Time: {:4.4}s".format(i, 
+						improvement, duration))
+
+				converged = improvement < self.tol
+
+			centroids_ = centroids[active]
+			_update_parameter(centroids_, xw_sum / w_sum, self.inertia)
+
+			active, d_current = active[~converged], d_current[~converged]
+			centroids[active] = centroids_[~converged]
+
+			if len(active) == 0:
+				break
+
+		distance = self._summarize_restarts(X, sample_weight, n, centroids)[0]
+		best = torch.argmin(distance)
+
+		self.centroids = _cast_as_parameter(centroids[best])
+		self.d = X.shape[1]
+		self._initialized = True
+		self._bounds = None
+		self._reset_cache()
+
+		if self.nprobe is not None:
+			self._build_index()
+
+		return self
+
 	def fit(self, X, sample_weight=None):
 		"""Fit the model to optionally weighted examples.
 
@@ -307,11 +906,16 @@ class KMeans(torch.nn.Module):
 		Parameters
 		----------
 		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
-			A set of examples to evaluate. 
+			A set of examples to evaluate. Alternatively, an iterable that
+			yields batches of examples, such as a DataLoader, where each batch
+			is either a tensor or a tuple of (X, sample_weight). In this case
+			the sufficient statistics are accumulated across all batches in
+			each iteration.
 
 		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
 			A set of weights for the examples. This can be either of shape
-			(-1, self.d) or a vector of shape (-1,). Default is ones.
+			(-1, self.d) or a vector of shape (-1,). Must be None if X is a
+			collection of batches. Default is ones.
 
 
 		Returns
@@ -319,12 +923,28 @@ class KMeans(torch.nn.Module):
 		self
 		"""
 
+		if self.n_init > 1 and not self._initialized and not self.frozen:
+			if _check_batches(X):
+				raise ValueError("n_init cannot be used with batches.")
+
+			return self._fit_restarts(X, sample_weight=sample_weight)
+
+		if self.algorithm != 'lloyd' and _check_batches(X):
+			raise ValueError("algorithm '{}' cannot be used with batches."
+				.format(self.algorithm))
+
+		self._bounds = None
 		d_current = None
 		for i in range(self.max_iter):
 			start_time = time.time()
 
 			d_previous = d_current
-			d_current = self.summarize(X, sample_weight=sample_weight)
+			if self.algorithm == 'lloyd':
+				d_current = _summarize_batches(self, X, 
+					sample_weight=sample_weight)
+			else:
+				d_current = self._summarize_bounded(X, 
+					sample_weight=sample_weight)
 
 			if i > 0:
 				improvement = d_previous - d_current
@@ -339,7 +959,41 @@ class KMeans(torch.nn.Module):
 
 			self.from_summaries()
 
+		self._bounds = None
 		self._reset_cache()
+
+		if self.nprobe is not None:
+			self._build_index()
+
+		return self
+
+	def partial_fit(self, X, sample_weight=None):
+		"""Update the model using a single batch of data with online EM.
+
+		This method performs one step of online, or stochastic, EM. The
+		sufficient statistics of the batch are blended into a running average
+		of the sufficient statistics seen so far using a step size that decays
+		as (t + step_offset) ** -step_decay, and the parameters are then
+		updated from that running average. Calling this method on a stream of
+		batches keeps the model current without refitting on all of the data.
+
+
+		Parameters
+		----------
+		X: list, tuple, numpy.ndarray, torch.Tensor, shape=(-1, self.d)
+			A batch of examples.
+
+		sample_weight: list, tuple, numpy.ndarray, torch.Tensor, optional
+			A set of weights for the examples. This can be either of shape
+			(-1, self.d) or a vector of shape (-1,). Default is ones.
+
+
+		Returns
+		-------
+		self
+		"""
+
+		_partial_fit(self, X, sample_weight=sample_weight)
 		return self
 
 	def fit_predict(self, X, sample_weight=None):